@@ -0,0 +1,187 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+from flask import g, has_app_context
+from sqlalchemy.event import listens_for
+from sqlalchemy.sql import column, table
+
+from indico.core.cache import make_scoped_cache
+from indico.core.db import db
+from indico.modules.events.abstracts.models.abstracts import Abstract
+from indico.modules.events.abstracts.models.persons import AbstractPersonLink
+from indico.modules.events.contributions.models.contributions import Contribution
+from indico.modules.events.contributions.models.persons import AuthorType, ContributionPersonLink
+from indico.modules.users.models.affiliations import Affiliation
+from indico.util.countries import get_country
+
+from indico_jacow.models.affiliations import AbstractAffiliation, ContributionAffiliation
+
+
+#: The sources the affiliation report can be built from
+REPORT_SOURCES = ('contributions', 'abstracts')
+#: How long a report is cached; changes to the affiliations of an event
+#: invalidate it right away, but e.g. renaming an affiliation does not
+REPORT_CACHE_TTL = 3600
+
+affiliation_report_cache = make_scoped_cache('jacow-affiliation-report')
+
+#: The materialized view for affiliation lookups (see `CREATE_AFFILIATION_SEARCH_VIEW_SQL`)
+_contribution_affiliation_search = table('contribution_affiliation_search',
+                                         column('event_id'),
+                                         column('contribution_id'),
+                                         column('person_link_id'),
+                                         column('affiliation_id'),
+                                         column('country_code'),
+                                         schema='plugin_jacow')
+
+
+def _get_author_affiliations_query(event, source):
+    if source == 'abstracts':
+        association_cls, person_link_cls, item_cls = AbstractAffiliation, AbstractPersonLink, Abstract
+        item_id = AbstractPersonLink.abstract_id
+    else:
+        association_cls, person_link_cls, item_cls = ContributionAffiliation, ContributionPersonLink, Contribution
+        item_id = ContributionPersonLink.contribution_id
+    query = (db.session.query()
+             .select_from(association_cls)
+             .join(person_link_cls, person_link_cls.id == association_cls.person_link_id)
+             .join(item_cls, item_cls.id == item_id)
+             .join(Affiliation, Affiliation.id == association_cls.affiliation_id)
+             .filter(item_cls.event_id == event.id,
+                     ~item_cls.is_deleted,
+                     person_link_cls.author_type != AuthorType.none))
+    return query, db.func.count(person_link_cls.person_id.distinct())
+
+
+def compute_affiliation_report(event, source):
+    """Compute the number of authors per country, affiliation and track.
+
+    Authors are counted once per group, even if they are listed in
+    several abstracts/contributions or with several affiliations.
+
+    :param event: The event to build the report for
+    :param source: Whether to use the author lists of the ``'abstracts'``
+                   or of the ``'contributions'``
+    """
+    query, authors = _get_author_affiliations_query(event, source)
+    total_authors = query.with_entities(authors).scalar()
+    countries = [{'country_code': country_code, 'country_name': get_country(country_code) or country_code,
+                  'authors': count}
+                 for country_code, count in (query
+                                             .with_entities(Affiliation.country_code, authors)
+                                             .group_by(Affiliation.country_code))]
+    affiliations = [{'id': id_, 'name': name, 'country_code': country_code, 'authors': count}
+                    for id_, name, country_code, count in (query
+                                                           .with_entities(Affiliation.id, Affiliation.name,
+                                                                          Affiliation.country_code, authors)
+                                                           .group_by(Affiliation.id))]
+    if source == 'abstracts':
+        reviewed = Abstract.reviewed_for_tracks.prop.secondary
+        track_id = reviewed.c.track_id
+        query = query.join(reviewed, reviewed.c.abstract_id == Abstract.id)
+    else:
+        track_id = Contribution.track_id
+    track_titles = {track.id: track.full_title for track in event.tracks}
+    tracks = [{'id': id_, 'title': track_titles.get(id_), 'authors': count, 'countries': num_countries,
+               'affiliations': num_affiliations}
+              for id_, count, num_countries, num_affiliations in (
+                  query
+                  .with_entities(track_id, authors, db.func.count(Affiliation.country_code.distinct()),
+                                 db.func.count(Affiliation.id.distinct()))
+                  .group_by(track_id))]
+    return {
+        'total_authors': total_authors,
+        'countries': sorted(countries, key=lambda x: (-x['authors'], x['country_name'])),
+        'affiliations': sorted(affiliations, key=lambda x: (-x['authors'], x['name'].lower())),
+        'tracks': sorted(tracks, key=lambda x: (x['title'] is None, x['title'] or '')),
+    }
+
+
+def get_contribution_ids_by_affiliation(event, affiliation_ids=(), country_codes=()):
+    """Get the contributions with an author from one of the affiliations or countries.
+
+    Like in the affiliation report, only actual authors are taken into
+    account.  If enabled in the plugin settings, the materialized
+    affiliation search view is used instead of joining the affiliation
+    tables.
+
+    :return: A set of contribution ids
+    """
+    from indico_jacow.plugin import JACOWPlugin
+    if not affiliation_ids and not country_codes:
+        return set()
+    if JACOWPlugin.settings.get('affiliation_search_view'):
+        view = _contribution_affiliation_search
+        query = (db.session.query(view.c.contribution_id)
+                 .filter(view.c.event_id == event.id,
+                         view.c.affiliation_id.in_(affiliation_ids) | view.c.country_code.in_(country_codes)))
+    else:
+        query = (db.session.query(ContributionPersonLink.contribution_id)
+                 .join(ContributionAffiliation, ContributionAffiliation.person_link_id == ContributionPersonLink.id)
+                 .join(Contribution, Contribution.id == ContributionPersonLink.contribution_id)
+                 .join(Affiliation, Affiliation.id == ContributionAffiliation.affiliation_id)
+                 .filter(Contribution.event_id == event.id,
+                         ~Contribution.is_deleted,
+                         ContributionPersonLink.author_type != AuthorType.none,
+                         ContributionAffiliation.affiliation_id.in_(affiliation_ids) |
+                         Affiliation.country_code.in_(country_codes)))
+    return {id_ for id_, in query.distinct()}
+
+
+def refresh_affiliation_search_view():
+    """Refresh the materialized affiliation search view."""
+    db.session.execute(db.text('REFRESH MATERIALIZED VIEW CONCURRENTLY plugin_jacow.contribution_affiliation_search'))
+    db.session.commit()
+
+
+def get_affiliation_report(event, source):
+    """Get the (cached) affiliation report of an event.
+
+    See :func:`compute_affiliation_report` for details.
+    """
+    report = affiliation_report_cache.get(f'{event.id}-{source}')
+    if report is None:
+        report = refresh_affiliation_report(event, source)
+    return report
+
+
+def refresh_affiliation_report(event, source):
+    """Compute the affiliation report of an event and cache it."""
+    report = compute_affiliation_report(event, source)
+    affiliation_report_cache.set(f'{event.id}-{source}', report, timeout=REPORT_CACHE_TTL)
+    return report
+
+
+def invalidate_affiliation_report(event_id):
+    """Invalidate the cached affiliation reports of an event once the transaction is committed."""
+    if has_app_context():
+        g.setdefault('jacow_stale_affiliation_reports', set()).add(event_id)
+    else:
+        affiliation_report_cache.delete_many(*(f'{event_id}-{source}' for source in REPORT_SOURCES))
+
+
+def flush_stale_affiliation_reports():
+    """Delete the cached affiliation reports invalidated in this transaction."""
+    if not has_app_context():
+        return
+    event_ids = g.pop('jacow_stale_affiliation_reports', None)
+    if event_ids:
+        affiliation_report_cache.delete_many(*(f'{event_id}-{source}'
+                                               for event_id in event_ids
+                                               for source in REPORT_SOURCES))
+
+
+@listens_for(AbstractAffiliation, 'after_insert')
+@listens_for(AbstractAffiliation, 'after_update')
+@listens_for(AbstractAffiliation, 'after_delete')
+@listens_for(ContributionAffiliation, 'after_insert')
+@listens_for(ContributionAffiliation, 'after_update')
+@listens_for(ContributionAffiliation, 'after_delete')
+def _affiliation_changed(mapper, connection, target):
+    # the person link and its person are always eager-loaded, so this does not emit any queries
+    if target.person_link is not None:
+        invalidate_affiliation_report(target.person_link.person.event_id)
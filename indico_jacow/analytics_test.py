@@ -0,0 +1,77 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+from collections import defaultdict
+
+import pytest
+from flask import g
+
+from indico.modules.events.contributions.models.persons import AuthorType
+
+from indico_jacow.analytics import compute_affiliation_report, get_contribution_ids_by_affiliation
+from indico_jacow.models.affiliations import ContributionAffiliation
+
+
+@pytest.mark.parametrize('source', ('abstracts', 'contributions'))
+def test_compute_affiliation_report(db, create_synthetic_event, source):
+    data = create_synthetic_event(abstracts=8, tracks=2, track_groups=0, authors=3, affiliations=4,
+                                  contributions=True)
+    items = data.abstracts if source == 'abstracts' else data.contributions
+    items[0].is_deleted = True
+    db.session.flush()
+    countries = defaultdict(set)
+    affiliations = defaultdict(set)
+    tracks = defaultdict(set)
+    for item in items[1:]:
+        track = next(iter(item.reviewed_for_tracks)) if source == 'abstracts' else item.track
+        for person_link in item.person_links:
+            if person_link.author_type == AuthorType.none:
+                continue
+            for ja in person_link.jacow_affiliations:
+                countries[ja.affiliation.country_code].add(person_link.person)
+                affiliations[ja.affiliation.id].add(person_link.person)
+                tracks[track.id].add(person_link.person)
+
+    report = compute_affiliation_report(data.event, source)
+    assert report['total_authors'] == len(set().union(*countries.values()))
+    assert {c['country_code']: c['authors'] for c in report['countries']} == {k: len(v) for k, v in countries.items()}
+    assert {a['id']: a['authors'] for a in report['affiliations']} == {k: len(v) for k, v in affiliations.items()}
+    assert {t['id']: t['authors'] for t in report['tracks']} == {k: len(v) for k, v in tracks.items()}
+
+
+def test_affiliation_changes_invalidate_report(db, app, create_synthetic_event):
+    data = create_synthetic_event(abstracts=2, contributions=True)
+    person_link = data.contributions[0].person_links[0]
+    with app.test_request_context():
+        person_link.jacow_affiliations.append(ContributionAffiliation(affiliation=data.affiliations[-1],
+                                                                      display_order=10))
+        db.session.flush()
+        assert g.jacow_stale_affiliation_reports == {data.event.id}
+
+
+@pytest.mark.parametrize('use_view', (False, True))
+def test_get_contribution_ids_by_affiliation(db, create_synthetic_event, use_view):
+    from indico_jacow.plugin import JACOWPlugin
+    data = create_synthetic_event(abstracts=6, authors=2, affiliations=4, contributions=True)
+    data.contributions[0].is_deleted = True
+    # speakers who are not authors are ignored, like in the affiliation report
+    data.contributions[1].person_links[0].author_type = AuthorType.none
+    db.session.flush()
+    if use_view:
+        JACOWPlugin.settings.set('affiliation_search_view', True)
+        db.session.execute(db.text('REFRESH MATERIALIZED VIEW plugin_jacow.contribution_affiliation_search'))
+    affiliation = data.affiliations[0]
+    country_code = data.affiliations[1].country_code
+    expected = {contrib.id
+                for contrib in data.contributions[1:]
+                for person_link in contrib.person_links
+                if person_link.author_type != AuthorType.none
+                for ja in person_link.jacow_affiliations
+                if ja.affiliation == affiliation or ja.affiliation.country_code == country_code}
+
+    assert get_contribution_ids_by_affiliation(data.event) == set()
+    assert get_contribution_ids_by_affiliation(data.event, [affiliation.id], [country_code]) == expected
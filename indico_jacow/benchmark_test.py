@@ -0,0 +1,203 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+from types import SimpleNamespace
+
+import pytest
+from flask import g, session
+from werkzeug.datastructures import MultiDict
+
+from indico.core.plugins import plugin_engine
+from indico.modules.events.abstracts.forms import AbstractForm
+from indico.modules.events.abstracts.lists import AbstractListGeneratorManagement
+from indico.modules.events.contributions.models.contributions import Contribution
+from indico.modules.events.contributions.models.persons import ContributionPersonLink
+from indico.modules.events.persons.schemas import PersonLinkSchema
+from indico.modules.users import User
+
+
+SIZES = {
+    'small': {'abstracts': 10, 'reviewers': 3, 'tracks': 4, 'track_groups': 2, 'questions': 2, 'affiliations': 5},
+    'large': {'abstracts': 100, 'reviewers': 15, 'tracks': 12, 'track_groups': 4, 'questions': 4, 'affiliations': 30},
+}
+
+pytestmark = pytest.mark.parametrize('size', SIZES)
+
+
+@pytest.fixture
+def jacow_plugin(app):
+    return plugin_engine.get_plugin('jacow')
+
+
+def test_abstracts_stats(app, mocker, jacow_plugin, jacow_benchmark, create_synthetic_event, size):
+    from indico_jacow.controllers import RHAbstractsStats
+    data = create_synthetic_event(**SIZES[size])
+    render = mocker.patch('indico_jacow.controllers.WPAbstractsStats.render_template')
+    rh = RHAbstractsStats()
+    rh.event = data.event
+    with app.test_request_context(), jacow_plugin.plugin_context():
+        jacow_benchmark(rh._process)
+    assert len(render.call_args.kwargs['questions']) == len([q for q in data.questions if q.field_type == 'bool'])
+
+
+@pytest.mark.parametrize('table', ('reviews', 'question'))
+def test_abstracts_stats_data(app, jacow_benchmark, create_synthetic_event, size, table):
+    from indico_jacow.controllers import RHAbstractsStatsData
+    data = create_synthetic_event(**SIZES[size])
+    rh = RHAbstractsStatsData()
+    rh.event = data.event
+    rh.question = next(q for q in data.questions if q.field_type == 'bool') if table == 'question' else None
+    with app.test_request_context():
+        resp = jacow_benchmark(rh._process)
+    assert len(resp.json['rows']) == len(data.reviewers)
+
+
+def test_abstracts_stats_export(app, jacow_benchmark, create_synthetic_event, size):
+    from indico_jacow.controllers import RHAbstractsStatsExportBase
+    from indico_jacow.util import generate_statistics_spreadsheet
+    data = create_synthetic_event(**SIZES[size])
+    rh = RHAbstractsStatsExportBase()
+    rh.event = data.event
+    with app.test_request_context():
+        __, rows = jacow_benchmark(lambda: generate_statistics_spreadsheet(rh._compute_statistics()))
+    assert sum(row['Count'] for row in rows if row['Metric'] == 'Abstracts submitted for') == len(data.abstracts)
+
+
+def test_affiliation_report(jacow_benchmark, create_synthetic_event, size):
+    from indico_jacow.analytics import compute_affiliation_report
+    data = create_synthetic_event(contributions=True, **SIZES[size])
+    report = jacow_benchmark(compute_affiliation_report, data.event, 'contributions')
+    assert sum(t['authors'] for t in report['tracks']) >= report['total_authors']
+
+
+def test_contribution_affiliation_lookup(jacow_benchmark, create_synthetic_event, size):
+    from indico_jacow.analytics import get_contribution_ids_by_affiliation
+    data = create_synthetic_event(contributions=True, **SIZES[size])
+    affiliation_ids = [a.id for a in data.affiliations[:2]]
+    contribution_ids = jacow_benchmark(get_contribution_ids_by_affiliation, data.event, affiliation_ids)
+    assert contribution_ids <= {c.id for c in data.contributions}
+
+
+def test_display_abstracts_statistics(app, mocker, jacow_benchmark, create_synthetic_event, size):
+    from indico_jacow.controllers import RHDisplayAbstractsStatistics
+    data = create_synthetic_event(**SIZES[size])
+    render = mocker.patch('indico_jacow.controllers.WPDisplayAbstractsStatistics.render_template')
+    rh = RHDisplayAbstractsStatistics()
+    rh.event = data.event
+    with app.test_request_context():
+        session.set_session_user(data.reviewers[0])
+        jacow_benchmark(rh._process)
+    assert len(render.call_args.kwargs['question_counts']) == len([q for q in data.questions
+                                                                   if q.field_type == 'bool'])
+
+
+def test_abstracts_export(app, jacow_benchmark, create_synthetic_event, size):
+    from indico_jacow.controllers import RHAbstractsExportBase
+    data = create_synthetic_event(**SIZES[size])
+    rh = RHAbstractsExportBase()
+    rh.event = data.event
+    rh.abstracts = data.abstracts
+    with app.test_request_context():
+        rh.list_generator = AbstractListGeneratorManagement(event=data.event)
+        __, rows = jacow_benchmark(rh._generate_spreadsheet)
+    assert len(rows) == len(data.abstracts)
+
+
+def test_contributions_export(app, jacow_benchmark, create_synthetic_event, size):
+    from indico_jacow.controllers import RHContributionsExportBase
+    data = create_synthetic_event(contributions=True, **SIZES[size])
+    rh = RHContributionsExportBase()
+    rh.event = data.event
+    rh.contribs = data.contributions
+    with app.test_request_context():
+        __, rows = jacow_benchmark(rh._generate_spreadsheet)
+    assert len(rows) == len(data.contributions)
+
+
+def test_submission_form_validated(app, mocker, jacow_plugin, jacow_benchmark, create_synthetic_event, size):
+    data = create_synthetic_event(**SIZES[size])
+    jacow_plugin.event_settings.set(data.event, 'multiple_affiliations', True)
+    abstract = data.abstracts[0]
+    form = mocker.Mock(spec=AbstractForm)
+    form.event = data.event
+    form.person_links = mocker.Mock(data=abstract.person_links, errors=[])
+    affiliation_ids = [a.id for a in reversed(data.affiliations)]
+
+    def _validate():
+        g.jacow_affiliations_ids = {pl.person.email: affiliation_ids for pl in abstract.person_links}
+        return jacow_plugin._submission_form_validated(form)
+
+    with app.test_request_context():
+        assert jacow_benchmark(_validate) is None
+    assert not form.person_links.errors
+    assert all([ja.affiliation_id for ja in pl.jacow_affiliations] == affiliation_ids
+               for pl in abstract.person_links)
+
+
+def test_clone_contribution_affiliations(db, app, jacow_plugin, jacow_benchmark, create_synthetic_event, size):
+    data = create_synthetic_event(contributions=True, **SIZES[size])
+    person_link_map = {}
+    for contrib in data.contributions:
+        clone = Contribution(friendly_id=len(data.contributions) + contrib.friendly_id, title=contrib.title,
+                             event=data.event, duration=contrib.duration)
+        for old_pl in contrib.person_links:
+            new_pl = ContributionPersonLink(person=old_pl.person, author_type=old_pl.author_type,
+                                            is_speaker=old_pl.is_speaker)
+            clone.person_links.append(new_pl)
+            person_link_map[old_pl] = new_pl
+    db.session.flush()
+    db.session.expire_all()
+    with app.test_request_context():
+        jacow_benchmark(jacow_plugin._clone_contribution_affiliations, person_link_map, rounds=1)
+    db.session.flush()
+    assert all([ja.affiliation for ja in new_pl.jacow_affiliations] ==
+               [ja.affiliation for ja in old_pl.jacow_affiliations]
+               for old_pl, new_pl in person_link_map.items())
+
+
+def test_person_link_schema_hooks(app, jacow_plugin, jacow_benchmark, create_synthetic_event, size):
+    data = create_synthetic_event(contributions=True, **SIZES[size])
+    person_links = [pl for contrib in data.contributions for pl in contrib.person_links]
+    affiliation_ids = [a.id for a in data.affiliations]
+
+    def _run_hooks():
+        for pl in person_links:
+            jacow_plugin._person_link_schema_pre_load(PersonLinkSchema, {
+                'email': pl.person.email.upper(),
+                'affiliation_id': affiliation_ids[0],
+                'jacow_affiliations_ids': affiliation_ids,
+            })
+        dumped = [{'affiliation_id': None, 'affiliation_meta': None} for __ in person_links]
+        jacow_plugin._person_link_schema_post_dump(PersonLinkSchema, dumped, person_links)
+        return dumped
+
+    with app.test_request_context():
+        dumped = jacow_benchmark(_run_hooks)
+        assert len(g.jacow_affiliations_ids) == len({pl.person.email for pl in person_links})
+    assert all(d['jacow_affiliations_ids'] for d in dumped)
+
+
+def test_sync_profiles(db, mocker, jacow_plugin, jacow_benchmark, create_user, create_identity, size):
+    from indico_jacow.task import run_profile_sync
+    num_users = SIZES[size]['abstracts']
+    users = [create_user(20000 + i, email=f'user{i}@example.com') for i in range(num_users)]
+    for user in users[::2]:
+        create_identity(user, 'fake-sync', user.email)
+
+    def _search_identities(providers, exact, email):
+        return [SimpleNamespace(provider=SimpleNamespace(name='fake-sync'), identifier=email, data=MultiDict(),
+                                multipass_data={})]
+
+    multipass = mocker.patch('indico_jacow.task.multipass')
+    multipass.sync_provider.name = 'fake-sync'
+    multipass.search_identities.side_effect = _search_identities
+    synchronize_data = mocker.patch.object(User, 'synchronize_data')
+    jacow_plugin.settings.set('sync_enabled', True)
+
+    jacow_benchmark(run_profile_sync, rounds=1)
+    assert synchronize_data.call_count == len(users[::2])
+    assert all(any(identity.provider == 'fake-sync' for identity in user.identities) for user in users)
@@ -8,16 +8,48 @@
 from indico.core.plugins import IndicoPluginBlueprint
 
 from indico_jacow.controllers import (RHAbstractsExportCSV, RHAbstractsExportExcel, RHAbstractsStats,
+                                      RHAbstractsStatsData, RHAbstractsStatsExportCSV, RHAbstractsStatsExportExcel,
+                                      RHAbstractsStatsExportJSON, RHAbstractsStatsPrewarm, RHAffiliationReport,
+                                      RHAffiliationReportExportCSV, RHAffiliationReportExportExcel,
+                                      RHContributionAffiliationFilterOptions, RHContributionsByAffiliation,
                                       RHContributionsExportCSV, RHContributionsExportExcel, RHCountries,
-                                      RHCreateAffiliation, RHDisplayAbstractsStatistics, RHPeerReviewCSVImport)
+                                      RHCreateAffiliation, RHDisplayAbstractsStatistics, RHEventAffiliations, RHMetrics,
+                                      RHPeerReviewCSVImport, RHPeerReviewCSVImportProgress)
+from indico_jacow.instrumentation import finish_request_instrumentation, start_request_instrumentation
 
 
 blueprint = IndicoPluginBlueprint('jacow', __name__, url_prefix='/event/<int:event_id>')
+blueprint.before_request(start_request_instrumentation)
+blueprint.teardown_request(finish_request_instrumentation)
 
 
 # Statistics
 blueprint.add_url_rule('/abstracts/reviewing/statistics', 'reviewer_stats', RHDisplayAbstractsStatistics)
 blueprint.add_url_rule('/manage/abstracts/statistics', 'abstracts_stats', RHAbstractsStats)
+blueprint.add_url_rule('/manage/abstracts/statistics/reviews.json', 'abstracts_stats_reviews', RHAbstractsStatsData,
+                       defaults={'question_id': None})
+blueprint.add_url_rule('/manage/abstracts/statistics/questions/<int:question_id>.json', 'abstracts_stats_question',
+                       RHAbstractsStatsData)
+blueprint.add_url_rule('/manage/abstracts/statistics/export.csv', 'abstracts_stats_export_csv',
+                       RHAbstractsStatsExportCSV)
+blueprint.add_url_rule('/manage/abstracts/statistics/export.xlsx', 'abstracts_stats_export_xlsx',
+                       RHAbstractsStatsExportExcel)
+blueprint.add_url_rule('/manage/abstracts/statistics/export.json', 'abstracts_stats_export_json',
+                       RHAbstractsStatsExportJSON)
+blueprint.add_url_rule('/manage/abstracts/statistics/prewarm', 'abstracts_stats_prewarm', RHAbstractsStatsPrewarm,
+                       methods=('POST',))
+
+# Affiliation analytics
+blueprint.add_url_rule('/manage/affiliation-report', 'affiliation_report', RHAffiliationReport)
+blueprint.add_url_rule('/manage/affiliation-report/report.csv', 'affiliation_report_csv', RHAffiliationReportExportCSV)
+blueprint.add_url_rule('/manage/affiliation-report/report.xlsx', 'affiliation_report_xlsx',
+                       RHAffiliationReportExportExcel)
+
+# Affiliation lookups
+blueprint.add_url_rule('/manage/contributions/affiliations/options', 'contributions_affiliation_filter_options',
+                       RHContributionAffiliationFilterOptions)
+blueprint.add_url_rule('/manage/contributions/affiliations/search', 'contributions_by_affiliation',
+                       RHContributionsByAffiliation)
 
 # Custom exports
 blueprint.add_url_rule('/manage/abstracts/abstracts_custom.csv', 'abstracts_csv_export_custom',
@@ -30,8 +62,12 @@ blueprint.add_url_rule('/manage/contributions/contributions_custom.xlsx', 'contr
                        RHContributionsExportExcel, methods=('POST',))
 
 # Peer reviewing CSV import
-blueprint.add_url_rule('/manage/api/papers/jacow-csv-import', 'peer_review_csv_import', RHPeerReviewCSVImport,
-                       methods=('POST',))
+blueprint.add_url_rule('/manage/api/papers/teams/<any(judges,content_reviewers):team>/jacow-csv-import',
+                       'peer_review_csv_import', RHPeerReviewCSVImport, methods=('POST',))
+blueprint.add_url_rule('/manage/api/papers/teams/<any(judges,content_reviewers):team>/jacow-csv-import/<token>',
+                       'peer_review_csv_import_progress', RHPeerReviewCSVImportProgress)
 
+blueprint.add_url_rule('/api/jacow/affiliations', 'event_affiliations', RHEventAffiliations)
 blueprint.add_url_rule('!/api/jacow/countries', 'countries', RHCountries)
 blueprint.add_url_rule('!/api/jacow/affiliation', 'create_affiliation', RHCreateAffiliation, methods=('POST',))
+blueprint.add_url_rule('!/api/jacow/metrics', 'metrics', RHMetrics)
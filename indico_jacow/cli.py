@@ -0,0 +1,320 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import cProfile
+import csv
+import json
+import multiprocessing
+import os
+import secrets
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+from flask import current_app
+
+from indico.cli.core import cli_group
+from indico.core.db import db
+from indico.modules.categories import Category
+from indico.modules.events import Event
+from indico.modules.users import User
+from indico.modules.users.models.affiliations import Affiliation
+
+from indico_jacow.exports import ABSTRACT_COLUMN_GROUPS, BULK_EXPORT_CHUNK_SIZE, export_event, merge_exports
+from indico_jacow.loadtest import (LATENCY_PERCENTILES, SCENARIO_WEIGHTS, create_load_test_event,
+                                   delete_load_test_event, run_load_test)
+from indico_jacow.models.affiliations import CREATE_AFFILIATION_SEARCH_VIEW_SQL, DROP_AFFILIATION_SEARCH_VIEW_SQL
+from indico_jacow.util import (backfill_affiliations, count_affiliation_backfill, merge_affiliations,
+                               resolve_affiliation_merges)
+
+
+@cli_group(name='jacow')
+def cli():
+    """Manage the JACoW plugin."""
+
+
+@cli.command('sync-profiles')
+@click.option('--profile', 'profile_path', type=click.Path(dir_okay=False, writable=True),
+              help='Write cProfile statistics of the run to this file')
+def sync_profiles(profile_path):
+    """Synchronize user profiles with the central database.
+
+    This runs the same synchronization as the periodic task, even if
+    it is disabled in the plugin settings.
+    """
+    from indico_jacow.task import run_profile_sync
+    if profile_path:
+        profiler = cProfile.Profile()
+        run = profiler.runcall(run_profile_sync)
+        profiler.dump_stats(profile_path)
+        click.echo(f'Profile written to {profile_path}')
+    else:
+        run = run_profile_sync()
+    click.secho(f'{run.users_synced} users synced and {run.identities_added} identities added in {run.duration}',
+                fg='green')
+    for name, duration in run.metrics['phases'].items():
+        click.echo(f'  {name}: {duration:.3f}s')
+
+
+def _get_event_ids(event_ids, category_id):
+    if category_id is None:
+        return sorted(set(event_ids))
+    query = (Event.query
+             .filter(Event.category_chain_overlaps(category_id), ~Event.is_deleted)
+             .with_entities(Event.id))
+    return sorted(set(event_ids) | {id_ for id_, in query})
+
+
+def _init_export_worker(app):
+    # every worker gets its own app context and thus its own DB session
+    app.app_context().push()
+
+
+@cli.command('export')
+@click.argument('event_ids', nargs=-1, type=int)
+@click.option('--category', '-c', 'category_id', type=int, help='Export all events in this category')
+@click.option('--type', '-t', 'export_type', type=click.Choice(['abstracts', 'contributions']),
+              default='contributions', show_default=True, help='What to export')
+@click.option('--output', '-o', 'output_dir', type=click.Path(file_okay=False, writable=True), required=True,
+              help='The directory in which a CSV file is created for each event')
+@click.option('--merge', 'merge_path', type=click.Path(dir_okay=False, writable=True),
+              help='Also write the rows of all events into a single CSV file')
+@click.option('--exclude', multiple=True, type=click.Choice(ABSTRACT_COLUMN_GROUPS),
+              help='Column groups to leave out (can be used multiple times)')
+@click.option('--workers', '-j', type=click.IntRange(min=1), default=os.cpu_count(), show_default=True,
+              help='The number of worker processes')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=BULK_EXPORT_CHUNK_SIZE, show_default=True,
+              help='The number of abstracts/contributions a worker loads at once')
+def export(event_ids, category_id, export_type, output_dir, merge_path, exclude, workers, chunk_size):
+    """Export the abstracts or contributions of many events.
+
+    This creates the same extended export as the abstract and contribution
+    lists, using the default columns of the abstract list.  The events are
+    exported in parallel, with a separate worker process for each event.
+    """
+    event_ids = _get_event_ids(event_ids, category_id)
+    if not event_ids:
+        raise click.UsageError('No events specified')
+    os.makedirs(output_dir, exist_ok=True)
+    excluded = frozenset(exclude)
+    app = current_app._get_current_object()
+    # the workers are forked, so they must not inherit any open connections
+    db.session.close()
+    db.engine.dispose()
+    results = {}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=min(workers, len(event_ids)), mp_context=multiprocessing.get_context('fork'),
+                             initializer=_init_export_worker, initargs=(app,)) as executor:
+        futures = {executor.submit(export_event, event_id, export_type, output_dir, excluded, chunk_size): event_id
+                   for event_id in event_ids}
+        with click.progressbar(as_completed(futures), length=len(futures), label='Exporting events',
+                               item_show_func=lambda f: f and f'event {futures[f]}') as bar:
+            for future in bar:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as exc:
+                    errors[futures[future]] = exc
+    for event_id, (path, __, num_rows) in sorted(results.items()):
+        click.echo(f'Event {event_id}: {num_rows} rows written to {path}')
+    for event_id, exc in sorted(errors.items()):
+        click.secho(f'Event {event_id}: export failed: {exc}', fg='red', err=True)
+    if merge_path and results:
+        merge_exports(merge_path, results)
+        click.secho(f'{sum(n for __, __, n in results.values())} rows of {len(results)} events merged into '
+                    f'{merge_path}', fg='green')
+
+
+@cli.command('enable-affiliations')
+@click.argument('event_ids', nargs=-1, type=int)
+@click.option('--category', '-c', 'category_id', type=int, help='Process all events in this category')
+@click.option('--batch-size', type=click.IntRange(min=1), default=1000, show_default=True,
+              help='The number of person links backfilled per transaction')
+@click.option('--dry-run', '-n', is_flag=True, help='Only count the rows which would be inserted')
+def enable_affiliations(event_ids, category_id, batch_size, dry_run):
+    """Enable multiple affiliations in many events.
+
+    The affiliation tables are populated with the current affiliation of
+    each author, just like when enabling multiple affiliations in the
+    event management area.  Running it again for an event only backfills
+    authors who do not have any affiliations in these tables yet.
+    """
+    from indico_jacow.plugin import JACOWPlugin
+    event_ids = _get_event_ids(event_ids, category_id)
+    if not event_ids:
+        raise click.UsageError('No events specified')
+    events = Event.query.filter(Event.id.in_(event_ids), ~Event.is_deleted).order_by(Event.id).all()
+    if missing := set(event_ids) - {e.id for e in events}:
+        click.secho(f'Skipping non-existent events: {", ".join(map(str, sorted(missing)))}', fg='yellow')
+    totals = defaultdict(int)
+    for event in events:
+        if dry_run:
+            counts = count_affiliation_backfill(event)
+        else:
+            # enable the setting first so person links created during the backfill get their affiliations
+            # through the submission forms
+            JACOWPlugin.event_settings.set(event, 'multiple_affiliations', True)
+            db.session.commit()
+            counts = backfill_affiliations(event, batch_size=batch_size)
+            db.session.commit()
+        for model, count in counts.items():
+            totals[model] += count
+        details = ', '.join(f'{count} {model.__tablename__}' for model, count in counts.items())
+        click.echo(f'Event {event.id}: {details}')
+    summary = ', '.join(f'{count} {model.__tablename__}' for model, count in totals.items())
+    if dry_run:
+        click.secho(f'{len(events)} events would be enabled, inserting {summary}', fg='yellow')
+    else:
+        click.secho(f'{len(events)} events enabled, inserted {summary}', fg='green')
+
+
+def _read_affiliation_merges(merge_file):
+    try:
+        return [(int(source_id), int(target_id)) for source_id, target_id in csv.reader(merge_file) if source_id]
+    except ValueError:
+        raise click.UsageError(f'{merge_file.name} must contain pairs of affiliation ids') from None
+
+
+@cli.command('merge-affiliations')
+@click.argument('target_id', type=int, required=False)
+@click.argument('source_ids', nargs=-1, type=int)
+@click.option('--file', '-f', 'merge_file', type=click.File(),
+              help='A CSV file containing the id of a duplicate affiliation and the id of the affiliation it is '
+                   'merged into on each line')
+def merge_duplicate_affiliations(target_id, source_ids, merge_file):
+    """Merge duplicate affiliations in the plugin's affiliation tables.
+
+    The authors of abstracts and contributions which have one of the
+    duplicate affiliations get the target affiliation instead.  To merge
+    many duplicates, pass a CSV file; every target affiliation is merged
+    in a separate transaction, so a failing merge does not affect the
+    other ones.
+    """
+    merges = [(source_id, target_id) for source_id in source_ids]
+    if merge_file:
+        merges += _read_affiliation_merges(merge_file)
+    if not merges:
+        raise click.UsageError('No affiliations specified')
+    try:
+        merges = resolve_affiliation_merges(merges)
+    except ValueError as exc:
+        raise click.UsageError(str(exc)) from exc
+    existing = {id_ for id_, in (Affiliation.query
+                                 .filter(Affiliation.id.in_(merges), ~Affiliation.is_deleted)
+                                 .with_entities(Affiliation.id))}
+    totals = defaultdict(int)
+    failed = 0
+    with click.progressbar(sorted(merges.items()), label='Merging affiliations',
+                           item_show_func=lambda m: m and f'affiliation {m[0]}') as bar:
+        for merge_target_id, merge_source_ids in bar:
+            if merge_target_id not in existing:
+                click.secho(f'\nSkipping non-existent affiliation {merge_target_id}', fg='yellow', err=True)
+                failed += 1
+                continue
+            try:
+                counts = merge_affiliations(merge_target_id, merge_source_ids)
+                db.session.commit()
+            except Exception as exc:
+                db.session.rollback()
+                click.secho(f'\nMerging into affiliation {merge_target_id} failed: {exc}', fg='red', err=True)
+                failed += 1
+                continue
+            for model, count in counts.items():
+                totals[model] += count
+    summary = ', '.join(f'{count} {model.__tablename__}' for model, count in totals.items())
+    click.secho(f'{len(merges) - failed} affiliations merged, updated {summary}', fg='green')
+
+
+def _format_latencies(summary):
+    latencies = []
+    for pct in LATENCY_PERCENTILES:
+        value = summary[f'p{pct}']
+        latencies.append(f'p{pct} ' + (f'{value * 1000:6.0f}ms' if value is not None else '     -  '))
+    return '  '.join(latencies)
+
+
+@cli.command('load-test')
+@click.option('--user', '-u', 'user_id', type=int, required=True,
+              help='The ID of the user sending the requests; they become manager of the test event')
+@click.option('--category', '-c', 'category_id', type=int, required=True,
+              help='The category in which the test event is created')
+@click.option('--concurrency', '-j', type=click.IntRange(min=1), default=20, show_default=True,
+              help='The number of users sending requests at the same time')
+@click.option('--duration', '-d', type=click.IntRange(min=1), default=60, show_default=True,
+              help='For how many seconds requests are sent')
+@click.option('--scenario', '-s', 'scenarios', multiple=True, type=click.Choice(list(SCENARIO_WEIGHTS)),
+              help='Only use these scenarios (can be used multiple times)')
+@click.option('--abstracts', type=click.IntRange(min=1), default=200, show_default=True,
+              help='The number of abstracts and contributions in the test event')
+@click.option('--affiliations', type=click.IntRange(min=3), default=50, show_default=True,
+              help='The number of affiliations used by the authors')
+@click.option('--tracks', type=click.IntRange(min=0), default=8, show_default=True,
+              help='The number of tracks in the test event')
+@click.option('--seed', type=int, help='Seed the random choices to get reproducible runs')
+@click.option('--output', '-o', 'output_file', type=click.File('w'), help='Also write the report to a JSON file')
+@click.option('--keep', is_flag=True, help='Do not delete the test event and affiliations afterwards')
+def load_test(user_id, category_id, concurrency, duration, scenarios, abstracts, affiliations, tracks, seed,
+              output_file, keep):
+    """Simulate deadline-night load on the plugin's endpoints.
+
+    A conference with an open Call for Abstracts and synthetic abstracts,
+    contributions and affiliations is created.  Then several users submit
+    abstracts, search for and create affiliations, and look at the
+    reviewing statistics and extended exports at the same time.  The
+    requests are handled in-process using the configured database, so do
+    not run this against a production instance.
+    """
+    user = User.get(user_id, is_deleted=False)
+    if user is None:
+        raise click.UsageError(f'User {user_id} does not exist')
+    category = Category.get(category_id, is_deleted=False)
+    if category is None:
+        raise click.UsageError(f'Category {category_id} does not exist')
+    tag = f'Load test {secrets.token_hex(3)}'
+    target = create_load_test_event(category, user, tag, abstracts=abstracts, tracks=tracks,
+                                    affiliations=affiliations, seed=seed)
+    db.session.commit()
+    click.echo(f'Created event {target.event.id} ({tag})')
+    weights = {name: SCENARIO_WEIGHTS[name] for name in scenarios} if scenarios else SCENARIO_WEIGHTS
+    try:
+        report = run_load_test(current_app._get_current_object(), user, target, concurrency=concurrency,
+                               duration=duration, scenarios=weights, seed=seed)
+    finally:
+        if not keep:
+            delete_load_test_event(target.event, tag)
+            db.session.commit()
+    for scenario, summary in report['scenarios'].items():
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(summary['statuses'].items(),
+                                                                               key=lambda x: str(x[0])))
+        click.echo(f'{scenario:22} {summary["requests"]:6} req  {summary["throughput"]:7.2f} req/s  '
+                   f'{_format_latencies(summary)}  {summary["errors"]} errors ({statuses})')
+    total = report['total']
+    click.secho(f'{"total":22} {total["requests"]:6} req  {total["throughput"]:7.2f} req/s  '
+                f'{_format_latencies(total)}  {total["errors"]} errors', fg='red' if total['errors'] else 'green')
+    usage = report['db']
+    click.echo(f'DB connections: {usage["peak_checked_out"]} peak / {usage["mean_checked_out"]:.1f} mean checked out '
+               f'of a pool of {usage["pool_size"]}, {usage["peak_server_connections"]} peak on the server')
+    if output_file:
+        json.dump(report, output_file, indent=2, default=str)
+
+
+@cli.command('affiliation-search-view')
+@click.option('--drop', 'drop_only', is_flag=True, help='Only drop the view, e.g. before upgrading the database')
+def affiliation_search_view(drop_only):
+    """Recreate the materialized affiliation search view.
+
+    The view depends on core tables, so upgrading the Indico database may
+    fail while it exists.  In that case, drop it using ``--drop``, upgrade
+    the database and run this command again to recreate it.
+    """
+    db.session.execute(db.text(DROP_AFFILIATION_SEARCH_VIEW_SQL))
+    if drop_only:
+        db.session.commit()
+        click.secho('Affiliation search view dropped', fg='yellow')
+        return
+    db.session.execute(db.text(CREATE_AFFILIATION_SEARCH_VIEW_SQL))
+    db.session.commit()
+    click.secho('Affiliation search view recreated', fg='green')
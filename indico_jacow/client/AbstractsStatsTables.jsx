@@ -0,0 +1,206 @@
+// This file is part of the JACoW plugin.
+// Copyright (C) 2021 - 2026 CERN
+//
+// The CERN Indico plugins are free software; you can redistribute
+// them and/or modify them under the terms of the MIT License; see
+// the LICENSE file for more details.
+
+import questionStatsURL from 'indico-url:plugin_jacow.abstracts_stats_question';
+import reviewStatsURL from 'indico-url:plugin_jacow.abstracts_stats_reviews';
+
+import _ from 'lodash';
+import PropTypes from 'prop-types';
+import React, {useMemo, useState} from 'react';
+import ReactDOM from 'react-dom';
+import {Accordion, Icon, Input, Loader, Pagination, Table} from 'semantic-ui-react';
+
+import {useIndicoAxios} from 'indico/react/hooks';
+
+import {Translate} from './i18n';
+
+const ROWS_PER_PAGE = 25;
+
+const itemSchema = PropTypes.shape({
+  key: PropTypes.string.isRequired,
+  title: PropTypes.string.isRequired,
+  tracks: PropTypes.arrayOf(PropTypes.object),
+});
+
+function StatsTable({items, rows}) {
+  const [filter, setFilter] = useState('');
+  const [sortKey, setSortKey] = useState('name');
+  const [sortDirection, setSortDirection] = useState('ascending');
+  const [page, setPage] = useState(1);
+
+  const sortedRows = useMemo(() => {
+    const needle = filter.trim().toLowerCase();
+    const filtered = needle ? rows.filter(r => r.name.toLowerCase().includes(needle)) : rows;
+    const sorted = _.sortBy(filtered, r => (sortKey === 'name' ? r.name.toLowerCase() : r[sortKey]));
+    return sortDirection === 'ascending' ? sorted : sorted.reverse();
+  }, [rows, filter, sortKey, sortDirection]);
+
+  const totalPages = Math.max(1, Math.ceil(sortedRows.length / ROWS_PER_PAGE));
+  const currentPage = Math.min(page, totalPages);
+  const pageRows = sortedRows.slice((currentPage - 1) * ROWS_PER_PAGE, currentPage * ROWS_PER_PAGE);
+  const columns = items.flatMap(item => (item.tracks ? [...item.tracks, item] : [item]));
+
+  const sortBy = key => {
+    if (key === sortKey) {
+      setSortDirection(sortDirection === 'ascending' ? 'descending' : 'ascending');
+    } else {
+      setSortKey(key);
+      setSortDirection(key === 'name' ? 'ascending' : 'descending');
+    }
+  };
+
+  const headerCell = (key, content, props = {}) => (
+    <Table.HeaderCell
+      key={key}
+      sorted={sortKey === key ? sortDirection : null}
+      onClick={() => sortBy(key)}
+      {...props}
+    >
+      {content}
+    </Table.HeaderCell>
+  );
+
+  return (
+    <>
+      <Input
+        icon="filter"
+        placeholder={Translate.string('Filter reviewers...')}
+        value={filter}
+        onChange={(evt, {value}) => {
+          setFilter(value);
+          setPage(1);
+        }}
+      />
+      <Table sortable celled compact unstackable>
+        <Table.Header>
+          <Table.Row>
+            {headerCell('name', <Translate>Reviewer</Translate>, {rowSpan: 2})}
+            {items.map(item =>
+              item.tracks ? (
+                <Table.HeaderCell key={item.key} colSpan={item.tracks.length + 1}>
+                  {item.title}
+                </Table.HeaderCell>
+              ) : (
+                headerCell(item.key, item.title, {rowSpan: 2})
+              )
+            )}
+            {headerCell('total', <Translate>Total</Translate>, {rowSpan: 2})}
+          </Table.Row>
+          <Table.Row>
+            {items
+              .filter(item => item.tracks)
+              .map(item => [
+                ...item.tracks.map(track => headerCell(track.key, track.title)),
+                headerCell(item.key, <Translate>Subtotal</Translate>),
+              ])}
+          </Table.Row>
+        </Table.Header>
+        <Table.Body>
+          {pageRows.map(row => (
+            <Table.Row key={row.id}>
+              <Table.Cell>{row.name}</Table.Cell>
+              {columns.map(col => (
+                <Table.Cell key={col.key}>{row[col.key]}</Table.Cell>
+              ))}
+              <Table.Cell>{row.total}</Table.Cell>
+            </Table.Row>
+          ))}
+        </Table.Body>
+      </Table>
+      {totalPages > 1 && (
+        <Pagination
+          activePage={currentPage}
+          totalPages={totalPages}
+          onPageChange={(evt, {activePage}) => setPage(activePage)}
+        />
+      )}
+    </>
+  );
+}
+
+StatsTable.propTypes = {
+  items: PropTypes.arrayOf(itemSchema).isRequired,
+  rows: PropTypes.arrayOf(PropTypes.object).isRequired,
+};
+
+function LazyStatsTable({url}) {
+  const {data, loading} = useIndicoAxios(url, {camelize: false});
+
+  if (loading || !data) {
+    return <Loader active inline="centered" />;
+  } else if (!data.rows.length) {
+    return <Translate>No reviews have been made yet.</Translate>;
+  } else if (!data.items.length) {
+    return <Translate>No tracks have been created yet.</Translate>;
+  }
+  return <StatsTable items={data.items} rows={data.rows} />;
+}
+
+LazyStatsTable.propTypes = {
+  url: PropTypes.string.isRequired,
+};
+
+export default function AbstractsStatsTables({eventId, questions}) {
+  const [expanded, setExpanded] = useState(new Set(['reviews']));
+  const tables = [
+    {
+      key: 'reviews',
+      title: Translate.string('Number of reviews per track'),
+      url: reviewStatsURL({event_id: eventId}),
+    },
+    ...questions.map(q => ({
+      key: `question-${q.id}`,
+      title: Translate.string('Positive answers to question "{title}"', {title: q.title}),
+      url: questionStatsURL({event_id: eventId, question_id: q.id}),
+    })),
+  ];
+
+  const toggle = key => {
+    const newExpanded = new Set(expanded);
+    if (newExpanded.has(key)) {
+      newExpanded.delete(key);
+    } else {
+      newExpanded.add(key);
+    }
+    setExpanded(newExpanded);
+  };
+
+  return (
+    <Accordion styled fluid exclusive={false}>
+      {tables.map(table => (
+        <React.Fragment key={table.key}>
+          <Accordion.Title active={expanded.has(table.key)} onClick={() => toggle(table.key)}>
+            <Icon name="dropdown" />
+            {table.title}
+          </Accordion.Title>
+          <Accordion.Content active={expanded.has(table.key)}>
+            {expanded.has(table.key) && <LazyStatsTable url={table.url} />}
+          </Accordion.Content>
+        </React.Fragment>
+      ))}
+    </Accordion>
+  );
+}
+
+AbstractsStatsTables.propTypes = {
+  eventId: PropTypes.number.isRequired,
+  questions: PropTypes.arrayOf(
+    PropTypes.shape({
+      id: PropTypes.number.isRequired,
+      title: PropTypes.string.isRequired,
+    })
+  ).isRequired,
+};
+
+export function setupAbstractsStatsTables(selector, {eventId, questions}) {
+  document.addEventListener('DOMContentLoaded', () => {
+    ReactDOM.render(
+      <AbstractsStatsTables eventId={eventId} questions={questions} />,
+      document.querySelector(selector)
+    );
+  });
+}
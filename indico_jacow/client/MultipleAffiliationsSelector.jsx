@@ -7,11 +7,10 @@
 
 import countriesURL from 'indico-url:plugin_jacow.countries';
 import createAffiliationURL from 'indico-url:plugin_jacow.create_affiliation';
-import searchAffiliationURL from 'indico-url:users.api_affiliations';
 
 import _ from 'lodash';
 import PropTypes from 'prop-types';
-import React, {useState} from 'react';
+import React, {useEffect, useRef, useState} from 'react';
 import {DndProvider} from 'react-dnd';
 import {HTML5Backend} from 'react-dnd-html5-backend';
 import {
@@ -32,9 +31,16 @@ import {useIndicoAxios} from 'indico/react/hooks';
 import {Param} from 'indico/react/i18n';
 import {SortableWrapper, useSortableItem} from 'indico/react/sortable';
 import {indicoAxios, handleAxiosError} from 'indico/utils/axios';
-import {camelizeKeys} from 'indico/utils/case';
 import {makeAsyncDebounce} from 'indico/utils/debounce';
 
+import {
+  addAffiliation,
+  getCachedAffiliation,
+  getCachedAffiliationSearch,
+  getEventAffiliationMatches,
+  prefetchEventAffiliations,
+  searchAffiliations,
+} from './affiliationSearch';
 import {Translate} from './i18n';
 
 import './MultipleAffiliationsSelector.module.scss';
@@ -49,6 +55,7 @@ const affiliationSchema = PropTypes.shape({
 
 const extraParamsSchema = PropTypes.shape({
   jacowAffiliations: PropTypes.bool,
+  jacowEventId: PropTypes.number,
 });
 
 const getSubheader = ({city, countryName}) => {
@@ -88,9 +95,15 @@ DraggableAffiliation.propTypes = {
   onMove: PropTypes.func.isRequired,
 };
 
-const MultipleAffiliationsField = ({onChange, value, currentAffiliations}) => {
+const mergeResults = (first, second) => [
+  ...first,
+  ...second.filter(x => !first.find(y => y.id === x.id)),
+];
+
+const MultipleAffiliationsField = ({onChange, value, currentAffiliations, eventId}) => {
   const [searchUsed, setSearchUsed] = useState(false);
   const [_searchResults, setSearchResults] = useState([]);
+  const latestQuery = useRef('');
   const searchResults = [
     ...currentAffiliations,
     ..._searchResults.filter(x => !currentAffiliations.find(y => y.id === x.id)),
@@ -105,18 +118,32 @@ const MultipleAffiliationsField = ({onChange, value, currentAffiliations}) => {
   }));
 
   const searchChange = async (evt, {searchQuery}) => {
-    if (!searchQuery) {
+    latestQuery.current = searchQuery;
+    if (!searchQuery.trim()) {
       setSearchResults([]);
       return;
     }
-    let resp;
+    // affiliations already used in the event are suggested right away
+    const eventMatches = eventId ? getEventAffiliationMatches(eventId, searchQuery) : [];
+    const cached = getCachedAffiliationSearch(searchQuery);
+    if (cached) {
+      setSearchResults(mergeResults(eventMatches, cached));
+      setSearchUsed(true);
+      return;
+    }
+    setSearchResults(eventMatches);
+    let results;
     try {
-      resp = await debounce(() => indicoAxios.get(searchAffiliationURL({q: searchQuery})));
+      results = await debounce(() => searchAffiliations(searchQuery));
     } catch (error) {
       handleAxiosError(error);
       return;
     }
-    setSearchResults(camelizeKeys(resp.data));
+    if (latestQuery.current !== searchQuery) {
+      // a newer query has been answered from the cache in the meantime
+      return;
+    }
+    setSearchResults(mergeResults(eventMatches, results));
     setSearchUsed(true);
   };
 
@@ -183,6 +210,7 @@ const MultipleAffiliationsField = ({onChange, value, currentAffiliations}) => {
               wrapper={
                 <AddAffiliation
                   onAdded={aff => {
+                    addAffiliation(aff, eventId);
                     onChange([...value, {id: aff.id, text: aff.name, meta: aff}]);
                   }}
                 />
@@ -202,6 +230,11 @@ MultipleAffiliationsField.propTypes = {
   onChange: PropTypes.func.isRequired,
   value: PropTypes.arrayOf(affiliationSchema).isRequired,
   currentAffiliations: PropTypes.array.isRequired,
+  eventId: PropTypes.number,
+};
+
+MultipleAffiliationsField.defaultProps = {
+  eventId: null,
 };
 
 export default function MultipleAffiliationsSelector({
@@ -246,6 +279,7 @@ export default function MultipleAffiliationsSelector({
         name="affiliationsData"
         component={MultipleAffiliationsField}
         currentAffiliations={persons[selected].jacowAffiliationsMeta || []}
+        eventId={extraParams.jacowEventId}
       />
     </FinalModalForm>
   );
@@ -406,7 +440,15 @@ AddAffiliation.propTypes = {
 };
 
 export function MultipleAffiliationsButton({person, onEdit, disabled, extraParams}) {
-  if (!extraParams.jacowAffiliations) {
+  const {jacowAffiliations, jacowEventId} = extraParams;
+
+  useEffect(() => {
+    if (jacowAffiliations && jacowEventId) {
+      prefetchEventAffiliations(jacowEventId);
+    }
+  }, [jacowAffiliations, jacowEventId]);
+
+  if (!jacowAffiliations) {
     return null;
   }
   return (
@@ -444,11 +486,13 @@ MultipleAffiliationsButton.propTypes = {
   extraParams: extraParamsSchema.isRequired,
 };
 
-export const customFields = ['jacowAffiliationsIds'];
+export const customFields = ['jacowAffiliationsIds', 'jacowOrigAffiliationsIds'];
 
 export const onAddPersonLink = person => {
   if (!person.jacowAffiliationsIds && person.affiliationId) {
     person.jacowAffiliationsIds = [person.affiliationId];
-    person.jacowAffiliationsMeta = [person.affiliationMeta];
+    person.jacowAffiliationsMeta = [
+      person.affiliationMeta || getCachedAffiliation(person.affiliationId),
+    ];
   }
 };
@@ -6,6 +6,7 @@
 // the LICENSE file for more details.
 
 import uploadManagersFileURL from 'indico-url:plugin_jacow.peer_review_csv_import';
+import importProgressURL from 'indico-url:plugin_jacow.peer_review_csv_import_progress';
 
 import PropTypes from 'prop-types';
 import React, {useCallback, useContext, useState} from 'react';
@@ -18,64 +19,86 @@ import {
   MessageList,
   MessageItem,
   Icon,
-  Loader,
-  Dimmer,
+  Progress,
 } from 'semantic-ui-react';
 
 import {SingleFileArea} from 'indico/react/components/files/FileArea';
-import {FormContext, FinalField, handleSubmitError} from 'indico/react/forms';
+import {FormContext, FinalField} from 'indico/react/forms';
 import {FinalModalForm} from 'indico/react/forms/final-form';
 import {Translate} from 'indico/react/i18n';
 import {indicoAxios} from 'indico/utils/axios';
 
 import './PeerReviewManagerFileInput.module.scss';
 
+// How often the progress of a running import is fetched (in ms)
+const PROGRESS_POLL_INTERVAL = 1000;
+
 const PeerReviewManagersFileInput = ({
   setValidationError,
-  setUnknownEmails,
-  setUserIdentifiers,
-  setLoading,
+  setProgress,
+  setSummary,
+  setError,
   eventId,
+  team,
 }) => {
   const [uploadedFile, setFile] = useState();
+  const [uploading, setUploading] = useState(false);
   const validExtensions = ['csv'];
 
-  const userList = useCallback(
+  const importUsers = useCallback(
     async file => {
-      const headers = {'content-type': 'multipart/form-data'};
-      let response;
-      setLoading(true);
+      setUploading(true);
+      setError(null);
+      setProgress({processed: 0, total: 0});
+      // The whole file is imported in a single request, so the progress is polled separately
+      const progressToken = Math.random().toString(36).slice(2);
+      let finished = false;
+      const progressTimer = setInterval(async () => {
+        try {
+          const {data} = await indicoAxios.get(
+            importProgressURL({event_id: eventId, team, token: progressToken})
+          );
+          if (!finished && data.total) {
+            setProgress(data);
+          }
+        } catch (e) {
+          // the progress is only informational
+        }
+      }, PROGRESS_POLL_INTERVAL);
       try {
         const formData = new FormData();
         formData.append('file', file);
-        response = await indicoAxios.post(uploadManagersFileURL({event_id: eventId}), formData, {
-          headers,
-        });
-        if (response.data.unknown_emails.length > 0) {
-          setUnknownEmails(response.data.unknown_emails);
-        }
-        setUserIdentifiers(response.data.identifiers);
+        formData.append('progress_token', progressToken);
+        const {data} = await indicoAxios.post(
+          uploadManagersFileURL({event_id: eventId, team}),
+          formData
+        );
+        setSummary({added: data.added, existing: data.existing, unknown: data.unknown});
         return true;
       } catch (e) {
-        handleSubmitError(e);
+        const {response} = e;
+        setError(response && response.data.error ? response.data.error.message : e.message);
         return false;
       } finally {
-        setLoading(false);
+        finished = true;
+        clearInterval(progressTimer);
+        setProgress(null);
+        setUploading(false);
       }
     },
-    [eventId, setLoading, setUnknownEmails, setUserIdentifiers]
+    [eventId, team, setProgress, setSummary, setError]
   );
 
   const onDropAccepted = useCallback(
     async ([acceptedFile]) => {
       acceptedFile.filename = acceptedFile.name;
-      const isSuccess = await userList(acceptedFile);
+      const isSuccess = await importUsers(acceptedFile);
       if (isSuccess) {
         setFile(acceptedFile);
         setValidationError(acceptedFile);
       }
     },
-    [userList, setValidationError]
+    [importUsers, setValidationError]
   );
 
   const dropzone = useDropzone({
@@ -84,36 +107,43 @@ const PeerReviewManagersFileInput = ({
     multiple: false,
     noClick: true,
     noKeyboard: true,
+    disabled: uploading || !!uploadedFile,
   });
 
   return <SingleFileArea dropzone={dropzone} file={uploadedFile} />;
 };
 PeerReviewManagersFileInput.propTypes = {
   setValidationError: PropTypes.func.isRequired,
-  setUnknownEmails: PropTypes.func.isRequired,
-  setUserIdentifiers: PropTypes.func.isRequired,
-  setLoading: PropTypes.func.isRequired,
+  setProgress: PropTypes.func.isRequired,
+  setSummary: PropTypes.func.isRequired,
+  setError: PropTypes.func.isRequired,
   eventId: PropTypes.number.isRequired,
+  team: PropTypes.string.isRequired,
 };
 
-function PeerReviewManagersFileField({onClose, eventId, onChange}) {
-  const [unknownEmails, setUnknownEmails] = useState([]);
-  const [userIdentifiers, setUserIdentifiers] = useState([]);
-  const [loading, setLoading] = useState(false);
+function PeerReviewManagersFileField({onClose, eventId, team}) {
+  const [progress, setProgress] = useState(null);
+  const [summary, setSummary] = useState(null);
+  const [error, setError] = useState(null);
 
-  const handleSubmit = async () => {
-    onChange(userIdentifiers);
-    onClose();
+  // The users are added to the team on the server, so the team list needs to be
+  // reloaded or saving the teams form would remove them again.
+  const handleClose = () => {
+    if (summary && summary.added > 0) {
+      location.reload();
+    } else {
+      onClose();
+    }
   };
 
   return (
     <FinalModalForm
       id="peer-review-managers-file"
       size="small"
-      onClose={onClose}
-      onSubmit={handleSubmit}
+      onClose={handleClose}
+      onSubmit={handleClose}
       header={Translate.string('Import from CSV')}
-      submitLabel={Translate.string('Import')}
+      submitLabel={Translate.string('Done')}
     >
       <Message info icon>
         <Icon name="lightbulb" />
@@ -131,26 +161,47 @@ function PeerReviewManagersFileField({onClose, eventId, onChange}) {
               </Translate>
             </MessageItem>
           </MessageList>
-          <p>Users will be matched with existing Indico identities through their e-mail.</p>
+          <p>
+            <Translate>
+              Users will be matched with existing Indico identities through their e-mail and
+              added to the team right away.
+            </Translate>
+          </p>
         </Message.Content>
       </Message>
-      {loading && (
-        <Dimmer active inverted>
-          <Loader inline />
-        </Dimmer>
+      {progress && (
+        <Progress
+          value={progress.processed}
+          total={progress.total || 1}
+          active
+          indicating
+          label={Translate.string('Processing rows...')}
+        />
+      )}
+      {error && (
+        <Message error>
+          <Icon name="times" />
+          {error}
+        </Message>
+      )}
+      {summary && (
+        <Message success>
+          <MessageList>
+            <MessageItem>
+              <Translate>Users added to the team:</Translate> {summary.added}
+            </MessageItem>
+            <MessageItem>
+              <Translate>Users already in the team:</Translate> {summary.existing}
+            </MessageItem>
+          </MessageList>
+        </Message>
       )}
-      {unknownEmails.length > 0 && (
+      {summary && summary.unknown > 0 && (
         <Message icon color="yellow">
           <Icon name="warning sign" />
           <Message.Content>
-            <MessageHeader>
-              <Translate>The following emails are not registered and won't be imported:</Translate>
-            </MessageHeader>
-            <MessageList>
-              {unknownEmails.map(e => (
-                <MessageItem key={e}>{e}</MessageItem>
-              ))}
-            </MessageList>
+            <Translate>Emails which are not registered and were not imported:</Translate>{' '}
+            {summary.unknown}
           </Message.Content>
         </Message>
       )}
@@ -161,10 +212,11 @@ function PeerReviewManagersFileField({onClose, eventId, onChange}) {
             name="file"
             component={PeerReviewManagersFileInput}
             setValidationError={setDummyValue}
-            setUnknownEmails={setUnknownEmails}
-            setUserIdentifiers={setUserIdentifiers}
-            setLoading={setLoading}
+            setProgress={setProgress}
+            setSummary={setSummary}
+            setError={setError}
             eventId={eventId}
+            team={team}
           />
         )}
       />
@@ -174,10 +226,10 @@ function PeerReviewManagersFileField({onClose, eventId, onChange}) {
 PeerReviewManagersFileField.propTypes = {
   onClose: PropTypes.func.isRequired,
   eventId: PropTypes.number.isRequired,
-  onChange: PropTypes.func.isRequired,
+  team: PropTypes.string.isRequired,
 };
 
-export function PeerReviewManagersFileButton({entries, eventId, onChange}) {
+export function PeerReviewManagersFileButton({entries, eventId}) {
   const formContext = useContext(FormContext);
   const [fileImportVisible, setFileImportVisible] = useState(false);
 
@@ -226,7 +278,7 @@ export function PeerReviewManagersFileButton({entries, eventId, onChange}) {
         <PeerReviewManagersFileField
           onClose={() => setFileImportVisible(false)}
           eventId={eventId}
-          onChange={onChange}
+          team={formContext[1]}
         />
       )}
     </>
@@ -235,5 +287,4 @@ export function PeerReviewManagersFileButton({entries, eventId, onChange}) {
 PeerReviewManagersFileButton.propTypes = {
   entries: PropTypes.arrayOf(PropTypes.object).isRequired,
   eventId: PropTypes.number.isRequired,
-  onChange: PropTypes.func.isRequired,
 };
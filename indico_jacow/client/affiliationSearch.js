@@ -0,0 +1,164 @@
+// This file is part of the JACoW plugin.
+// Copyright (C) 2021 - 2026 CERN
+//
+// The CERN Indico plugins are free software; you can redistribute
+// them and/or modify them under the terms of the MIT License; see
+// the LICENSE file for more details.
+
+import eventAffiliationsURL from 'indico-url:plugin_jacow.event_affiliations';
+import searchAffiliationURL from 'indico-url:users.api_affiliations';
+
+import {indicoAxios} from 'indico/utils/axios';
+import {camelizeKeys} from 'indico/utils/case';
+
+// The number of search queries whose results are kept
+const MAX_CACHED_QUERIES = 100;
+// Shorter queries only return exact matches, so they cannot be narrowed down
+const MIN_NARROWING_LENGTH = 3;
+// Results of this size may have been truncated by the server
+const MAX_NARROWING_RESULTS = 20;
+
+export class LRUCache {
+  constructor(maxSize) {
+    this.maxSize = maxSize;
+    this.entries = new Map();
+  }
+
+  has(key) {
+    return this.entries.has(key);
+  }
+
+  peek(key) {
+    return this.entries.get(key);
+  }
+
+  get(key) {
+    if (!this.entries.has(key)) {
+      return undefined;
+    }
+    const value = this.entries.get(key);
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    return value;
+  }
+
+  set(key, value) {
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    if (this.entries.size > this.maxSize) {
+      this.entries.delete(this.entries.keys().next().value);
+    }
+  }
+
+  clear() {
+    this.entries.clear();
+  }
+}
+
+// Shared by all affiliation selectors on the page
+const searchCache = new LRUCache(MAX_CACHED_QUERIES);
+const affiliations = new Map();
+const eventAffiliations = new Map();
+const eventAffiliationRequests = new Map();
+
+const normalizeQuery = query => query.trim().toLowerCase();
+
+const rememberAffiliations = results => {
+  results.forEach(aff => affiliations.set(aff.id, aff));
+  return results;
+};
+
+export const matchesAffiliation = (affiliation, query) =>
+  [affiliation.name, ...(affiliation.altNames || [])].some(name =>
+    name.toLowerCase().includes(query)
+  );
+
+// Sort the results like the server does: exact matches first, then prefix matches
+const sortResults = (results, query) => {
+  const rank = aff => {
+    const name = aff.name.toLowerCase();
+    if (name === query) {
+      return 0;
+    }
+    return name.startsWith(query) ? 1 : 2;
+  };
+  return results.slice().sort((a, b) => rank(a) - rank(b));
+};
+
+const narrowCachedResults = query => {
+  for (let length = query.length - 1; length >= MIN_NARROWING_LENGTH; length--) {
+    const results = searchCache.peek(query.slice(0, length));
+    if (results && results.length < MAX_NARROWING_RESULTS) {
+      return sortResults(results.filter(aff => matchesAffiliation(aff, query)), query);
+    }
+  }
+  return null;
+};
+
+/**
+ * Get the search results for a query without sending a request.
+ *
+ * Queries which extend a cached query whose results are complete are
+ * answered by filtering those results.
+ */
+export function getCachedAffiliationSearch(query) {
+  const q = normalizeQuery(query);
+  if (searchCache.has(q)) {
+    return searchCache.get(q);
+  }
+  const results = narrowCachedResults(q);
+  if (results) {
+    searchCache.set(q, results);
+  }
+  return results;
+}
+
+export async function searchAffiliations(query) {
+  const cached = getCachedAffiliationSearch(query);
+  if (cached) {
+    return cached;
+  }
+  const resp = await indicoAxios.get(searchAffiliationURL({q: query.trim()}));
+  const results = rememberAffiliations(camelizeKeys(resp.data));
+  searchCache.set(normalizeQuery(query), results);
+  return results;
+}
+
+export const getCachedAffiliation = id => affiliations.get(id);
+
+export function addAffiliation(affiliation, eventId = null) {
+  rememberAffiliations([affiliation]);
+  // the new affiliation may match any of the cached queries
+  searchCache.clear();
+  if (eventAffiliations.has(eventId)) {
+    eventAffiliations.set(eventId, [...eventAffiliations.get(eventId), affiliation]);
+  }
+}
+
+/**
+ * Load the affiliations already used in an event.
+ *
+ * This sends only one request per event, no matter how many selectors
+ * there are on the page.
+ */
+export function prefetchEventAffiliations(eventId) {
+  if (!eventAffiliationRequests.has(eventId)) {
+    const request = indicoAxios
+      .get(eventAffiliationsURL({event_id: eventId}))
+      .then(resp => rememberAffiliations(camelizeKeys(resp.data)))
+      // the suggestions are optional, so errors are not worth reporting
+      .catch(() => [])
+      .then(results => {
+        eventAffiliations.set(eventId, results);
+        return results;
+      });
+    eventAffiliationRequests.set(eventId, request);
+  }
+  return eventAffiliationRequests.get(eventId);
+}
+
+export function getEventAffiliationMatches(eventId, query) {
+  const q = normalizeQuery(query);
+  const results = eventAffiliations.get(eventId) || [];
+  return sortResults(results.filter(aff => matchesAffiliation(aff, q)), q);
+}
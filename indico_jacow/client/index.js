@@ -7,6 +7,7 @@
 
 import {registerPluginComponent, registerPluginObject} from 'indico/utils/plugins';
 
+import {setupAbstractsStatsTables} from './AbstractsStatsTables';
 import MultipleAffiliationsSelector, {
   MultipleAffiliationsButton,
   customFields,
@@ -25,3 +26,5 @@ registerPluginComponent(
 );
 registerPluginObject(PLUGIN_NAME, 'personLinkCustomFields', customFields);
 registerPluginObject(PLUGIN_NAME, 'onAddPersonLink', onAddPersonLink);
+
+window.setupJacowAbstractsStats = setupAbstractsStatsTables;
@@ -0,0 +1,207 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from indico.modules.events.abstracts.models.abstracts import Abstract
+from indico.modules.events.abstracts.models.persons import AbstractPersonLink
+from indico.modules.events.abstracts.models.review_questions import AbstractReviewQuestion
+from indico.modules.events.abstracts.models.review_ratings import AbstractReviewRating
+from indico.modules.events.abstracts.models.reviews import AbstractAction, AbstractReview
+from indico.modules.events.contributions.models.contributions import Contribution
+from indico.modules.events.contributions.models.persons import AuthorType, ContributionPersonLink
+from indico.modules.events.models.events import EventType
+from indico.modules.events.models.persons import EventPerson
+from indico.modules.events.tracks.models.groups import TrackGroup
+from indico.modules.events.tracks.models.tracks import Track
+from indico.modules.users.models.affiliations import Affiliation
+
+from indico_jacow.models.affiliations import (DROP_AFFILIATION_SEARCH_VIEW_SQL, AbstractAffiliation,
+                                              ContributionAffiliation)
+
+
+BENCHMARK_BASELINE_PATH = Path(__file__).parent / 'test_snapshots' / 'benchmark_baseline.json'
+#: Factor by which the wall time of a benchmark may exceed its baseline
+BENCHMARK_TIME_TOLERANCE = float(os.environ.get('JACOW_BENCHMARK_TIME_TOLERANCE', '2'))
+#: Absolute slack (in seconds) so very fast benchmarks are not flaky
+BENCHMARK_TIME_SLACK = 0.05
+_COUNTRY_CODES = ('CH', 'FR', 'DE', 'US', 'JP', 'CN', 'IT', 'GB')
+
+
+@pytest.fixture(scope='session')
+def database(app, database):
+    """Extend the core fixture to drop the affiliation search view at the end.
+
+    The core fixture drops all tables one by one, which fails while the
+    view depending on some of them still exists.
+    """
+    yield database
+    with app.app_context():
+        database.session.remove()
+        with database.engine.begin() as conn:
+            conn.execute(database.text(DROP_AFFILIATION_SEARCH_VIEW_SQL))
+
+
+@pytest.fixture
+def create_synthetic_event(db, create_event, create_user):
+    """Return a callable that creates a CfA event with synthetic data.
+
+    The event contains `abstracts` abstracts distributed over `tracks`
+    tracks (every second track belongs to one of `track_groups` groups),
+    each reviewed by all `reviewers` reviewers who answer `questions`
+    review questions (alternating between rating and bool questions).
+    Every abstract has `authors` authors picked from a shared pool of
+    event persons, each with `affiliations_per_author` affiliations from
+    a pool of `affiliations` affiliations. If `contributions` is set, an
+    equivalent contribution is created for every abstract.
+    """
+
+    def _create_synthetic_event(*, abstracts=10, reviewers=3, tracks=4, track_groups=2, questions=2,
+                                affiliations=5, authors=3, affiliations_per_author=2, contributions=False):
+        event = create_event(type_=EventType.conference, title='Synthetic Conference')
+        affiliation_objs = [Affiliation(name=f'Affiliation {i}', street=f'{i} Main Street', postcode=f'{1000 + i}',
+                                        city=f'City {i}', country_code=_COUNTRY_CODES[i % len(_COUNTRY_CODES)])
+                            for i in range(affiliations)]
+        db.session.add_all(affiliation_objs)
+        # explicit positions, since the default ones are all the same when inserted in one flush
+        group_objs = [TrackGroup(title=f'Group {i}', event=event, position=i + 1) for i in range(track_groups)]
+        track_objs = [Track(title=f'Track {i}', code=f'T{i}', event=event, position=track_groups + i + 1,
+                            track_group=(group_objs[(i // 2) % track_groups] if group_objs and i % 2 == 0 else None))
+                      for i in range(tracks)]
+        reviewer_objs = [create_user(10000 + i, first_name='Reviewer', last_name=str(i),
+                                     email=f'reviewer{i}@example.com')
+                         for i in range(reviewers)]
+        for user in reviewer_objs:
+            event.update_principal(user, add_permissions={'abstract_reviewer', 'review_all_abstracts'})
+        question_objs = [AbstractReviewQuestion(event=event, title=f'Question {i}',
+                                                field_type=('bool' if i % 2 else 'rating'))
+                         for i in range(questions)]
+        person_objs = [EventPerson(event=event, first_name='Author', last_name=str(i), email=f'author{i}@example.com')
+                       for i in range(max(authors * 2, 1))]
+        # not all of them are used by a person link if there are only few abstracts
+        db.session.add_all(person_objs)
+
+        def _make_person_links(link_cls, affiliation_cls, offset):
+            links = []
+            for i in range(authors):
+                person = person_objs[(offset + i) % len(person_objs)]
+                link = link_cls(person=person, is_speaker=(i == 0),
+                                author_type=(AuthorType.primary if i == 0 else AuthorType.secondary))
+                link.jacow_affiliations = [
+                    affiliation_cls(affiliation=affiliation_objs[(offset + i + n) % affiliations], display_order=n)
+                    for n in range(min(affiliations_per_author, affiliations))
+                ]
+                links.append(link)
+            return links
+
+        abstract_objs = []
+        contribution_objs = []
+        for i in range(abstracts):
+            track = track_objs[i % tracks] if track_objs else None
+            abstract = Abstract(friendly_id=i + 1, title=f'Abstract {i}', event=event, submitter=event.creator,
+                                submitted_for_tracks={track} if track else set(),
+                                reviewed_for_tracks={track} if track else set())
+            abstract.person_links = _make_person_links(AbstractPersonLink, AbstractAffiliation, i)
+            if track:
+                for n, user in enumerate(reviewer_objs):
+                    review = AbstractReview(abstract=abstract, track=track, user=user,
+                                            proposed_action=AbstractAction.accept)
+                    review.ratings = [AbstractReviewRating(question=question,
+                                                           value=((n + i) % 2 == 0 if question.field_type == 'bool'
+                                                                  else (n + i) % 5 + 1))
+                                      for question in question_objs]
+            abstract_objs.append(abstract)
+            if contributions:
+                contrib = Contribution(friendly_id=i + 1, title=f'Contribution {i}', event=event, track=track,
+                                       duration=timedelta(minutes=20))
+                contrib.person_links = _make_person_links(ContributionPersonLink, ContributionAffiliation, i)
+                contribution_objs.append(contrib)
+        db.session.flush()
+        return SimpleNamespace(event=event, abstracts=abstract_objs, contributions=contribution_objs,
+                               reviewers=reviewer_objs, tracks=track_objs, track_groups=group_objs,
+                               questions=question_objs, persons=person_objs, affiliations=affiliation_objs)
+
+    return _create_synthetic_event
+
+
+@pytest.fixture(scope='session')
+def _benchmark_baseline():
+    try:
+        baseline = json.loads(BENCHMARK_BASELINE_PATH.read_text())
+    except FileNotFoundError:
+        baseline = {}
+    original = json.dumps(baseline, sort_keys=True)
+    yield baseline
+    # the baseline is part of the source tree, so it is only ever written on request
+    if os.environ.get('JACOW_BENCHMARK_UPDATE') == '1' and json.dumps(baseline, sort_keys=True) != original:
+        BENCHMARK_BASELINE_PATH.parent.mkdir(exist_ok=True)
+        BENCHMARK_BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.fixture
+def jacow_benchmark(request, count_queries, _benchmark_baseline):
+    """Provide a callable to benchmark a function against the stored baseline.
+
+    The function is called `rounds` times and its first return value is
+    returned, so the test can check it as usual.  Once the test is done,
+    the SQL queries of the first call and the fastest wall time are
+    compared with the baseline stored in
+    ``test_snapshots/benchmark_baseline.json``.  The wall time is only
+    checked if the baseline contains one, since it depends on the machine.
+    A missing baseline fails the test; run the tests with
+    ``JACOW_BENCHMARK_UPDATE=1`` to record the measured values.
+
+    Usage::
+
+        rv = jacow_benchmark(func, arg, kwarg=value)
+    """
+    measurements = []
+
+    def _benchmark(func, *args, rounds=3, **kwargs):
+        times = []
+        with count_queries() as query_count:
+            start = time.perf_counter()
+            rv = func(*args, **kwargs)
+            times.append(time.perf_counter() - start)
+        for __ in range(rounds - 1):
+            start = time.perf_counter()
+            func(*args, **kwargs)
+            times.append(time.perf_counter() - start)
+        measurements.append({'queries': query_count(), 'seconds': round(min(times), 4)})
+        return rv
+
+    yield _benchmark
+
+    if not measurements:
+        return
+    elif len(measurements) > 1:
+        pytest.fail('jacow_benchmark may only be called once per test')
+    measured = measurements[0]
+    name = request.node.name
+    if os.environ.get('JACOW_BENCHMARK_UPDATE') == '1':
+        # the wall time depends on the machine, so only the query count is recorded
+        _benchmark_baseline[name] = {'queries': measured['queries']}
+        return
+    baseline = _benchmark_baseline.get(name)
+    if baseline is None:
+        pytest.fail(f'{name}: no baseline recorded ({measured["queries"]} queries, {measured["seconds"]:.4f}s); '
+                    f'run the tests with JACOW_BENCHMARK_UPDATE=1 to record it')
+    if measured['queries'] > baseline['queries']:
+        pytest.fail(f'{name}: {measured["queries"]} queries exceed the baseline of {baseline["queries"]}')
+    if 'seconds' not in baseline:
+        return
+    max_seconds = baseline['seconds'] * BENCHMARK_TIME_TOLERANCE + BENCHMARK_TIME_SLACK
+    if measured['seconds'] > max_seconds:
+        pytest.fail(f'{name}: {measured["seconds"]:.4f}s exceed the baseline of {baseline["seconds"]:.4f}s '
+                    f'(max. {max_seconds:.4f}s)')
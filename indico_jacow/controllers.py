@@ -7,64 +7,73 @@
 
 import csv
 import io
-from collections import defaultdict
-from statistics import mean, pstdev
+import secrets
 
-from flask import jsonify, session
+from flask import flash, jsonify, redirect, request, session
 from flask_pluginengine import current_plugin
-from marshmallow import fields
-from sqlalchemy.orm import load_only
-from werkzeug.exceptions import Forbidden
+from marshmallow import fields, validate
+from werkzeug.exceptions import Forbidden, NotFound, TooManyRequests, Unauthorized
 
-from indico.core.db import db
 from indico.core.errors import UserValueError
+from indico.core.plugins import url_for_plugin
 from indico.modules.events.abstracts.controllers.abstract_list import RHManageAbstractsExportActionsBase
 from indico.modules.events.abstracts.controllers.base import RHAbstractsBase
-from indico.modules.events.abstracts.models.review_ratings import AbstractReviewRating
-from indico.modules.events.abstracts.models.reviews import AbstractReview
-from indico.modules.events.abstracts.util import generate_spreadsheet_from_abstracts, get_track_reviewer_abstract_counts
+from indico.modules.events.abstracts.models.abstracts import Abstract
+from indico.modules.events.abstracts.models.review_questions import AbstractReviewQuestion
+from indico.modules.events.abstracts.util import get_track_reviewer_abstract_counts
 from indico.modules.events.contributions.controllers.management import RHManageContributionsExportActionsBase
-from indico.modules.events.contributions.util import generate_spreadsheet_from_contributions
+from indico.modules.events.contributions.util import has_contributions_with_user_as_submitter
+from indico.modules.events.controllers.base import RHDisplayEventBase
 from indico.modules.events.management.controllers import RHManageEventBase
 from indico.modules.events.papers.controllers.base import RHManagePapersBase
-from indico.modules.events.tracks.models.tracks import Track
+from indico.modules.events.papers.notifications import notify_added_to_reviewing_team
+from indico.modules.events.papers.settings import PaperReviewingRole, paper_reviewing_settings
+from indico.modules.logs.models.entries import EventLogRealm, LogKind
 from indico.modules.users import User
-from indico.modules.users.models.affiliations import Affiliation
 from indico.modules.users.schemas import AffiliationSchema
-from indico.modules.users.util import search_affiliations
 from indico.util.countries import get_countries, get_country
-from indico.util.date_time import now_utc
-from indico.util.i18n import _
+from indico.util.i18n import _, orig_string
 from indico.util.marshmallow import not_empty, validate_with_message
 from indico.util.spreadsheets import send_csv, send_xlsx
-from indico.util.string import remove_accents, str_to_ascii, validate_email
+from indico.util.string import remove_accents, str_to_ascii
 from indico.web.args import use_args, use_kwargs
-from indico.web.flask.util import url_for
 from indico.web.rh import RH, RHProtected
 
-from indico_jacow.views import WPAbstractsStats, WPDisplayAbstractsStatistics
+from indico_jacow.analytics import REPORT_SOURCES, get_affiliation_report, get_contribution_ids_by_affiliation
+from indico_jacow.exports import (ABSTRACT_COLUMN_GROUPS, CONTRIBUTION_COLUMN_GROUPS, generate_abstracts_spreadsheet,
+                                  generate_contributions_spreadsheet)
+from indico_jacow.instrumentation import get_prometheus_metrics, instrumented_phase
+from indico_jacow.task import prewarm_event_statistics, schedule_affiliation_search_bump
+from indico_jacow.util import (PEER_REVIEW_CSV_PROGRESS_TTL, affiliation_creation_rate_limiter, assign_event_permission,
+                               compute_abstracts_statistics, create_affiliation, generate_statistics_spreadsheet,
+                               get_abstracts_in_tracks_counts, get_boolean_questions, get_event_affiliations,
+                               get_positive_answer_counts, get_prewarmed_statistics, get_review_counts, get_reviewers,
+                               get_track_hierarchy, iter_csv_users, peer_review_csv_progress_cache,
+                               serialize_statistics, serialize_stats_table, statistics_cache)
+from indico_jacow.views import WPAbstractsStats, WPAffiliationReport, WPDisplayAbstractsStatistics
 
 
-def _get_boolean_questions(event):
-    return [question
-            for question in event.abstract_review_questions
-            if not question.is_deleted and question.field_type == 'bool']
+PAPER_TEAM_ROLES = {
+    'judges': PaperReviewingRole.judge,
+    'content_reviewers': PaperReviewingRole.content_reviewer,
+}
 
 
-def _get_question_counts(question, user):
-    counts = (AbstractReviewRating.query
-              .filter_by(question=question)
-              .filter(AbstractReviewRating.value[()].astext == 'true')
-              .join(AbstractReview)
-              .filter_by(user=user)
-              .with_entities(AbstractReview.track_id, db.func.count())
-              .group_by(AbstractReview.track_id)
-              .all())
-    counts = {Track.query.get(track): count for track, count in counts}
-    counts['total'] = sum(counts.values())
-    for group in question.event.track_groups:
-        counts[group] = sum(counts[track] for track in group.tracks if track in counts)
-    return counts
+def _get_csv_progress_key(event, token):
+    # the token comes from the client, so the key is scoped to the user importing the file
+    return f'{event.id}-{session.user.id}-{token}'
+
+
+def _get_question_counts(questions, user, hierarchy):
+    counts = get_positive_answer_counts(questions, user)
+    result = {}
+    for question in questions:
+        track_counts = counts[question.id].get(user.id, {})
+        group_counts = hierarchy.rollup(track_counts)
+        result[question] = {**{hierarchy.tracks_by_id[track_id]: count for track_id, count in track_counts.items()},
+                            **{hierarchy.groups[group_id]: count for group_id, count in group_counts.items()},
+                            'total': sum(track_counts.values())}
+    return result
 
 
 class RHDisplayAbstractsStatistics(RHAbstractsBase):
@@ -74,210 +83,318 @@ class RHDisplayAbstractsStatistics(RHAbstractsBase):
         RHAbstractsBase._check_access(self)
 
     def _process(self):
-        def _show_item(item):
-            if item.is_track_group:
-                return any(track.can_review_abstracts(session.user) for track in item.tracks)
-            else:
-                return item.can_review_abstracts(session.user)
-
-        track_reviewer_abstract_count = get_track_reviewer_abstract_counts(self.event, session.user)
-        for group in self.event.track_groups:
-            track_reviewer_abstract_count[group] = {}
-            for attr in ('total', 'reviewed', 'unreviewed'):
-                track_reviewer_abstract_count[group][attr] = sum(track_reviewer_abstract_count[track][attr]
-                                                                 for track in group.tracks
-                                                                 if track.can_review_abstracts(session.user))
-        list_items = [item for item in self.event.get_sorted_tracks() if _show_item(item)]
-        question_counts = {question: _get_question_counts(question, session.user)
-                           for question in _get_boolean_questions(self.event)}
-        return WPDisplayAbstractsStatistics.render_template('reviewer_stats.html', self.event,
-                                                            abstract_count=track_reviewer_abstract_count,
-                                                            list_items=list_items, question_counts=question_counts)
+        with instrumented_phase('aggregation'):
+            hierarchy = get_track_hierarchy(self.event)
+            reviewable = {track for track in hierarchy.tracks if track.can_review_abstracts(session.user)}
+            track_reviewer_abstract_count = get_track_reviewer_abstract_counts(self.event, session.user)
+            group_counts = hierarchy.rollup({track.id: track_reviewer_abstract_count[track] for track in reviewable})
+            track_reviewer_abstract_count.update({hierarchy.groups[group_id]: counts
+                                                  for group_id, counts in group_counts.items()})
+            list_items = [item for item in hierarchy.list_items
+                          if (item.is_track_group and item.id in group_counts) or item in reviewable]
+            question_counts = _get_question_counts(get_boolean_questions(self.event), session.user, hierarchy)
+        with instrumented_phase('rendering'):
+            return WPDisplayAbstractsStatistics.render_template('reviewer_stats.html', self.event,
+                                                                abstract_count=track_reviewer_abstract_count,
+                                                                list_items=list_items,
+                                                                question_counts=question_counts)
 
 
 class RHAbstractsStats(RHManageEventBase):
-    """Display reviewing statistics for a given event."""
+    """Display reviewing statistics for a given event.
+
+    The reviewer tables are rendered on the client using the data
+    from :class:`RHAbstractsStatsData`.
+    """
 
     def _process(self):
-        query = (AbstractReview.query
-                 .filter(AbstractReview.abstract.has(event=self.event))
-                 .options(load_only('user_id')))
-        reviewers = sorted({r.user for r in query}, key=lambda x: x.display_full_name.lower())
-        list_items = [item for item in self.event.get_sorted_tracks() if not item.is_track_group or item.tracks]
-        review_counts = {
-            user: {
-                track: counts['reviewed']
-                for track, counts in get_track_reviewer_abstract_counts(self.event, user).items()
-            }
-            for user in reviewers
-        }
-        for user_review_counts in review_counts.values():
-            user_review_counts['total'] = sum(user_review_counts.values())
-            for group in self.event.track_groups:
-                user_review_counts[group] = sum(user_review_counts[track] for track in group.tracks)
-
-        # get the positive answers to boolean questions
-        questions = _get_boolean_questions(self.event)
-        question_counts = {}
-        for question in questions:
-            question_counts[question] = {}
-            for user in reviewers:
-                question_counts[question][user] = _get_question_counts(question, user)
-
-        abstracts_in_tracks_attrs = {
-            'submitted_for': lambda t: len(t.abstracts_submitted),
-            'moved_to': lambda t: len(t.abstracts_reviewed - t.abstracts_submitted),
-            'final_proposals': lambda t: len(t.abstracts_reviewed),
-        }
-        abstracts_in_tracks = {track: {k: v(track) for k, v in abstracts_in_tracks_attrs.items()}
-                               for track in self.event.tracks}
-        abstracts_in_tracks.update({group: {k: sum(abstracts_in_tracks[track][k] for track in group.tracks)
-                                            for k in abstracts_in_tracks_attrs}
-                                    for group in self.event.track_groups})
-        return WPAbstractsStats.render_template('abstracts_stats.html', self.event, reviewers=reviewers,
-                                                list_items=list_items, review_counts=review_counts,
-                                                questions=questions, question_counts=question_counts,
-                                                abstracts_in_tracks=abstracts_in_tracks)
-
-
-def _append_affiliation_data_fields(headers, rows, items):
-    def make_address(affiliation):
-        address = ' '.join(filter(None, (affiliation.postcode, affiliation.city)))
-        return ', '.join(filter(None, (affiliation.street, address)))
-
-    def full_name_and_data(person, data):
-        data = '; '.join(data)
-        return f'{person.full_name} ({data})' if data else person.full_name
-
-    def full_name_and_country(person):
-        return full_name_and_data(person, [ja.affiliation.country_code for ja in person.jacow_affiliations])
-
-    def full_name_and_address(person):
-        return full_name_and_data(person, [make_address(ja.affiliation) for ja in person.jacow_affiliations])
-
-    headers.extend(('Speakers (country)', 'Speakers (address)', 'Primary authors (country)',
-                    'Primary authors (address)', 'Co-Authors (country)', 'Co-Authors (address)'))
-
-    for idx, item in enumerate(items):
-        rows[idx]['Speakers (country)'] = [full_name_and_country(a) for a in item.speakers]
-        rows[idx]['Speakers (address)'] = [full_name_and_address(a) for a in item.speakers]
-        rows[idx]['Primary authors (country)'] = [full_name_and_country(a) for a in item.primary_authors]
-        rows[idx]['Primary authors (address)'] = [full_name_and_address(a) for a in item.primary_authors]
-        rows[idx]['Co-Authors (country)'] = [full_name_and_country(a) for a in item.secondary_authors]
-        rows[idx]['Co-Authors (address)'] = [full_name_and_address(a) for a in item.secondary_authors]
+        with instrumented_phase('aggregation'):
+            hierarchy = get_track_hierarchy(self.event)
+            questions = [{'id': q.id, 'title': q.title} for q in get_boolean_questions(self.event)]
+            prewarmed = get_prewarmed_statistics(self.event)
+            if prewarmed:
+                track_counts = prewarmed['abstracts_in_tracks']
+            else:
+                track_counts = get_abstracts_in_tracks_counts(self.event)
+            abstracts_in_tracks = {track: track_counts[track.id] for track in hierarchy.tracks}
+            abstracts_in_tracks.update({hierarchy.groups[group_id]: counts
+                                        for group_id, counts in hierarchy.rollup(track_counts).items()})
+        with instrumented_phase('rendering'):
+            return WPAbstractsStats.render_template('abstracts_stats.html', self.event,
+                                                    list_items=hierarchy.list_items,
+                                                    questions=questions, abstracts_in_tracks=abstracts_in_tracks,
+                                                    computed_dt=prewarmed['computed_dt'] if prewarmed else None,
+                                                    prewarm_enabled=current_plugin.event_settings.get(
+                                                        self.event, 'prewarm_statistics'))
+
+
+class RHAbstractsStatsData(RHManageEventBase):
+    """Provide the data of a reviewer statistics table as JSON.
+
+    Without a question this returns the number of reviews per reviewer
+    and track, otherwise the number of positive answers to the given
+    boolean question.
+    """
+
+    def _process_args(self):
+        RHManageEventBase._process_args(self)
+        question_id = request.view_args['question_id']
+        self.question = None
+        if question_id is not None:
+            self.question = (AbstractReviewQuestion.query.with_parent(self.event)
+                             .filter_by(id=question_id, field_type='bool')
+                             .first_or_404())
 
+    def _process(self):
+        with instrumented_phase('aggregation'):
+            prewarmed = get_prewarmed_statistics(self.event)
+            if self.question is None:
+                counts = prewarmed['review_counts'] if prewarmed else get_review_counts(self.event)
+            elif prewarmed:
+                counts = prewarmed['positive_answer_counts'][self.question.id]
+            else:
+                counts = get_positive_answer_counts([self.question])[self.question.id]
+            data = serialize_stats_table(get_track_hierarchy(self.event), get_reviewers(self.event), counts)
+        with instrumented_phase('rendering'):
+            return jsonify(data)
 
-class RHAbstractsExportBase(RHManageAbstractsExportActionsBase):
-    def get_ratings(self, abstract):
-        result = defaultdict(list)
-        for review in abstract.reviews:
-            for rating in review.ratings:
-                result[rating.question].append(rating)
-        return result
 
-    def _generate_spreadsheet(self):
-        export_config = self.list_generator.get_list_export_config()
-        headers, rows = generate_spreadsheet_from_abstracts(self.abstracts, export_config['static_item_ids'],
-                                                            export_config['dynamic_items'])
-        _append_affiliation_data_fields(headers, rows, self.abstracts)
-
-        def get_question_column(title, value):
-            return f'Question {title} ({value!s})'
-
-        questions = [question for question in self.event.abstract_review_questions if not question.is_deleted]
-        for question in questions:
-            if question.field_type == 'rating':
-                headers.append(get_question_column(question.title, 'total count'))
-                headers.append(get_question_column(question.title, 'AVG score'))
-                headers.append(get_question_column(question.title, 'STD deviation'))
-            elif question.field_type == 'bool':
-                for answer in [True, False, None]:
-                    headers.append(get_question_column(question.title, answer))
-        headers.append('URL')
-
-        for idx, abstract in enumerate(self.abstracts):
-            ratings = self.get_ratings(abstract)
-            for question in questions:
-                if question.field_type == 'rating':
-                    scores = [r.value for r in ratings.get(question, [])
-                              if not r.question.no_score and r.value is not None]
-                    rows[idx][get_question_column(question.title, 'total count')] = len(scores)
-                    rows[idx][get_question_column(question.title, 'AVG score')] = (round(mean(scores), 1)
-                                                                                   if scores else '')
-                    rows[idx][get_question_column(question.title, 'STD deviation')] = (round(pstdev(scores), 1)
-                                                                                       if len(scores) >= 2 else '')
-                elif question.field_type == 'bool':
-                    for answer in [True, False, None]:
-                        count = len([v for v in ratings.get(question, []) if v.value == answer])
-                        rows[idx][get_question_column(question.title, answer)] = count
-            rows[idx]['URL'] = url_for('abstracts.display_abstract', abstract, management=False, _external=True)
+class RHAbstractsStatsExportBase(RHManageEventBase):
+    """Export the reviewing statistics of an event."""
+
+    def _compute_statistics(self):
+        return compute_abstracts_statistics(self.event, use_prewarmed=True)
+
+
+class RHAbstractsStatsPrewarm(RHManageEventBase):
+    """Enable or disable the periodic precomputation of the CfA statistics."""
+
+    @use_kwargs({'enabled': fields.Bool(required=True)}, location='form')
+    def _process(self, enabled):
+        current_plugin.event_settings.set(self.event, 'prewarm_statistics', enabled)
+        if enabled:
+            prewarm_event_statistics.delay(self.event.id)
+            flash(_('The statistics will be computed periodically.'), 'success')
+        else:
+            statistics_cache.delete(str(self.event.id))
+            flash(_('The statistics will be computed on demand.'), 'success')
+        return redirect(url_for_plugin('.abstracts_stats', self.event))
+
+
+class RHAbstractsStatsExportCSV(RHAbstractsStatsExportBase):
+    def _process(self):
+        with instrumented_phase('aggregation'):
+            headers, rows = generate_statistics_spreadsheet(self._compute_statistics())
+        with instrumented_phase('rendering'):
+            return send_csv('abstracts_statistics.csv', headers, rows)
+
 
+class RHAbstractsStatsExportExcel(RHAbstractsStatsExportBase):
+    def _process(self):
+        with instrumented_phase('aggregation'):
+            headers, rows = generate_statistics_spreadsheet(self._compute_statistics())
+        with instrumented_phase('rendering'):
+            return send_xlsx('abstracts_statistics.xlsx', headers, rows)
+
+
+class RHAbstractsStatsExportJSON(RHAbstractsStatsExportBase):
+    def _process(self):
+        with instrumented_phase('aggregation'):
+            data = serialize_statistics(self._compute_statistics())
+        with instrumented_phase('rendering'):
+            return jsonify(data)
+
+
+class RHAffiliationReportBase(RHManageEventBase):
+    """Base class for the affiliation analytics report of an event."""
+
+    def _process_args(self):
+        RHManageEventBase._process_args(self)
+        self.source = request.args.get('source', REPORT_SOURCES[0])
+        if self.source not in REPORT_SOURCES:
+            raise NotFound
+
+    def _generate_spreadsheet(self, report):
+        headers = ['Group', 'Name', 'Country', 'Authors', 'Countries', 'Affiliations']
+        rows = [{'Group': 'Country', 'Name': c['country_name'], 'Country': c['country_code'],
+                 'Authors': c['authors']}
+                for c in report['countries']]
+        rows += [{'Group': 'Affiliation', 'Name': a['name'], 'Country': a['country_code'], 'Authors': a['authors']}
+                 for a in report['affiliations']]
+        rows += [{'Group': 'Track', 'Name': t['title'] or 'No track', 'Authors': t['authors'],
+                  'Countries': t['countries'], 'Affiliations': t['affiliations']}
+                 for t in report['tracks']]
         return headers, rows
 
 
+class RHAffiliationReport(RHAffiliationReportBase):
+    """Display the number of authors per country, affiliation and track."""
+
+    def _process(self):
+        with instrumented_phase('aggregation'):
+            report = get_affiliation_report(self.event, self.source)
+        with instrumented_phase('rendering'):
+            return WPAffiliationReport.render_template('affiliation_report.html', self.event, report=report,
+                                                       source=self.source, sources=REPORT_SOURCES)
+
+
+class RHAffiliationReportExportCSV(RHAffiliationReportBase):
+    def _process(self):
+        with instrumented_phase('aggregation'):
+            headers, rows = self._generate_spreadsheet(get_affiliation_report(self.event, self.source))
+        with instrumented_phase('rendering'):
+            return send_csv(f'affiliations_{self.source}.csv', headers, rows)
+
+
+class RHAffiliationReportExportExcel(RHAffiliationReportBase):
+    def _process(self):
+        with instrumented_phase('aggregation'):
+            headers, rows = self._generate_spreadsheet(get_affiliation_report(self.event, self.source))
+        with instrumented_phase('rendering'):
+            return send_xlsx(f'affiliations_{self.source}.xlsx', headers, rows)
+
+
+class RHContributionAffiliationFilterOptions(RHManageEventBase):
+    """Provide the affiliations and countries of the contribution authors."""
+
+    def _process(self):
+        report = get_affiliation_report(self.event, 'contributions')
+        return jsonify(affiliations=[{'id': a['id'], 'name': a['name'], 'country_code': a['country_code']}
+                                     for a in report['affiliations']],
+                       countries=[{'code': c['country_code'], 'name': c['country_name']}
+                                  for c in report['countries']])
+
+
+class RHContributionsByAffiliation(RHManageEventBase):
+    """Look up the contributions with an author from some affiliations or countries."""
+
+    @use_kwargs({
+        'affiliation_ids': fields.List(fields.Int(), data_key='affiliation_id', load_default=lambda: []),
+        'country_codes': fields.List(fields.String(), data_key='country', load_default=lambda: []),
+    }, location='query')
+    def _process(self, affiliation_ids, country_codes):
+        with instrumented_phase('aggregation'):
+            contribution_ids = get_contribution_ids_by_affiliation(self.event, affiliation_ids, country_codes)
+        return jsonify(contribution_ids=sorted(contribution_ids))
+
+
+def _get_excluded_column_groups(available):
+    """Get the column groups the user excluded from an extended export."""
+    return set(request.args.getlist('exclude')) & set(available)
+
+
+class RHAbstractsExportBase(RHManageAbstractsExportActionsBase):
+    def _generate_spreadsheet(self):
+        export_config = self.list_generator.get_list_export_config()
+        return generate_abstracts_spreadsheet(self.event, self.abstracts, export_config['static_item_ids'],
+                                              export_config['dynamic_items'],
+                                              _get_excluded_column_groups(ABSTRACT_COLUMN_GROUPS))
+
+
 class RHAbstractsExportCSV(RHAbstractsExportBase):
     def _process(self):
-        return send_csv('abstracts.csv', *self._generate_spreadsheet())
+        with instrumented_phase('aggregation'):
+            headers, rows = self._generate_spreadsheet()
+        with instrumented_phase('rendering'):
+            return send_csv('abstracts.csv', headers, rows)
 
 
 class RHAbstractsExportExcel(RHAbstractsExportBase):
     def _process(self):
-        return send_xlsx('abstracts.xlsx', *self._generate_spreadsheet())
+        with instrumented_phase('aggregation'):
+            headers, rows = self._generate_spreadsheet()
+        with instrumented_phase('rendering'):
+            return send_xlsx('abstracts.xlsx', headers, rows)
 
 
 class RHContributionsExportBase(RHManageContributionsExportActionsBase):
     def _generate_spreadsheet(self):
-        headers, rows = generate_spreadsheet_from_contributions(self.contribs)
-        _append_affiliation_data_fields(headers, rows, self.contribs)
-        return headers, rows
+        return generate_contributions_spreadsheet(self.contribs,
+                                                  _get_excluded_column_groups(CONTRIBUTION_COLUMN_GROUPS))
 
 
 class RHContributionsExportCSV(RHContributionsExportBase):
     def _process(self):
-        return send_csv('contributions.csv', *self._generate_spreadsheet())
+        with instrumented_phase('aggregation'):
+            headers, rows = self._generate_spreadsheet()
+        with instrumented_phase('rendering'):
+            return send_csv('contributions.csv', headers, rows)
 
 
 class RHContributionsExportExcel(RHContributionsExportBase):
     def _process(self):
-        return send_xlsx('contributions.xlsx', *self._generate_spreadsheet())
+        with instrumented_phase('aggregation'):
+            headers, rows = self._generate_spreadsheet()
+        with instrumented_phase('rendering'):
+            return send_xlsx('contributions.xlsx', headers, rows)
 
 
-class RHPeerReviewCSVImport(RHManagePapersBase):
-    @use_kwargs({'file': fields.Raw(required=True)}, location='files')
-    def _process(self, file):
-        file_content = file.read().decode('utf-8')
-        csv_file = io.StringIO(file_content)
-        reader = csv.DictReader(csv_file)
+class RHPeerReviewTeamBase(RHManagePapersBase):
+    def _process_args(self):
+        RHManagePapersBase._process_args(self)
+        self.role = PAPER_TEAM_ROLES[request.view_args['team']]
+        if self.role == PaperReviewingRole.content_reviewer and not self.event.cfp.content_reviewing_enabled:
+            raise NotFound
 
-        if 'Email' not in reader.fieldnames:
-            raise UserValueError(_('The CSV file is missing the "Email" column.'))
 
-        emails = set()
-        for num_row, row in enumerate(reader, 1):
-            email = row['Email'].strip().lower()
+class RHPeerReviewCSVImport(RHPeerReviewTeamBase):
+    """Add the users listed in a CSV file to a paper reviewing team.
 
-            if email and not validate_email(email):
-                raise UserValueError(_('Row {row}: invalid email address: {email}').format(row=num_row, email=email))
-            if email in emails:
-                raise UserValueError(_('Row {}: email address is not unique').format(num_row))
-            emails.add(email)
+    The file is processed in chunks and only the users who are added
+    are written, so this works for very large teams as well.  The client
+    may pass a random `progress_token` to poll the progress of the
+    import using :class:`RHPeerReviewCSVImportProgress`.
+    """
 
-        users = set(User.query.filter(~User.is_deleted, User.all_emails.in_(emails)))
-        users_emails = {user.email for user in users}
-
-        if not emails:
+    @use_kwargs({'file': fields.Raw(required=True)}, location='files')
+    @use_kwargs({'progress_token': fields.String(load_default=None, validate=validate.Length(max=64))},
+                location='form')
+    def _process(self, file, progress_token):
+        csv_file = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        # counting the lines is only used for the progress, so it does not matter that
+        # quoted values may contain newlines as well
+        total = max(sum(1 for __ in csv_file) - 1, 0)
+        csv_file.seek(0)
+        reader = csv.DictReader(csv_file)
+        if 'Email' not in (reader.fieldnames or ()):
+            raise UserValueError(_('The CSV file is missing the "Email" column.'))
+        progress_key = _get_csv_progress_key(self.event, progress_token) if progress_token else None
+        processed = 0
+        user_ids = set()
+        unknown_emails = set()
+        for num_rows, chunk_user_ids, chunk_unknown_emails in iter_csv_users(reader):
+            processed += num_rows
+            user_ids |= chunk_user_ids
+            unknown_emails |= chunk_unknown_emails
+            if progress_key:
+                peer_review_csv_progress_cache.set(progress_key, {'processed': processed,
+                                                                  'total': max(total, processed)},
+                                                   timeout=PEER_REVIEW_CSV_PROGRESS_TTL)
+        if not user_ids and not unknown_emails:
             raise UserValueError(_('The "Email" column of the CSV is empty'))
-        if not users_emails:
+        if not user_ids:
             raise UserValueError(_('No users found with the emails provided'))
+        added = assign_event_permission(self.event, user_ids, self.role.acl_permission)
+        if self.role in paper_reviewing_settings.get(self.event, 'notify_on_added_to_event'):
+            for user in User.query.filter(User.id.in_(added)):
+                notify_added_to_reviewing_team(user, self.role, self.event)
+        self.event.log(EventLogRealm.reviewing, LogKind.positive, 'Papers',
+                       f'Imported {orig_string(self.role.title)} team members from CSV', session.user,
+                       data={'Added': len(added), 'Already in the team': len(user_ids) - len(added),
+                             'Unknown emails': len(unknown_emails)})
+        return jsonify(added=len(added), existing=len(user_ids) - len(added), unknown=len(unknown_emails))
 
-        unknown_emails = emails - users_emails
 
-        identifiers = [user.identifier for user in users]
+class RHPeerReviewCSVImportProgress(RHPeerReviewTeamBase):
+    """Get the progress of a running paper reviewing team CSV import."""
 
-        return jsonify({
-            'identifiers': identifiers,
-            'unknown_emails': list(unknown_emails)
-        })
+    def _process_args(self):
+        RHPeerReviewTeamBase._process_args(self)
+        self.token = request.view_args['token']
+
+    def _process(self):
+        progress = peer_review_csv_progress_cache.get(_get_csv_progress_key(self.event, self.token))
+        return jsonify(progress or {'processed': 0, 'total': 0})
 
 
 class RHCountries(RH):
@@ -285,6 +402,32 @@ class RHCountries(RH):
         return jsonify(sorted(get_countries().items(), key=lambda x: str_to_ascii(remove_accents(x[1]))))
 
 
+class RHEventAffiliations(RHDisplayEventBase):
+    """Provide the affiliations already used in an event.
+
+    The affiliation selector loads them once per form to suggest them
+    without searching.  Since they include the affiliations of all
+    authors, only users who may edit author lists in the event (managers
+    and abstract or contribution submitters) can see them.
+    """
+
+    def _check_access(self):
+        RHDisplayEventBase._check_access(self)
+        if session.user is None:
+            raise Forbidden
+        if not self._can_edit_person_links(session.user):
+            raise Forbidden
+
+    def _can_edit_person_links(self, user):
+        return (self.event.can_manage(user, permission='submit')
+                or self.event.cfa.can_submit_abstracts(user)
+                or Abstract.query.with_parent(self.event).filter_by(submitter=user, is_deleted=False).has_rows()
+                or has_contributions_with_user_as_submitter(self.event, user))
+
+    def _process(self):
+        return AffiliationSchema(many=True).jsonify(get_event_affiliations(self.event))
+
+
 class RHCreateAffiliation(RHProtected):
     @use_args({
         'name': fields.String(required=True, validate=not_empty),
@@ -295,17 +438,25 @@ class RHCreateAffiliation(RHProtected):
                                                                      'Invalid country')),
     })
     def _process(self, data):
-        aff = Affiliation.get_or_create_from_data(data)
-        if aff in db.session:
-            # already exists -> just use that one
-            return AffiliationSchema().jsonify(aff)
-        aff.meta = {
-            'created_by': session.user.id,
-            'created_dt': now_utc(False).isoformat(),
-            'verified': False,
-        }
-        db.session.add(aff)
-        db.session.flush()
-        current_plugin.logger.info('Affiliation %r created by %r', aff, session.user)
-        search_affiliations.bump_version()
+        if not affiliation_creation_rate_limiter.hit():
+            raise TooManyRequests(_('You created too many affiliations. Please try again later.'))
+        aff, created = create_affiliation(data, session.user)
+        if created:
+            current_plugin.logger.info('Affiliation %r created by %r', aff, session.user)
+            schedule_affiliation_search_bump()
         return AffiliationSchema().jsonify(aff)
+
+
+class RHMetrics(RH):
+    """Expose the instrumentation counters in the Prometheus format."""
+
+    def _check_access(self):
+        if not current_plugin.settings.get('instrumentation_enabled'):
+            raise NotFound
+        token = current_plugin.settings.get('metrics_token')
+        auth = request.headers.get('Authorization', '')
+        if not token or not secrets.compare_digest(auth, f'Bearer {token}'):
+            raise Unauthorized
+
+    def _process(self):
+        return get_prometheus_metrics(), {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
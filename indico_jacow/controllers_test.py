@@ -5,9 +5,12 @@
 # them and/or modify them under the terms of the MIT License; see
 # the LICENSE file for more details.
 
+import io
+
 import pytest
-from flask import g
+from flask import g, session
 from marshmallow import EXCLUDE
+from werkzeug.exceptions import Forbidden
 
 from indico.modules.events.abstracts.lists import AbstractListGeneratorManagement
 from indico.modules.events.abstracts.models.abstracts import Abstract
@@ -17,7 +20,10 @@ from indico.modules.events.abstracts.models.reviews import AbstractAction, Abstr
 from indico.modules.events.contributions.models.persons import ContributionPersonLink
 from indico.modules.events.tracks import Track
 from indico.modules.users.models.affiliations import Affiliation
+from indico.web.flask.util import url_for
 
+from indico_jacow.controllers import (RHAbstractsExportBase, RHEventAffiliations, RHPeerReviewCSVImport,
+                                      RHPeerReviewCSVImportProgress)
 from indico_jacow.models.affiliations import ContributionAffiliation
 
 
@@ -41,6 +47,7 @@ def test_person_link_schema_pre_load_ignores_core_affiliation_for_jacow_affiliat
         'affiliation': affiliation_text,
         'affiliation_id': affiliations[0].id,
         'jacow_affiliations_ids': [affiliation.id for affiliation in affiliations],
+        'jacow_orig_affiliations_ids': [affiliations[0].id],
     }
 
     with app.test_request_context():
@@ -48,6 +55,7 @@ def test_person_link_schema_pre_load_ignores_core_affiliation_for_jacow_affiliat
         person_link_data = PersonLinkSchema(unknown=EXCLUDE).load(data)
 
         assert g.jacow_affiliations_ids == {'ada@example.com': [affiliation.id for affiliation in affiliations]}
+        assert g.jacow_orig_affiliations_ids == {'ada@example.com': [affiliations[0].id]}
         assert person_link_data['affiliation'] == affiliation_text
 
 
@@ -69,6 +77,17 @@ def test_person_link_schema_post_dump_omits_core_affiliation_for_jacow_affiliati
         assert 'affiliation_id' not in data[0]
         assert 'affiliation_meta' not in data[0]
         assert data[0]['jacow_affiliations_ids'] == [affiliation.id]
+        assert data[0]['jacow_orig_affiliations_ids'] == [affiliation.id]
+        assert data[0]['jacow_affiliations_meta'][0]['name'] == 'Affiliation One'
+
+
+def _generate_abstracts_spreadsheet(app, data, query_string=''):
+    rh = RHAbstractsExportBase()
+    rh.event = data.event
+    rh.abstracts = data.abstracts
+    with app.test_request_context(query_string=query_string):
+        rh.list_generator = AbstractListGeneratorManagement(event=data.event)
+        return rh._generate_spreadsheet()
 
 
 @pytest.mark.parametrize(('reviews', 'expected'), (
@@ -80,7 +99,6 @@ def test_person_link_schema_post_dump_omits_core_affiliation_for_jacow_affiliati
      (1, 5, '', 0, 1, 1)),
 ))
 def test_get_abstracts(db, app, dummy_event, dummy_user, reviews, expected):
-    from indico_jacow.controllers import RHAbstractsExportBase
     rh = RHAbstractsExportBase()
     dummy_abstract = Abstract(friendly_id=314,
                               title='Broken Symmetry and the Mass of Gauge Vector Mesons',
@@ -114,3 +132,67 @@ def test_get_abstracts(db, app, dummy_event, dummy_user, reviews, expected):
         assert rows[0][f'Question {bool_question.title} (True)'] == expected[3]
         assert rows[0][f'Question {bool_question.title} (False)'] == expected[4]
         assert rows[0][f'Question {bool_question.title} (None)'] == expected[5]
+
+
+def test_abstracts_export_url_template(app, create_synthetic_event):
+    data = create_synthetic_event(abstracts=3)
+    __, rows = _generate_abstracts_spreadsheet(app, data)
+    with app.test_request_context():
+        expected = [url_for('abstracts.display_abstract', abstract, management=False, _external=True)
+                    for abstract in data.abstracts]
+    assert [row['URL'] for row in rows] == expected
+
+
+def test_abstracts_export_excluded_columns(app, create_synthetic_event):
+    data = create_synthetic_event(abstracts=5, questions=2)
+    full_headers, __ = _generate_abstracts_spreadsheet(app, data)
+    query_string = 'exclude=ratings&exclude=url&exclude=affiliation_addresses'
+    headers, rows = _generate_abstracts_spreadsheet(app, data, query_string)
+    assert 'URL' in full_headers
+    assert 'URL' not in headers
+    assert not any(h.startswith('Question ') for h in headers)
+    assert not any(h.endswith('(address)') for h in headers)
+    assert 'Speakers (country)' in headers
+    assert all(set(row) >= {'Speakers (country)', 'Co-Authors (country)'} for row in rows)
+
+
+def test_event_affiliations_access(app, dummy_event, create_user):
+    manager = create_user(1)
+    submitter = create_user(2)
+    other = create_user(3)
+    dummy_event.update_principal(manager, full_access=True)
+    dummy_event.update_principal(submitter, permissions={'submit'})
+    rh = RHEventAffiliations()
+    rh.event = dummy_event
+    with app.test_request_context():
+        with pytest.raises(Forbidden):
+            rh._check_access()
+        for user in (manager, submitter):
+            session.set_session_user(user)
+            rh._check_access()
+        session.set_session_user(other)
+        with pytest.raises(Forbidden):
+            rh._check_access()
+
+
+def test_peer_review_csv_import(app, dummy_event, create_user):
+    from indico.modules.events.papers.settings import PaperReviewingRole
+    judge = create_user(1, email='judge@example.test')
+    create_user(2, email='newcomer@example.test')
+    dummy_event.update_principal(judge, permissions={'paper_judge'})
+    csv_data = b'Email\njudge@example.test\nnewcomer@example.test\nunknown@example.test\n'
+    data = {'file': (io.BytesIO(csv_data), 'team.csv'), 'progress_token': 'token'}
+    rh = RHPeerReviewCSVImport()
+    rh.event = dummy_event
+    rh.role = PaperReviewingRole.judge
+    with app.test_request_context(method='POST', data=data):
+        session.set_session_user(judge)
+        resp = rh._process()
+    assert resp.json == {'added': 1, 'existing': 1, 'unknown': 1}
+    assert {entry.user_id for entry in dummy_event.acl_entries if 'paper_judge' in entry.permissions} == {1, 2}
+    rh = RHPeerReviewCSVImportProgress()
+    rh.event = dummy_event
+    rh.token = 'token'
+    with app.test_request_context():
+        session.set_session_user(judge)
+        assert rh._process().json == {'processed': 3, 'total': 3}
@@ -0,0 +1,223 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import csv
+import json
+import os
+import tempfile
+from collections import defaultdict
+from statistics import mean, pstdev
+
+from indico.modules.events import Event
+from indico.modules.events.abstracts.models.abstracts import Abstract
+from indico.modules.events.abstracts.util import generate_spreadsheet_from_abstracts
+from indico.modules.events.contributions.models.contributions import Contribution
+from indico.modules.events.contributions.util import generate_spreadsheet_from_contributions, sort_contribs
+from indico.util.spreadsheets import _prepare_csv_data
+from indico.web.flask.util import url_for
+
+from indico_jacow.models.affiliations import AbstractAffiliation, ContributionAffiliation
+from indico_jacow.util import AffiliationFormatter
+
+
+#: The column groups which can be excluded from abstract exports
+ABSTRACT_COLUMN_GROUPS = ('affiliation_countries', 'affiliation_addresses', 'ratings', 'url')
+#: The column groups which can be excluded from contribution exports
+CONTRIBUTION_COLUMN_GROUPS = ('affiliation_countries', 'affiliation_addresses')
+#: The static abstract list items included in bulk exports
+BULK_EXPORT_ABSTRACT_ITEMS = ('state', 'submitter', 'speakers', 'authors', 'coauthors', 'accepted_track',
+                              'submitted_for_tracks', 'reviewed_for_tracks', 'accepted_contrib_type',
+                              'submitted_contrib_type', 'score', 'submitted_dt', 'modified_dt')
+#: The number of abstracts/contributions loaded at once during bulk exports
+BULK_EXPORT_CHUNK_SIZE = 500
+#: The abstract id used to build the abstract URL template
+_URL_PLACEHOLDER_ID = 2147483647
+
+
+def append_affiliation_data_fields(headers, rows, items, association_cls, *, countries=True, addresses=True):
+    if not countries and not addresses:
+        return
+    person_links = [pl for item in items for pl in item.person_links]
+    formatter = AffiliationFormatter(person_links, association_cls)
+    columns = []
+    for title, attr in (('Speakers', 'speakers'), ('Primary authors', 'primary_authors'),
+                        ('Co-Authors', 'secondary_authors')):
+        if countries:
+            columns.append((f'{title} (country)', attr, formatter.full_name_and_country))
+        if addresses:
+            columns.append((f'{title} (address)', attr, formatter.full_name_and_address))
+
+    headers.extend(column for column, __, __ in columns)
+
+    for idx, item in enumerate(items):
+        for column, attr, format_person_link in columns:
+            rows[idx][column] = [format_person_link(a) for a in getattr(item, attr)]
+
+
+def _get_ratings(abstract):
+    result = defaultdict(list)
+    for review in abstract.reviews:
+        for rating in review.ratings:
+            result[rating.question].append(rating)
+    return result
+
+
+def _get_abstract_url_template(event):
+    url = url_for('abstracts.display_abstract', event_id=event.id, abstract_id=_URL_PLACEHOLDER_ID,
+                  management=False, _external=True)
+    return url.rsplit(str(_URL_PLACEHOLDER_ID), 1)
+
+
+def generate_abstracts_spreadsheet(event, abstracts, static_item_ids, dynamic_items, excluded=frozenset()):
+    """Generate the extended export of abstracts.
+
+    :param event: The event containing the abstracts
+    :param abstracts: The abstracts to export
+    :param static_item_ids: The abstract properties to be used as columns
+    :param dynamic_items: Contribution fields as extra columns
+    :param excluded: The column groups (see :data:`ABSTRACT_COLUMN_GROUPS`)
+                     which are left out
+    """
+    headers, rows = generate_spreadsheet_from_abstracts(abstracts, list(static_item_ids), dynamic_items)
+    append_affiliation_data_fields(headers, rows, abstracts, AbstractAffiliation,
+                                   countries='affiliation_countries' not in excluded,
+                                   addresses='affiliation_addresses' not in excluded)
+
+    def get_question_column(title, value):
+        return f'Question {title} ({value!s})'
+
+    questions = []
+    if 'ratings' not in excluded:
+        questions = [question for question in event.abstract_review_questions if not question.is_deleted]
+    for question in questions:
+        if question.field_type == 'rating':
+            headers.append(get_question_column(question.title, 'total count'))
+            headers.append(get_question_column(question.title, 'AVG score'))
+            headers.append(get_question_column(question.title, 'STD deviation'))
+        elif question.field_type == 'bool':
+            for answer in [True, False, None]:
+                headers.append(get_question_column(question.title, answer))
+    if 'url' not in excluded:
+        headers.append('URL')
+        url_prefix, url_suffix = _get_abstract_url_template(event)
+
+    for idx, abstract in enumerate(abstracts):
+        ratings = _get_ratings(abstract) if questions else {}
+        for question in questions:
+            if question.field_type == 'rating':
+                scores = [r.value for r in ratings.get(question, [])
+                          if not r.question.no_score and r.value is not None]
+                rows[idx][get_question_column(question.title, 'total count')] = len(scores)
+                rows[idx][get_question_column(question.title, 'AVG score')] = (round(mean(scores), 1)
+                                                                               if scores else '')
+                rows[idx][get_question_column(question.title, 'STD deviation')] = (round(pstdev(scores), 1)
+                                                                                   if len(scores) >= 2 else '')
+            elif question.field_type == 'bool':
+                for answer in [True, False, None]:
+                    count = len([v for v in ratings.get(question, []) if v.value == answer])
+                    rows[idx][get_question_column(question.title, answer)] = count
+        if 'url' not in excluded:
+            rows[idx]['URL'] = f'{url_prefix}{abstract.id}{url_suffix}'
+
+    return headers, rows
+
+
+def generate_contributions_spreadsheet(contributions, excluded=frozenset()):
+    """Generate the extended export of contributions.
+
+    :param contributions: The contributions to export
+    :param excluded: The column groups (see :data:`CONTRIBUTION_COLUMN_GROUPS`)
+                     which are left out
+    """
+    # the core export sorts the rows, so the items need to be in the same order
+    contributions = sort_contribs(contributions, sort_by='friendly_id')
+    headers, rows = generate_spreadsheet_from_contributions(contributions)
+    append_affiliation_data_fields(headers, rows, contributions, ContributionAffiliation,
+                                   countries='affiliation_countries' not in excluded,
+                                   addresses='affiliation_addresses' not in excluded)
+    return headers, rows
+
+
+def _iter_export_chunks(event, export_type, chunk_size):
+    model = Abstract if export_type == 'abstracts' else Contribution
+    ids = [id_ for id_, in (model.query.with_parent(event)
+                            .filter(~model.is_deleted)
+                            .order_by(model.friendly_id)
+                            .with_entities(model.id))]
+    for i in range(0, len(ids), chunk_size):
+        yield model.query.filter(model.id.in_(ids[i:i + chunk_size])).order_by(model.friendly_id).all()
+
+
+def _add_header_titles(titles, headers):
+    """Map the headers of an export chunk to unique column titles.
+
+    Dynamic columns use `unique_col` tuples as headers since e.g. two
+    custom fields may have the same title; those get their id appended
+    to the title so they do not end up in the same column.
+    """
+    for header in headers:
+        if header in titles:
+            continue
+        title = header[0] if isinstance(header, tuple) else header
+        if title in titles.values():
+            title = f'{title} ({header[1] if isinstance(header, tuple) else len(titles)})'
+        titles[header] = title
+
+
+def export_event(event_id, export_type, output_dir, excluded=frozenset(), chunk_size=BULK_EXPORT_CHUNK_SIZE):
+    """Export the abstracts or contributions of an event to a CSV file.
+
+    The items are exported in chunks of `chunk_size` and the rows are
+    buffered in a temporary file, so the memory usage does not depend
+    on the size of the event.
+
+    :return: A tuple containing the path of the CSV file, its headers and
+             the number of rows
+    """
+    event = Event.get(event_id, is_deleted=False)
+    if event is None:
+        raise ValueError(f'Event {event_id} does not exist')
+    if export_type == 'abstracts':
+        dynamic_items = event.contribution_fields.filter_by(is_active=True).all()
+    titles = {}
+    num_rows = 0
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as buf:
+        for items in _iter_export_chunks(event, export_type, chunk_size):
+            if export_type == 'abstracts':
+                chunk_headers, rows = generate_abstracts_spreadsheet(event, items, BULK_EXPORT_ABSTRACT_ITEMS,
+                                                                     dynamic_items, excluded)
+            else:
+                chunk_headers, rows = generate_contributions_spreadsheet(items, excluded)
+            _add_header_titles(titles, chunk_headers)
+            for row in rows:
+                buf.write(json.dumps({titles[k]: _prepare_csv_data(v) for k, v in row.items()}) + '\n')
+            num_rows += len(rows)
+        buf.seek(0)
+        path = os.path.join(output_dir, f'{export_type}-{event_id}.csv')
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(titles.values()), restval='')
+            writer.writeheader()
+            writer.writerows(json.loads(line) for line in buf)
+    return path, list(titles.values()), num_rows
+
+
+def merge_exports(path, results):
+    """Merge the CSV files created by :func:`export_event` into one file.
+
+    :param path: The path of the merged CSV file
+    :param results: A dict mapping event ids to the return values of
+                    :func:`export_event`
+    """
+    headers = {'Event ID': None}
+    for __, event_headers, __ in results.values():
+        headers.update(dict.fromkeys(event_headers))
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(headers), restval='')
+        writer.writeheader()
+        for event_id, (event_path, __, __) in sorted(results.items()):
+            with open(event_path, encoding='utf-8-sig', newline='') as event_file:
+                writer.writerows({'Event ID': event_id, **row} for row in csv.DictReader(event_file))
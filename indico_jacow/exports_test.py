@@ -0,0 +1,48 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import csv
+
+import pytest
+
+from indico_jacow.exports import _add_header_titles, export_event, merge_exports
+
+
+def _read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize('export_type', ('abstracts', 'contributions'))
+def test_export_event_chunks(app, tmp_path, create_synthetic_event, export_type):
+    data = create_synthetic_event(abstracts=7, contributions=True)
+    with app.test_request_context():
+        path, headers, num_rows = export_event(data.event.id, export_type, str(tmp_path), chunk_size=3)
+        rows = _read_csv(path)
+        __, unchunked_headers, __ = export_event(data.event.id, export_type, str(tmp_path), chunk_size=100)
+    assert num_rows == len(rows) == 7
+    assert headers == unchunked_headers
+    assert [int(row['Id']) for row in rows] == list(range(1, 8))
+    assert all(row['Speakers (country)'] for row in rows)
+
+
+def test_merge_exports(app, tmp_path, create_synthetic_event):
+    events = [create_synthetic_event(abstracts=n, contributions=True).event for n in (2, 3)]
+    with app.test_request_context():
+        results = {event.id: export_event(event.id, 'contributions', str(tmp_path)) for event in events}
+    merged_path = tmp_path / 'merged.csv'
+    merge_exports(merged_path, results)
+    rows = _read_csv(merged_path)
+    assert len(rows) == 5
+    assert [int(row['Event ID']) for row in rows] == [events[0].id] * 2 + [events[1].id] * 3
+
+
+def test_add_header_titles():
+    titles = {}
+    _add_header_titles(titles, ['Id', ('Field', 1), ('Field', 2)])
+    _add_header_titles(titles, ['Id', ('Field', 2), ('Other', 3)])
+    assert titles == {'Id': 'Id', ('Field', 1): 'Field', ('Field', 2): 'Field (2)', ('Other', 3): 'Other'}
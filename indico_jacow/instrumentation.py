@@ -0,0 +1,179 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request
+
+from indico.web.flask.stats import get_request_stats
+
+
+_metrics_lock = threading.Lock()
+_request_metrics = defaultdict(lambda: {'count': 0, 'slow': 0, 'duration': 0.0, 'queries': 0, 'query_duration': 0.0})
+_phase_metrics = defaultdict(lambda: {'count': 0, 'duration': 0.0, 'queries': 0})
+_signal_metrics = defaultdict(lambda: {'count': 0, 'duration': 0.0, 'queries': 0})
+
+
+def _instrumentation_enabled():
+    from indico_jacow.plugin import JACOWPlugin
+    if not has_request_context():
+        # signal handlers may also run outside requests, e.g. when loading the CLI
+        return False
+    if 'jacow_instrumentation_enabled' not in g:
+        g.jacow_instrumentation_enabled = JACOWPlugin.settings.get('instrumentation_enabled')
+    return g.jacow_instrumentation_enabled
+
+
+def _sql_stats():
+    stats = get_request_stats()
+    return stats['query_count'], stats['query_duration']
+
+
+def start_request_instrumentation():
+    """Start collecting timing information for the current request."""
+    if not _instrumentation_enabled():
+        return
+    query_count, query_duration = _sql_stats()
+    g.jacow_request_timing = {'start': time.perf_counter(), 'query_count': query_count,
+                              'query_duration': query_duration, 'phases': {}}
+
+
+def finish_request_instrumentation(exc=None):
+    """Record the metrics of the current request and log it if it was slow."""
+    from indico_jacow.plugin import JACOWPlugin
+    timing = g.pop('jacow_request_timing', None)
+    if timing is None:
+        return
+    duration = time.perf_counter() - timing['start']
+    query_count, query_duration = _sql_stats()
+    query_count -= timing['query_count']
+    query_duration -= timing['query_duration']
+    threshold = JACOWPlugin.settings.get('slow_request_threshold') / 1000
+    is_slow = duration >= threshold
+    endpoint = request.endpoint
+    with _metrics_lock:
+        metrics = _request_metrics[endpoint]
+        metrics['count'] += 1
+        metrics['slow'] += is_slow
+        metrics['duration'] += duration
+        metrics['queries'] += query_count
+        metrics['query_duration'] += query_duration
+        for name, (phase_duration, phase_queries) in timing['phases'].items():
+            phase_metrics = _phase_metrics[(endpoint, name)]
+            phase_metrics['count'] += 1
+            phase_metrics['duration'] += phase_duration
+            phase_metrics['queries'] += phase_queries
+    if is_slow:
+        phases = ', '.join(f'{name}={phase_duration * 1000:.0f}ms/{phase_queries}q'
+                           for name, (phase_duration, phase_queries) in timing['phases'].items())
+        JACOWPlugin.logger.warning('Slow request to %s: %.0fms total, %d queries taking %.0fms (%s)',
+                                   request.full_path, duration * 1000, query_count, query_duration * 1000,
+                                   phases or 'no phases')
+
+
+@contextmanager
+def instrumented_phase(name):
+    """Measure a phase (e.g. aggregation or rendering) of the current request.
+
+    This is a no-op unless instrumentation is enabled and the request
+    is handled by one of the plugin's RHs.
+    """
+    timing = g.get('jacow_request_timing')
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    start_queries = _sql_stats()[0]
+    try:
+        yield
+    finally:
+        previous_duration, previous_queries = timing['phases'].get(name, (0, 0))
+        timing['phases'][name] = (previous_duration + time.perf_counter() - start,
+                                  previous_queries + _sql_stats()[0] - start_queries)
+
+
+def instrumented_signal_handler(func):
+    """Wrap a signal handler so its calls are timed when instrumentation is enabled.
+
+    Calls outside a request are never timed.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _instrumentation_enabled():
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        start_queries = _sql_stats()[0]
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            queries = _sql_stats()[0] - start_queries
+            with _metrics_lock:
+                metrics = _signal_metrics[name]
+                metrics['count'] += 1
+                metrics['duration'] += duration
+                metrics['queries'] += queries
+
+    return wrapper
+
+
+def _escape_label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_metric(name, type_, help_, samples):
+    lines = [f'# HELP {name} {help_}', f'# TYPE {name} {type_}']
+    for labels, value in samples:
+        label_str = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+        lines.append(f'{name}{{{label_str}}} {value}')
+    return lines
+
+
+def get_prometheus_metrics():
+    """Return the collected metrics in the Prometheus text exposition format.
+
+    Note that the counters are kept in memory, so each worker process
+    exposes its own counters.
+    """
+    with _metrics_lock:
+        requests = {k: dict(v) for k, v in _request_metrics.items()}
+        phases = {k: dict(v) for k, v in _phase_metrics.items()}
+        signals = {k: dict(v) for k, v in _signal_metrics.items()}
+    request_metrics = (
+        ('requests_total', 'Number of handled requests', 'count'),
+        ('slow_requests_total', 'Number of requests above the slow request threshold', 'slow'),
+        ('request_duration_seconds_total', 'Total time spent handling requests', 'duration'),
+        ('request_sql_queries_total', 'Number of SQL queries executed by requests', 'queries'),
+        ('request_sql_duration_seconds_total', 'Total time spent in SQL queries by requests', 'query_duration'),
+    )
+    lines = []
+    for name, help_, key in request_metrics:
+        lines += _format_metric(f'indico_jacow_{name}', 'counter', help_,
+                                [({'endpoint': endpoint}, metrics[key]) for endpoint, metrics in requests.items()])
+    phase_metrics = (
+        ('phase_duration_seconds_total', 'Total time spent in a request phase', 'duration'),
+        ('phase_sql_queries_total', 'Number of SQL queries executed in a request phase', 'queries'),
+    )
+    for name, help_, key in phase_metrics:
+        lines += _format_metric(f'indico_jacow_{name}', 'counter', help_,
+                                [({'endpoint': endpoint, 'phase': phase}, metrics[key])
+                                 for (endpoint, phase), metrics in phases.items()])
+    signal_metrics = (
+        ('signal_handler_calls_total', 'Number of signal handler calls', 'count'),
+        ('signal_handler_duration_seconds_total', 'Total time spent in signal handlers', 'duration'),
+        ('signal_handler_sql_queries_total', 'Number of SQL queries executed by signal handlers', 'queries'),
+    )
+    for name, help_, key in signal_metrics:
+        lines += _format_metric(f'indico_jacow_{name}', 'counter', help_,
+                                [({'handler': handler}, metrics[key]) for handler, metrics in signals.items()])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,76 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+from flask import g
+
+from indico.web.flask.stats import request_stats_request_started
+
+from indico_jacow.instrumentation import (finish_request_instrumentation, get_prometheus_metrics, instrumented_phase,
+                                          instrumented_signal_handler, start_request_instrumentation)
+
+
+def test_request_instrumentation(db, app, mocker):
+    from indico_jacow.plugin import JACOWPlugin
+    JACOWPlugin.settings.set('slow_request_threshold', 0)
+    logger = mocker.patch.object(JACOWPlugin, 'logger')
+    with app.test_request_context('/event/1/manage/abstracts/statistics'):
+        request_stats_request_started()
+        g.jacow_instrumentation_enabled = True
+        start_request_instrumentation()
+        with instrumented_phase('aggregation'):
+            db.session.execute(db.text('SELECT 1'))
+            db.session.execute(db.text('SELECT 2'))
+        with instrumented_phase('rendering'):
+            pass
+        assert g.jacow_request_timing['phases']['aggregation'][1] == 2
+        assert g.jacow_request_timing['phases']['rendering'][1] == 0
+        finish_request_instrumentation()
+        assert 'jacow_request_timing' not in g
+        del g.jacow_instrumentation_enabled
+
+    assert logger.warning.call_args.args[1] == '/event/1/manage/abstracts/statistics?'
+    metrics = get_prometheus_metrics()
+    assert 'indico_jacow_requests_total{endpoint="plugin_jacow.abstracts_stats"}' in metrics
+    assert ('indico_jacow_phase_sql_queries_total{endpoint="plugin_jacow.abstracts_stats",phase="aggregation"} 2'
+            in metrics)
+
+
+def test_signal_handler_instrumentation(app):
+    @instrumented_signal_handler
+    def _dummy_handler(sender, **kwargs):
+        return sender
+
+    with app.test_request_context():
+        g.jacow_instrumentation_enabled = False
+        assert _dummy_handler('x') == 'x'
+        assert 'handler="_dummy_handler"' not in get_prometheus_metrics()
+        g.jacow_instrumentation_enabled = True
+        assert _dummy_handler('y') == 'y'
+        assert 'indico_jacow_signal_handler_calls_total{handler="_dummy_handler"} 1' in get_prometheus_metrics()
+        del g.jacow_instrumentation_enabled
+        assert _dummy_handler('z') == 'z'
+
+    # calls outside a request (e.g. from the CLI) are not timed
+    assert _dummy_handler('cli') == 'cli'
+    assert 'indico_jacow_signal_handler_calls_total{handler="_dummy_handler"} 1' in get_prometheus_metrics()
+
+
+def test_instrumentation_setting_loaded_once(app, mocker):
+    from indico_jacow.plugin import JACOWPlugin
+    JACOWPlugin.settings.set('instrumentation_enabled', True)
+    get_setting = mocker.spy(JACOWPlugin.settings, 'get')
+
+    @instrumented_signal_handler
+    def _other_handler(sender, **kwargs):
+        pass
+
+    with app.test_request_context():
+        _other_handler('a')
+        _other_handler('b')
+        assert g.jacow_instrumentation_enabled
+    assert get_setting.call_count == 1
+    assert 'indico_jacow_signal_handler_calls_total{handler="_other_handler"} 2' in get_prometheus_metrics()
@@ -0,0 +1,318 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from types import SimpleNamespace
+
+from indico.core.db import db
+from indico.core.plugins import url_for_plugin
+from indico.modules.events import Event
+from indico.modules.events.abstracts.models.abstracts import Abstract
+from indico.modules.events.abstracts.models.persons import AbstractPersonLink
+from indico.modules.events.contributions.models.contributions import Contribution
+from indico.modules.events.contributions.models.persons import AuthorType, ContributionPersonLink
+from indico.modules.events.features.util import set_feature_enabled
+from indico.modules.events.models.events import EventType
+from indico.modules.events.models.persons import EventPerson
+from indico.modules.events.tracks.models.tracks import Track
+from indico.modules.users.models.affiliations import Affiliation
+from indico.util.date_time import now_utc
+from indico.web.flask.util import url_for
+
+from indico_jacow.models.affiliations import AbstractAffiliation, ContributionAffiliation
+
+
+#: The load test scenarios and how often they are picked relative to each other
+SCENARIO_WEIGHTS = {
+    'submit_abstract': 3,
+    'create_affiliation': 1,
+    'search_affiliations': 6,
+    'reviewer_statistics': 2,
+    'export_abstracts': 1,
+    'export_contributions': 1,
+}
+#: The latency percentiles included in the report
+LATENCY_PERCENTILES = (50, 95, 99)
+#: How often the DB connection usage is sampled (in seconds)
+CONNECTION_SAMPLE_INTERVAL = 0.1
+#: How many of the abstracts/contributions are selected in an export
+EXPORT_SIZE = 50
+
+_COUNTRY_CODES = ('CH', 'FR', 'DE', 'US', 'JP', 'CN', 'IT', 'GB')
+
+
+def _make_person_links(link_cls, association_cls, persons, affiliations, rng, authors):
+    links = []
+    for i, person in enumerate(rng.sample(persons, authors)):
+        link = link_cls(person=person, is_speaker=(i == 0),
+                        author_type=(AuthorType.primary if i == 0 else AuthorType.secondary))
+        link.jacow_affiliations = [association_cls(affiliation=affiliation, display_order=n)
+                                   for n, affiliation in enumerate(rng.sample(affiliations, 2))]
+        links.append(link)
+    return links
+
+
+def create_load_test_event(category, user, tag, *, abstracts=200, tracks=8, affiliations=50, authors=4, seed=None):
+    """Create a conference with an open CfA and synthetic abstracts and contributions.
+
+    Everything created by the load test is named after `tag`, so it can
+    be told apart from real data and removed again using
+    :func:`delete_load_test_event`.  The user becomes manager of the
+    event and may review the abstracts in all tracks.
+    """
+    from indico_jacow.plugin import JACOWPlugin
+    rng = random.Random(seed)
+    now = now_utc()
+    event = Event(category=category, type_=EventType.conference, title=f'{tag} conference', creator=user,
+                  start_dt=now + timedelta(days=30), end_dt=now + timedelta(days=33), timezone='UTC')
+    db.session.flush()
+    event.update_principal(user, full_access=True, add_permissions={'abstract_reviewer', 'review_all_abstracts'})
+    set_feature_enabled(event, 'abstracts', True)
+    JACOWPlugin.event_settings.set(event, 'multiple_affiliations', True)
+    event.cfa.schedule(now - timedelta(days=1), now + timedelta(days=30), None)
+    track_objs = [Track(title=f'Track {i}', code=f'T{i}', event=event) for i in range(tracks)]
+    affiliation_objs = [Affiliation(name=f'{tag} affiliation {i}', city=f'City {i}',
+                                    country_code=_COUNTRY_CODES[i % len(_COUNTRY_CODES)])
+                        for i in range(affiliations)]
+    person_objs = [EventPerson(event=event, first_name='Author', last_name=str(i), email=f'author{i}@example.com')
+                   for i in range(max(abstracts, authors))]
+    abstract_objs = []
+    contribution_objs = []
+    for i in range(abstracts):
+        track = track_objs[i % tracks] if track_objs else None
+        abstract = Abstract(title=f'Abstract {i}', description='Load test', event=event, submitter=user,
+                            submitted_for_tracks={track} if track else set(),
+                            reviewed_for_tracks={track} if track else set())
+        abstract.person_links = _make_person_links(AbstractPersonLink, AbstractAffiliation, person_objs,
+                                                   affiliation_objs, rng, authors)
+        abstract_objs.append(abstract)
+        contrib = Contribution(title=f'Contribution {i}', event=event, track=track, duration=timedelta(minutes=20))
+        contrib.person_links = _make_person_links(ContributionPersonLink, ContributionAffiliation, person_objs,
+                                                  affiliation_objs, rng, authors)
+        contribution_objs.append(contrib)
+    db.session.flush()
+    return SimpleNamespace(tag=tag, event=event, track_ids=[t.id for t in track_objs],
+                           affiliations=[(a.id, a.name) for a in affiliation_objs],
+                           abstract_ids=[a.id for a in abstract_objs],
+                           contribution_ids=[c.id for c in contribution_objs])
+
+
+def delete_load_test_event(event, tag):
+    """Delete the event and the affiliations created for a load test."""
+    event.delete(f'{tag} finished')
+    Affiliation.query.filter(Affiliation.name.startswith(f'{tag} ')).update({Affiliation.is_deleted: True},
+                                                                            synchronize_session=False)
+
+
+class _VirtualUser:
+    """A user sending requests to the in-process application."""
+
+    def __init__(self, app, user, target, urls, rng):
+        self.target = target
+        self.urls = urls
+        self.rng = rng
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess.set_session_user(user)
+            self.csrf_token = sess.csrf_token
+
+    def submit_abstract(self):
+        # this exercises the `form_validated` handler of the plugin
+        affiliation_ids = [id_ for id_, __ in self.target.affiliations]
+        person_nums = self.rng.sample(range(100000), self.rng.randint(1, 5))
+        persons = [{'first_name': 'Author', 'last_name': str(num), 'email': f'author{num}@example.com',
+                    'roles': ['primary', 'speaker'] if i == 0 else ['secondary'],
+                    'jacow_affiliations_ids': self.rng.sample(affiliation_ids, self.rng.randint(1, 3))}
+                   for i, num in enumerate(person_nums)]
+        data = {'csrf_token': self.csrf_token, 'title': f'{self.target.tag} abstract', 'description': 'Load test',
+                'person_links': json.dumps(persons)}
+        if self.target.track_ids:
+            data['submitted_for_tracks'] = str(self.rng.choice(self.target.track_ids))
+        resp = self.client.post(self.urls['submit_abstract'], data=data)
+        # invalid forms are sent back with a 200 as well
+        return resp.status_code, resp.status_code == 200 and 'redirect' in (resp.json or {})
+
+    def create_affiliation(self):
+        # few distinct names, so concurrent requests often create the same affiliation
+        data = {'name': f'{self.target.tag} new affiliation {self.rng.randrange(10)}', 'city': 'Geneva',
+                'country_code': 'CH'}
+        resp = self.client.post(self.urls['create_affiliation'], json=data,
+                                headers={'X-CSRF-Token': self.csrf_token})
+        return resp.status_code, resp.status_code == 200
+
+    def search_affiliations(self):
+        __, name = self.rng.choice(self.target.affiliations)
+        resp = self.client.get(self.urls['search_affiliations'],
+                               query_string={'q': name[:self.rng.randint(3, len(name))]})
+        return resp.status_code, resp.status_code == 200
+
+    def reviewer_statistics(self):
+        resp = self.client.get(self.urls['reviewer_statistics'])
+        return resp.status_code, resp.status_code == 200
+
+    def export_abstracts(self):
+        ids = self.rng.sample(self.target.abstract_ids, min(EXPORT_SIZE, len(self.target.abstract_ids)))
+        resp = self.client.post(self.urls['export_abstracts'], data={'csrf_token': self.csrf_token,
+                                                                     'abstract_id': ids})
+        return resp.status_code, resp.status_code == 200
+
+    def export_contributions(self):
+        ids = self.rng.sample(self.target.contribution_ids, min(EXPORT_SIZE, len(self.target.contribution_ids)))
+        resp = self.client.post(self.urls['export_contributions'], data={'csrf_token': self.csrf_token,
+                                                                         'contribution_id': ids})
+        return resp.status_code, resp.status_code == 200
+
+
+class _ConnectionSampler(threading.Thread):
+    """Periodically sample the DB connections used during the load test."""
+
+    def __init__(self, app):
+        super().__init__(daemon=True)
+        self.app = app
+        self.stopped = threading.Event()
+        self.pool_size = None
+        self.checked_out = []
+        self.server_connections = []
+
+    def run(self):
+        query = db.text('SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database()')
+        with self.app.app_context(), db.engine.connect() as conn:
+            pool = db.engine.pool
+            self.pool_size = pool.size()
+            while not self.stopped.wait(CONNECTION_SAMPLE_INTERVAL):
+                # the connection used for sampling is not counted
+                self.checked_out.append(pool.checkedout() - 1)
+                self.server_connections.append(conn.execute(query).scalar() - 1)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return {
+            'pool_size': self.pool_size,
+            'peak_checked_out': max(self.checked_out, default=0),
+            'mean_checked_out': (sum(self.checked_out) / len(self.checked_out)) if self.checked_out else 0,
+            'peak_server_connections': max(self.server_connections, default=0),
+        }
+
+
+def percentile(values, pct):
+    """Get a percentile of the values using the nearest-rank method."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(pct / 100 * len(values)) - 1, 0)]
+
+
+def summarize_samples(samples, elapsed):
+    """Aggregate the timed requests of a load test.
+
+    :param samples: An iterable of ``(scenario, duration, status, ok)``
+                    tuples
+    :param elapsed: The duration of the load test in seconds
+    :return: A dict containing the overall and per-scenario throughput
+             (in requests per second), error counts and latencies (in
+             seconds)
+    """
+    durations = defaultdict(list)
+    errors = Counter()
+    statuses = defaultdict(Counter)
+    for scenario, duration, status, ok in samples:
+        durations[scenario].append(duration)
+        errors[scenario] += not ok
+        statuses[scenario][status] += 1
+
+    def _summarize(values, num_errors, status_counts=None):
+        summary = {'requests': len(values), 'errors': num_errors, 'throughput': len(values) / elapsed}
+        summary.update((f'p{pct}', percentile(values, pct)) for pct in LATENCY_PERCENTILES)
+        if status_counts is not None:
+            summary['statuses'] = dict(status_counts)
+        return summary
+
+    return {
+        'elapsed': elapsed,
+        'total': _summarize([d for values in durations.values() for d in values], sum(errors.values())),
+        'scenarios': {scenario: _summarize(values, errors[scenario], statuses[scenario])
+                      for scenario, values in sorted(durations.items())},
+    }
+
+
+def _get_urls(app, target):
+    with app.test_request_context():
+        return {
+            'submit_abstract': url_for('abstracts.submit', target.event),
+            'create_affiliation': url_for_plugin('jacow.create_affiliation'),
+            'search_affiliations': url_for('users.api_affiliations'),
+            'reviewer_statistics': url_for_plugin('jacow.reviewer_stats', target.event),
+            'export_abstracts': url_for_plugin('jacow.abstracts_csv_export_custom', target.event),
+            'export_contributions': url_for_plugin('jacow.contributions_csv_export_custom', target.event),
+        }
+
+
+def run_load_test(app, user, target, *, concurrency=20, duration=60, scenarios=SCENARIO_WEIGHTS, seed=None):
+    """Send requests to the plugin's endpoints from many threads at once.
+
+    The requests are handled in-process by `app`, but each thread has its
+    own DB session, so they use the connection pool and the database just
+    like the workers of a real server.
+
+    :param app: The Flask app
+    :param user: The user sending the requests
+    :param target: The event data returned by :func:`create_load_test_event`
+    :param concurrency: The number of threads sending requests
+    :param duration: For how long requests are sent (in seconds)
+    :param scenarios: A dict mapping the scenarios to use to their weights
+    :return: The report created by :func:`summarize_samples`, including
+             the DB connection usage in ``'db'``
+    """
+    urls = _get_urls(app, target)
+    names, weights = zip(*scenarios.items(), strict=True)
+    samples = []
+    samples_lock = threading.Lock()
+    ready = threading.Barrier(concurrency + 1)
+    deadline = None
+
+    def _run(n):
+        try:
+            virtual_user = _VirtualUser(app, user, target, urls, random.Random(f'{seed}-{n}'))
+        except Exception:
+            ready.abort()
+            raise
+        ready.wait()
+        while time.perf_counter() < deadline:
+            scenario = virtual_user.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status, ok = getattr(virtual_user, scenario)()
+            except Exception:
+                status, ok = None, False
+            sample = (scenario, time.perf_counter() - start, status, ok)
+            with samples_lock:
+                samples.append(sample)
+
+    threads = [threading.Thread(target=_run, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    sampler = _ConnectionSampler(app)
+    sampler.start()
+    try:
+        start = time.perf_counter()
+        deadline = start + duration
+        ready.wait()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        connection_usage = sampler.stop()
+    report = summarize_samples(samples, elapsed)
+    report['db'] = connection_usage
+    return report
@@ -0,0 +1,55 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import pytest
+
+from indico.modules.users.models.affiliations import Affiliation
+
+from indico_jacow.loadtest import create_load_test_event, delete_load_test_event, percentile, summarize_samples
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3, 6, 7, 8, 9, 10]
+    assert percentile(values, 50) == 5
+    assert percentile(values, 95) == 10
+    assert percentile(values, 10) == 1
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_summarize_samples():
+    samples = [('search', 100, 200, True), ('search', 300, 200, True), ('submit', 1000, 200, False),
+               ('search', 200, 429, False)]
+    report = summarize_samples(samples, 2)
+    assert report['total']['requests'] == 4
+    assert report['total']['errors'] == 2
+    assert report['total']['throughput'] == 2
+    assert report['total']['p50'] == 200
+    assert report['total']['p99'] == 1000
+    search = report['scenarios']['search']
+    assert search['throughput'] == pytest.approx(1.5)
+    assert search['statuses'] == {200: 2, 429: 1}
+    assert search['p50'] == 200
+    assert search['p95'] == 300
+    assert report['scenarios']['submit']['errors'] == 1
+
+
+def test_create_load_test_event(db, dummy_user, dummy_category):
+    target = create_load_test_event(dummy_category, dummy_user, 'Load test 0a1b2c', abstracts=5, tracks=2,
+                                    affiliations=4, authors=2, seed=42)
+    event = target.event
+    assert event.cfa.is_open
+    assert event.can_manage(dummy_user)
+    assert all(track.can_review_abstracts(dummy_user) for track in event.tracks)
+    assert len(target.abstract_ids) == len(target.contribution_ids) == 5
+    assert all(len(person_link.jacow_affiliations) == 2
+               for item in event.abstracts + event.contributions
+               for person_link in item.person_links)
+    delete_load_test_event(event, target.tag)
+    db.session.expire_all()
+    assert event.is_deleted
+    assert all(Affiliation.get(id_).is_deleted for id_, __ in target.affiliations)
@@ -0,0 +1,37 @@
+"""Add sync runs
+
+Revision ID: 4b2e9d61c7a3
+Revises: 7e432803e968
+Create Date: 2026-10-19 12:00:21.482913
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from indico.core.db.sqlalchemy import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision = '4b2e9d61c7a3'
+down_revision = '7e432803e968'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'sync_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('start_dt', UTCDateTime, nullable=False),
+        sa.Column('end_dt', UTCDateTime, nullable=True),
+        sa.Column('users_synced', sa.Integer(), nullable=False),
+        sa.Column('identities_added', sa.Integer(), nullable=False),
+        sa.Column('metrics', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        schema='plugin_jacow'
+    )
+
+
+def downgrade():
+    op.drop_table('sync_runs', schema='plugin_jacow')
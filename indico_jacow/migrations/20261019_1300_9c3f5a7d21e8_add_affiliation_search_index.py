@@ -0,0 +1,41 @@
+"""Add affiliation search index
+
+Revision ID: 9c3f5a7d21e8
+Revises: 4b2e9d61c7a3
+Create Date: 2026-10-19 13:00:42.194302
+"""
+
+from alembic import op
+
+from indico_jacow.models.affiliations import CREATE_AFFILIATION_SEARCH_VIEW_SQL, DROP_AFFILIATION_SEARCH_VIEW_SQL
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3f5a7d21e8'
+down_revision = '4b2e9d61c7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_abstract_affiliations_affiliation_id_person_link_id',
+        'abstract_affiliations',
+        ['affiliation_id', 'person_link_id'],
+        schema='plugin_jacow'
+    )
+    op.create_index(
+        'ix_contribution_affiliations_affiliation_id_person_link_id',
+        'contribution_affiliations',
+        ['affiliation_id', 'person_link_id'],
+        schema='plugin_jacow'
+    )
+    op.execute(CREATE_AFFILIATION_SEARCH_VIEW_SQL)
+
+
+def downgrade():
+    op.execute(DROP_AFFILIATION_SEARCH_VIEW_SQL)
+    op.drop_index('ix_contribution_affiliations_affiliation_id_person_link_id', table_name='contribution_affiliations',
+                  schema='plugin_jacow')
+    op.drop_index('ix_abstract_affiliations_affiliation_id_person_link_id', table_name='abstract_affiliations',
+                  schema='plugin_jacow')
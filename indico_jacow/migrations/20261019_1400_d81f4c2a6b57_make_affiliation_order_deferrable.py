@@ -0,0 +1,29 @@
+"""Make the affiliation order constraints deferrable
+
+Revision ID: d81f4c2a6b57
+Revises: 9c3f5a7d21e8
+Create Date: 2026-10-19 14:00:17.530918
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f4c2a6b57'
+down_revision = '9c3f5a7d21e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('abstract_affiliations', 'contribution_affiliations'):
+        op.drop_index(f'ix_uq_{table}_person_link_id_display_order', table_name=table, schema='plugin_jacow')
+        op.create_unique_constraint(f'uq_{table}_person_link_id_display_order', table,
+                                    ['person_link_id', 'display_order'], schema='plugin_jacow', deferrable=True)
+
+
+def downgrade():
+    for table in ('abstract_affiliations', 'contribution_affiliations'):
+        op.drop_constraint(f'uq_{table}_person_link_id_display_order', table, schema='plugin_jacow')
+        op.create_index(f'ix_uq_{table}_person_link_id_display_order', table, ['person_link_id', 'display_order'],
+                        unique=True, schema='plugin_jacow')
@@ -0,0 +1,27 @@
+"""Exclude non-authors from the affiliation search view
+
+Revision ID: 5f1b7c3e9a24
+Revises: d81f4c2a6b57
+Create Date: 2026-10-19 15:00:08.613207
+"""
+
+from alembic import op
+
+from indico_jacow.models.affiliations import CREATE_AFFILIATION_SEARCH_VIEW_SQL, DROP_AFFILIATION_SEARCH_VIEW_SQL
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1b7c3e9a24'
+down_revision = 'd81f4c2a6b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(DROP_AFFILIATION_SEARCH_VIEW_SQL)
+    op.execute(CREATE_AFFILIATION_SEARCH_VIEW_SQL)
+
+
+def downgrade():
+    # the previous revision creates the view from the same SQL
+    pass
@@ -5,12 +5,38 @@
 # them and/or modify them under the terms of the MIT License; see
 # the LICENSE file for more details.
 
+from sqlalchemy import DDL
+from sqlalchemy.event import listens_for
 from sqlalchemy.ext.declarative import declared_attr
 
 from indico.core.db.sqlalchemy import db
 from indico.util.string import format_repr
 
 
+#: The materialized view used to look up contributions by the affiliations
+#: and countries of their authors.  Like in the affiliation report, person
+#: links which are not authors (``AuthorType.none``) are ignored.  Since it
+#: depends on core tables, it needs to be dropped before an Indico database
+#: upgrade which modifies them (see ``indico jacow affiliation-search-view``).
+CREATE_AFFILIATION_SEARCH_VIEW_SQL = '''
+    CREATE MATERIALIZED VIEW plugin_jacow.contribution_affiliation_search AS
+    SELECT c.event_id, c.id AS contribution_id, ca.person_link_id, ca.affiliation_id, a.country_code
+    FROM plugin_jacow.contribution_affiliations ca
+    JOIN events.contribution_person_links cpl ON cpl.id = ca.person_link_id
+    JOIN events.contributions c ON c.id = cpl.contribution_id
+    JOIN indico.affiliations a ON a.id = ca.affiliation_id
+    WHERE NOT c.is_deleted AND cpl.author_type != 0;
+
+    CREATE UNIQUE INDEX ix_uq_contribution_affiliation_search_person_link_id_affiliation_id
+        ON plugin_jacow.contribution_affiliation_search (person_link_id, affiliation_id);
+    CREATE INDEX ix_contribution_affiliation_search_event_id_affiliation_id
+        ON plugin_jacow.contribution_affiliation_search (event_id, affiliation_id);
+    CREATE INDEX ix_contribution_affiliation_search_event_id_country_code
+        ON plugin_jacow.contribution_affiliation_search (event_id, country_code);
+'''
+DROP_AFFILIATION_SEARCH_VIEW_SQL = 'DROP MATERIALIZED VIEW IF EXISTS plugin_jacow.contribution_affiliation_search'
+
+
 class JACoWAffiliationBase(db.Model):
     """Base class for multiple affiliations associations."""
 
@@ -24,7 +50,9 @@ class JACoWAffiliationBase(db.Model):
 
     @declared_attr
     def __table_args__(cls):
-        return (db.Index(None, 'person_link_id', 'display_order', unique=True),
+        # deferrable, so the affiliations can be reordered in a single statement
+        return (db.UniqueConstraint('person_link_id', 'display_order', deferrable=True),
+                db.Index(None, 'affiliation_id', 'person_link_id'),
                 {'schema': 'plugin_jacow'})
 
     @declared_attr
@@ -97,3 +125,16 @@ class ContributionAffiliation(JACoWAffiliationBase):
     affiliations_backref_name = 'jacow_contribution_affiliations'
     person_link_fk = 'events.contribution_person_links.id'
     person_link_cls = 'ContributionPersonLink'
+
+
+@listens_for(ContributionAffiliation.__table__, 'after_create')
+def _add_affiliation_search_view(target, conn, **kw):
+    # the view is only refreshed when enabled in the plugin settings, but it needs to exist
+    # on databases created from the models (e.g. `indico db prepare`) just like after the
+    # migration creating it
+    conn.execute(DDL(CREATE_AFFILIATION_SEARCH_VIEW_SQL))
+
+
+@listens_for(ContributionAffiliation.__table__, 'before_drop')
+def _drop_affiliation_search_view(target, conn, **kw):
+    conn.execute(DDL(DROP_AFFILIATION_SEARCH_VIEW_SQL))
@@ -0,0 +1,67 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+from sqlalchemy.dialects.postgresql import JSONB
+
+from indico.core.db.sqlalchemy import UTCDateTime, db
+from indico.util.date_time import now_utc
+from indico.util.string import format_repr
+
+
+class SyncRun(db.Model):
+    """A run of the profile synchronization with the central database."""
+
+    __tablename__ = 'sync_runs'
+    __table_args__ = {'schema': 'plugin_jacow'}
+
+    #: The number of runs kept in the history
+    history_size = 50
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    start_dt = db.Column(
+        UTCDateTime,
+        nullable=False,
+        default=now_utc
+    )
+    end_dt = db.Column(
+        UTCDateTime,
+        nullable=True
+    )
+    #: The number of users refreshed from the central database
+    users_synced = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    #: The number of identities added to users who had none
+    identities_added = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    #: Phase durations, provider latencies, flush time and slowest users
+    metrics = db.Column(
+        JSONB,
+        nullable=False,
+        default={}
+    )
+
+    @property
+    def duration(self):
+        return (self.end_dt - self.start_dt) if self.end_dt else None
+
+    @classmethod
+    def prune_history(cls):
+        """Delete all but the most recent runs."""
+        keep = db.select([cls.id]).order_by(cls.start_dt.desc()).limit(cls.history_size)
+        cls.query.filter(~cls.id.in_(keep)).delete(synchronize_session=False)
+
+    def __repr__(self):
+        return format_repr(self, 'id', 'start_dt', 'users_synced', 'identities_added')
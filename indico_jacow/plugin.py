@@ -5,56 +5,64 @@
 # them and/or modify them under the terms of the MIT License; see
 # the LICENSE file for more details.
 
+import functools
 import os
 
 from flask import g, session
 from flask_pluginengine import render_plugin_template
-from wtforms.fields import BooleanField
+from wtforms.fields import BooleanField, IntegerField
+from wtforms.validators import NumberRange
 
 from indico.core import signals
 from indico.core.db import db
 from indico.core.plugins import IndicoPlugin, url_for_plugin
-from indico.modules.events.abstracts.fields import AbstractPersonLinkListField
-from indico.modules.events.abstracts.forms import AbstractForm
 from indico.modules.events.abstracts.models.persons import AbstractPersonLink
-from indico.modules.events.abstracts.views import WPDisplayAbstracts, WPManageAbstracts
-from indico.modules.events.contributions.fields import ContributionPersonLinkListField
-from indico.modules.events.contributions.forms import ContributionForm
 from indico.modules.events.contributions.models.persons import ContributionPersonLink
-from indico.modules.events.contributions.views import WPContributions, WPManageContributions, WPMyContributions
-from indico.modules.events.layout.util import MenuEntryData
-from indico.modules.events.models.persons import EventPerson
-from indico.modules.events.papers.views import WPManagePapers
-from indico.modules.events.persons.forms import ManagePersonListsForm
-from indico.modules.events.persons.schemas import PersonLinkSchema
-from indico.modules.events.registration.schemas import CheckinRegistrationSchema
-from indico.modules.events.timetable.views import WPManageTimetable
-from indico.modules.logs.controllers import RHUserLogs, RHUserLogsJSON
-from indico.modules.users import controllers as users_controllers
 from indico.util.i18n import _
 from indico.web.flask.util import url_for
 from indico.web.forms.base import IndicoForm
-from indico.web.forms.fields import PrincipalListField
+from indico.web.forms.fields import IndicoPasswordField, PrincipalListField
 from indico.web.forms.widgets import SwitchWidget
 from indico.web.menu import SideMenuItem, TopMenuItem
 
-from indico_jacow.blueprint import blueprint
-from indico_jacow.models.affiliations import AbstractAffiliation, ContributionAffiliation
-
-
-REPO_MANAGER_RHS = (
-    users_controllers.RHUsersAdmin,
-    users_controllers.RHUsersAdminCreate,
-    users_controllers.RHUsersAdminMerge,
-    users_controllers.RHUsersAdminMergeCheck,
-    users_controllers.RHAffiliationsDashboard,
-    users_controllers.RHAffiliationsAPI,
-    users_controllers.RHAffiliationAPI,
-    users_controllers.RHPersonalData,
-    users_controllers.RHPersonalDataUpdate,
-    RHUserLogs,
-    RHUserLogsJSON,
-)
+from indico_jacow.analytics import flush_stale_affiliation_reports, invalidate_affiliation_report
+from indico_jacow.instrumentation import instrumented_signal_handler
+from indico_jacow.models.affiliations import ContributionAffiliation
+from indico_jacow.models.sync_runs import SyncRun
+
+
+# The views, forms and controllers of Indico modules used below are imported
+# lazily, so e.g. Celery workers and CLI commands do not need to load them.
+
+@functools.cache
+def _get_repo_manager_rhs():
+    from indico.modules.logs.controllers import RHUserLogs, RHUserLogsJSON
+    from indico.modules.users import controllers as users_controllers
+    return (
+        users_controllers.RHUsersAdmin,
+        users_controllers.RHUsersAdminCreate,
+        users_controllers.RHUsersAdminMerge,
+        users_controllers.RHUsersAdminMergeCheck,
+        users_controllers.RHAffiliationsDashboard,
+        users_controllers.RHAffiliationsAPI,
+        users_controllers.RHAffiliationAPI,
+        users_controllers.RHPersonalData,
+        users_controllers.RHPersonalDataUpdate,
+        RHUserLogs,
+        RHUserLogsJSON,
+    )
+
+
+@functools.cache
+def _get_bundle_wps():
+    from indico.modules.events.abstracts.views import WPDisplayAbstracts, WPManageAbstracts
+    from indico.modules.events.contributions.views import WPContributions, WPManageContributions, WPMyContributions
+    from indico.modules.events.papers.views import WPManagePapers
+    from indico.modules.events.timetable.views import WPManageTimetable
+
+    from indico_jacow.views import WPAbstractsStats
+    return (WPAbstractsStats, WPContributions, WPDisplayAbstracts, WPManageAbstracts, WPManageContributions,
+            WPMyContributions, WPManagePapers, WPManageTimetable)
 
 
 class SettingsForm(IndicoForm):
@@ -63,6 +71,19 @@ class SettingsForm(IndicoForm):
     repo_managers = PrincipalListField(_('Central Repo Managers'), allow_groups=True,
                                        description=_('List of users who can manage Indico user profiles without being '
                                                      'full Indico admins'))
+    instrumentation_enabled = BooleanField(_('Instrumentation'), widget=SwitchWidget(),
+                                           description=_("Record SQL query counts and timings of the plugin's "
+                                                         'request and signal handlers'))
+    slow_request_threshold = IntegerField(_('Slow request threshold'), [NumberRange(min=0)],
+                                          description=_('Requests taking longer than this (in milliseconds) are '
+                                                        'logged with a breakdown of where the time was spent'))
+    affiliation_search_view = BooleanField(_('Affiliation search view'), widget=SwitchWidget(),
+                                           description=_('Use a periodically refreshed materialized view to look up '
+                                                         'contributions by affiliation or country. This is faster '
+                                                         'for large events, but results may be a few minutes old.'))
+    metrics_token = IndicoPasswordField(_('Metrics token'), toggle=True,
+                                        description=_('Bearer token required to access the Prometheus metrics '
+                                                      'endpoint (/api/jacow/metrics)'))
 
 
 class JACOWPlugin(IndicoPlugin):
@@ -75,44 +96,69 @@ class JACOWPlugin(IndicoPlugin):
     settings_form = SettingsForm
     default_settings = {
         'sync_enabled': False,
+        'instrumentation_enabled': False,
+        'slow_request_threshold': 2000,
+        'metrics_token': '',
+        'affiliation_search_view': False,
     }
     acl_settings = {
         'repo_managers',
     }
     default_event_settings = {
         'multiple_affiliations': False,
+        'prewarm_statistics': False,
     }
 
     def init(self):
         super().init()
         self.template_hook('abstract-list-options', self._inject_abstract_export_button)
         self.template_hook('contribution-list-options', self._inject_contribution_export_button)
+        self.template_hook('contribution-list-options', self._inject_contribution_affiliation_filter)
         self.template_hook('custom-affiliation', self._inject_custom_affiliation)
+        self.template_hook('plugin-details', self._inject_sync_runs)
+        self.connect(signals.plugin.cli, self._extend_indico_cli)
+        self.connect(signals.core.after_commit, self._flush_affiliation_reports)
         self.connect(signals.plugin.get_template_customization_paths, self._override_templates)
-        self.connect(signals.core.add_form_fields, self._add_person_lists_settings, sender=ManagePersonListsForm)
-        self.connect(signals.core.form_validated, self._person_lists_form_validated)
-        self.connect(signals.core.form_validated, self._submission_form_validated)
-        self.connect(signals.event.person_link_field_extra_params, self._person_link_field_extra_params)
-        self.connect(signals.event.person_required_fields, self._person_required_fields)
-        self.connect(signals.event.abstract_accepted, self._abstract_accepted)
+        self.connect(signals.core.add_form_fields, self._add_person_lists_settings)
+        self._connect_instrumented(signals.core.form_validated, self._person_lists_form_validated)
+        self._connect_instrumented(signals.core.form_validated, self._submission_form_validated)
+        self._connect_instrumented(signals.event.person_link_field_extra_params, self._person_link_field_extra_params)
+        self._connect_instrumented(signals.event.person_required_fields, self._person_required_fields)
+        self._connect_instrumented(signals.event.abstract_accepted, self._abstract_accepted)
         self.connect(signals.event.sidemenu, self._extend_event_menu)
-        self.connect(signals.event.contribution_created, self._contribution_created)
+        self._connect_instrumented(signals.event.contribution_created, self._contribution_created)
+        self.connect(signals.event.abstract_deleted, self._invalidate_affiliation_report)
+        self.connect(signals.event.contribution_deleted, self._invalidate_affiliation_report)
+        self.connect(signals.event.contribution_updated, self._invalidate_affiliation_report)
         self.connect(signals.event.cloned, self._event_cloned)
         self.connect(signals.event.imported, self._event_imported)
         self.connect(signals.menu.items, self._add_sidemenu_item, sender='event-management-sidemenu')
         self.connect(signals.menu.items, self._add_admin_sidemenu_repo_mgr, sender='admin-sidemenu')
         self.connect(signals.menu.items, self._add_user_sidemenu_repo_mgr, sender='user-profile-sidemenu')
         self.connect(signals.menu.items, self._add_top_menu_repo_mgr, sender='top-menu')
-        for rh_cls in REPO_MANAGER_RHS:
-            self.connect(signals.rh.before_check_access, self._before_check_access_repo_mgr, sender=rh_cls)
-        self.connect(signals.plugin.schema_pre_load, self._person_link_schema_pre_load, sender=PersonLinkSchema)
-        self.connect(signals.plugin.schema_post_dump, self._person_link_schema_post_dump, sender=PersonLinkSchema)
-        self.connect(signals.plugin.schema_post_dump, self._checkin_registration_schema_post_dump,
-                     sender=CheckinRegistrationSchema)
-        wps = (WPContributions, WPDisplayAbstracts, WPManageAbstracts, WPManageContributions,
-               WPMyContributions, WPManagePapers, WPManageTimetable)
-        self.inject_bundle('main.js', wps)
-        self.inject_bundle('main.css', wps)
+        self.connect(signals.rh.before_check_access, self._before_check_access_repo_mgr)
+        self._connect_instrumented(signals.plugin.schema_pre_load, self._person_link_schema_pre_load)
+        self._connect_instrumented(signals.plugin.schema_post_dump, self._person_link_schema_post_dump)
+        self._connect_instrumented(signals.plugin.schema_post_dump, self._checkin_registration_schema_post_dump)
+        self._inject_bundle_lazily('main.js')
+        self._inject_bundle_lazily('main.css')
+
+    def _connect_instrumented(self, signal, receiver, **connect_kwargs):
+        # only handlers running while processing a request are timed; the others (e.g. the
+        # CLI or startup ones) may run outside an app context
+        self.connect(signal, instrumented_signal_handler(receiver), **connect_kwargs)
+
+    def _inject_bundle_lazily(self, name):
+        # like `inject_bundle`, but the WP classes are only imported when a page is rendered
+        def _inject_bundle(sender, **kwargs):
+            if issubclass(sender, _get_bundle_wps()):
+                return self.manifest[name]
+
+        self.connect(signals.plugin.inject_bundle, _inject_bundle)
+
+    def _extend_indico_cli(self, sender, **kwargs):
+        from indico_jacow.cli import cli
+        return cli
 
     def _override_templates(self, sender, **kwargs):
         return os.path.join(self.root_path, 'template_overrides')
@@ -120,19 +166,42 @@ class JACOWPlugin(IndicoPlugin):
     def _inject_abstract_export_button(self, event=None):
         return render_plugin_template('export_button.html',
                                       csv_url=url_for_plugin('jacow.abstracts_csv_export_custom', event),
-                                      xlsx_url=url_for_plugin('jacow.abstracts_xlsx_export_custom', event))
+                                      xlsx_url=url_for_plugin('jacow.abstracts_xlsx_export_custom', event),
+                                      column_groups={'affiliation_countries': _('Affiliation countries'),
+                                                     'affiliation_addresses': _('Affiliation addresses'),
+                                                     'ratings': _('Review ratings'),
+                                                     'url': _('Abstract URL')})
 
     def _inject_contribution_export_button(self, event=None):
         return render_plugin_template('export_button.html',
                                       csv_url=url_for_plugin('jacow.contributions_csv_export_custom', event),
-                                      xlsx_url=url_for_plugin('jacow.contributions_xlsx_export_custom', event))
+                                      xlsx_url=url_for_plugin('jacow.contributions_xlsx_export_custom', event),
+                                      column_groups={'affiliation_countries': _('Affiliation countries'),
+                                                     'affiliation_addresses': _('Affiliation addresses')})
+
+    def _inject_contribution_affiliation_filter(self, event=None):
+        if not self.event_settings.get(event, 'multiple_affiliations'):
+            return
+        return render_plugin_template('contribution_affiliation_filter.html',
+                                      options_url=url_for_plugin('jacow.contributions_affiliation_filter_options',
+                                                                 event),
+                                      search_url=url_for_plugin('jacow.contributions_by_affiliation', event))
 
     def _inject_custom_affiliation(self, person):
         if (isinstance(person, (AbstractPersonLink, ContributionPersonLink)) and
                 self.event_settings.get(person.person.event, 'multiple_affiliations')):
             return render_plugin_template('custom_affiliation.html', person=person)
 
+    def _inject_sync_runs(self, plugin):
+        if plugin != self:
+            return
+        sync_runs = SyncRun.query.order_by(SyncRun.start_dt.desc()).limit(10).all()
+        return render_plugin_template('sync_runs.html', sync_runs=sync_runs)
+
     def _add_person_lists_settings(self, form_cls, form_kwargs, **kwargs):
+        from indico.modules.events.persons.forms import ManagePersonListsForm
+        if form_cls is not ManagePersonListsForm:
+            return
         multiple_affiliations = self.event_settings.get(g.rh.event, 'multiple_affiliations')
         return (
             'multiple_affiliations',
@@ -143,59 +212,58 @@ class JACOWPlugin(IndicoPlugin):
         )
 
     def _person_lists_form_validated(self, form, **kwargs):
+        from indico.modules.events.persons.forms import ManagePersonListsForm
+
+        from indico_jacow.util import backfill_affiliations
         if (not isinstance(form, ManagePersonListsForm) or
                 not form.ext__multiple_affiliations.data or
                 self.event_settings.get(g.rh.event, 'multiple_affiliations')):
             return
         self.event_settings.set(g.rh.event, 'multiple_affiliations', True)
         # Populate tables with the current affiliations
-        for target, source in ((AbstractAffiliation, AbstractPersonLink),
-                               (ContributionAffiliation, ContributionPersonLink)):
-            affiliation_id = db.func.coalesce(source.affiliation_id, EventPerson.affiliation_id)
-            db.session.execute(
-                target.__table__.insert().from_select(
-                    ['person_link_id', 'affiliation_id', 'display_order'],
-                    db.select([source.id, affiliation_id, 0])
-                    .join(source.person)
-                    .filter(
-                        affiliation_id.isnot(None),
-                        EventPerson.event == g.rh.event,
-                        ~source.id.in_(db.select([target.person_link_id]))
-                    )
-                )
-            )
+        backfill_affiliations(g.rh.event)
 
     def _submission_form_validated(self, form, **kwargs):
+        from indico.modules.events.abstracts.forms import AbstractForm
+        from indico.modules.events.contributions.forms import ContributionForm
+
+        from indico_jacow.util import set_person_link_affiliations
         if not isinstance(form, (AbstractForm, ContributionForm)):
             return
         if not self.event_settings.get(form.event, 'multiple_affiliations'):
             return
-        if isinstance(form, AbstractForm):
-            person_links = form.person_links
-            affiliations_cls = AbstractAffiliation
-        else:
-            person_links = form.person_link_data
-            affiliations_cls = ContributionAffiliation
+        person_links = form.person_links if isinstance(form, AbstractForm) else form.person_link_data
         affiliations_ids = g.pop('jacow_affiliations_ids', {})
+        orig_affiliations_ids = g.pop('jacow_orig_affiliations_ids', {})
+        if not all(affiliations_ids.get(person_link.person.email) for person_link in person_links.data):
+            person_links.errors.append(_('Affiliations are required for everyone'))
+            return False
+        # the form is invalid if there is a conflict, so none of the changes may be kept
+        savepoint = db.session.begin_nested()
         for person_link in person_links.data:
-            person_affiliations = affiliations_ids.get(person_link.person.email, [])
-            if not person_affiliations:
-                person_links.errors.append(_('Affiliations are required for everyone'))
+            email = person_link.person.email
+            if not set_person_link_affiliations(person_link, affiliations_ids[email],
+                                                orig_affiliations_ids.get(email)):
+                savepoint.rollback()
+                person_links.errors.append(_('The affiliations of {} have been changed by someone else in the '
+                                             'meantime. Please reload the page and try again.')
+                                           .format(person_link.full_name))
                 return False
-            person_link.jacow_affiliations = []
-            db.session.flush()
-            person_link.jacow_affiliations = [affiliations_cls(affiliation_id=id, display_order=i)
-                                              for i, id in enumerate(person_affiliations)]
+        savepoint.commit()
         db.session.flush()
 
     def _person_link_field_extra_params(self, field, **kwargs):
+        from indico.modules.events.abstracts.fields import AbstractPersonLinkListField
+        from indico.modules.events.contributions.fields import ContributionPersonLinkListField
         if (
             isinstance(field, (AbstractPersonLinkListField, ContributionPersonLinkListField)) and
             self.event_settings.get(field.event, 'multiple_affiliations')
         ):
-            return {'disable_affiliations': True, 'jacow_affiliations': True}
+            return {'disable_affiliations': True, 'jacow_affiliations': True, 'jacow_event_id': field.event.id}
 
     def _person_required_fields(self, form, **kwargs):
+        from indico.modules.events.abstracts.forms import AbstractForm
+        from indico.modules.events.contributions.forms import ContributionForm
         if isinstance(form, (AbstractForm, ContributionForm)):
             return ['first_name', 'email']
 
@@ -243,6 +311,8 @@ class JACOWPlugin(IndicoPlugin):
                 ContributionAffiliation(person_link=new_pl, affiliation=x.affiliation, display_order=x.display_order)
 
     def _extend_event_menu(self, sender, **kwargs):
+        from indico.modules.events.layout.util import MenuEntryData
+
         def _statistics_visible(event):
             if not session.user or not event.has_feature('abstracts'):
                 return False
@@ -253,10 +323,19 @@ class JACOWPlugin(IndicoPlugin):
                              visible=_statistics_visible)
 
     def _add_sidemenu_item(self, sender, event, **kwargs):
-        if not event.can_manage(session.user) or not event.has_feature('abstracts'):
+        if not event.can_manage(session.user):
             return
-        return SideMenuItem('abstracts_stats', _('CfA Statistics'),
-                            url_for_plugin('jacow.abstracts_stats', event), section='reports')
+        if event.has_feature('abstracts'):
+            yield SideMenuItem('abstracts_stats', _('CfA Statistics'),
+                               url_for_plugin('jacow.abstracts_stats', event), section='reports')
+        yield SideMenuItem('affiliation_report', _('Affiliation Report'),
+                           url_for_plugin('jacow.affiliation_report', event), section='reports')
+
+    def _invalidate_affiliation_report(self, sender, **kwargs):
+        invalidate_affiliation_report(sender.event_id)
+
+    def _flush_affiliation_reports(self, sender, **kwargs):
+        flush_stale_affiliation_reports()
 
     def _is_non_admin_repo_mgr(self):
         return (
@@ -282,18 +361,27 @@ class JACOWPlugin(IndicoPlugin):
             yield TopMenuItem('admin-jacow-repo', _('JACoW admin'), url_for('users.users_admin'), 65)
 
     def _before_check_access_repo_mgr(self, sender, rh, **kwargs):
+        if sender not in _get_repo_manager_rhs():
+            return
         if session.user and self.settings.acls.contains_user('repo_managers', session.user):
             return True
 
     def _person_link_schema_pre_load(self, sender, data, **kwargs):
-        if 'jacow_affiliations_ids' not in data:
+        from indico.modules.events.persons.schemas import PersonLinkSchema
+        if sender is not PersonLinkSchema or 'jacow_affiliations_ids' not in data:
             return
         data.pop('affiliation_id', None)
         data.pop('affiliation_link', None)
         jacow_affiliations_ids = g.setdefault('jacow_affiliations_ids', {})
         jacow_affiliations_ids[data['email'].lower()] = data.get('jacow_affiliations_ids', [])
+        # the affiliations the editor started from, used to detect concurrent changes
+        jacow_orig_affiliations_ids = g.setdefault('jacow_orig_affiliations_ids', {})
+        jacow_orig_affiliations_ids[data['email'].lower()] = data.get('jacow_orig_affiliations_ids')
 
     def _person_link_schema_post_dump(self, sender, data, orig, **kwargs):
+        from indico.modules.events.persons.schemas import PersonLinkSchema
+        if sender is not PersonLinkSchema:
+            return
         if not all(isinstance(p, (AbstractPersonLink, ContributionPersonLink)) for p in orig):
             return
         for person, person_link in zip(data, orig, strict=True):
@@ -301,9 +389,13 @@ class JACOWPlugin(IndicoPlugin):
                 person.pop('affiliation_id', None)
                 person.pop('affiliation_meta', None)
             person['jacow_affiliations_ids'] = [ja.affiliation.id for ja in person_link.jacow_affiliations]
+            person['jacow_orig_affiliations_ids'] = person['jacow_affiliations_ids']
             person['jacow_affiliations_meta'] = [ja.details for ja in person_link.jacow_affiliations]
 
     def _checkin_registration_schema_post_dump(self, sender, data, orig, **kwargs):
+        from indico.modules.events.registration.schemas import CheckinRegistrationSchema
+        if sender is not CheckinRegistrationSchema:
+            return
         for reg, registration in zip(data, orig, strict=True):
             if not registration.transaction:
                 continue
@@ -312,4 +404,5 @@ class JACOWPlugin(IndicoPlugin):
             reg['transaction_status'] = registration.transaction.status.name
 
     def get_blueprints(self):
+        from indico_jacow.blueprint import blueprint
         return blueprint
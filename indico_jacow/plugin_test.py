@@ -0,0 +1,47 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import subprocess
+import sys
+
+import pytest
+
+
+#: Indico modules which are always loaded by the app, the plugin engine and Celery
+BASELINE_MODULES = ('indico.core.celery', 'indico.core.plugins', 'indico.modules.events', 'indico.modules.users')
+#: How many modules the plugin and task modules may import on top of the baseline;
+#: most of them come from Indico itself (e.g. the settings form fields)
+MAX_NEW_MODULES = 450
+#: Modules which are only needed when handling requests and must be imported lazily
+LAZY_MODULES = (
+    'indico_jacow.blueprint',
+    'indico_jacow.controllers',
+    'indico_jacow.exports',
+    'indico_jacow.util',
+    'indico_jacow.views',
+    'indico.modules.events.abstracts.views',
+    'indico.modules.events.contributions.views',
+    'indico.modules.events.timetable.views',
+    'indico.modules.events.registration.schemas',
+    'indico.modules.logs.controllers',
+    'indico.modules.users.controllers',
+)
+
+
+def _get_new_modules(module):
+    code = (f'import sys, {", ".join(BASELINE_MODULES)}; baseline = set(sys.modules); import {module}; '
+            'print("\\n".join(set(sys.modules) - baseline))')
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return set(proc.stdout.splitlines())
+
+
+@pytest.mark.parametrize('module', ('indico_jacow.plugin', 'indico_jacow.task'))
+def test_lazy_imports(module):
+    new_modules = _get_new_modules(module)
+    assert not (set(LAZY_MODULES) & new_modules)
+    # unlike the import time, the number of modules does not depend on the machine
+    assert len(new_modules) <= MAX_NEW_MODULES
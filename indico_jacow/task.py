@@ -5,61 +5,203 @@
 # them and/or modify them under the terms of the MIT License; see
 # the LICENSE file for more details.
 
+import heapq
+import time
+from contextlib import contextmanager
+from statistics import quantiles
+
 from celery.schedules import crontab
 
 from indico.core.auth import multipass
+from indico.core.cache import make_scoped_cache
 from indico.core.celery import celery
 from indico.core.db import db
 from indico.modules.auth import Identity
+from indico.modules.events import Event
 from indico.modules.users import User
+from indico.util.date_time import now_utc
 
+from indico_jacow.analytics import REPORT_SOURCES, refresh_affiliation_report, refresh_affiliation_search_view
+from indico_jacow.models.sync_runs import SyncRun
 
-@celery.periodic_task(run_every=crontab(minute=0))
-def sync_profiles():
+
+#: The number of slowest users recorded for each sync run
+SLOWEST_USERS_COUNT = 10
+#: How long (in seconds) invalidating the affiliation search cache is
+#: delayed, so affiliations created in the meantime share one invalidation
+AFFILIATION_SEARCH_BUMP_DELAY = 30
+
+affiliation_search_bump_cache = make_scoped_cache('jacow-affiliation-search-bump')
+
+
+@contextmanager
+def _timed(durations, key):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        durations[key] = durations.get(key, 0) + time.perf_counter() - start
+
+
+def _latency_stats(latencies):
+    if not latencies:
+        return None
+    # `quantiles` needs at least two data points
+    cut_points = quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {'count': len(latencies), 'p50': round(cut_points[49], 4), 'p90': round(cut_points[89], 4),
+            'p99': round(cut_points[98], 4), 'max': round(max(latencies), 4)}
+
+
+def run_profile_sync():
+    """Synchronize users with the central database.
+
+    The metrics of the run are stored in a :class:`SyncRun` which is
+    committed together with the synchronized data.
+
+    :return: The :class:`SyncRun` of this synchronization.
+    """
     from indico_jacow.plugin import JACOWPlugin
-    if not JACOWPlugin.settings.get('sync_enabled'):
-        JACOWPlugin.logger.info('Profile sync is disabled')
-        return
 
     JACOWPlugin.logger.info('Synchronizing profiles with central database')
+    # the column defaults are only applied on INSERT, but the counters are incremented before
+    run = SyncRun(start_dt=now_utc(), users_synced=0, identities_added=0)
+    phases = {}
+    refresh_latencies = []
+    search_latencies = []
+    flush_time = 0
+
     # Sync all users that have a link to the jacow identity provider
-    syncable_users = (
-        User.query
-        .filter(
-            ~User.is_system,
-            ~User.is_deleted,
-            User.identities.any(Identity.provider == multipass.sync_provider.name)
+    with _timed(phases, 'load_syncable_users'):
+        syncable_users = (
+            User.query
+            .filter(
+                ~User.is_system,
+                ~User.is_deleted,
+                User.identities.any(Identity.provider == multipass.sync_provider.name)
+            )
+            .order_by(User.id)
+            .all()
         )
-        .order_by(User.id)
-        .all()
-    )
-    for user in syncable_users:
-        user.synchronize_data(refresh=True, silent=True)
+    with _timed(phases, 'refresh_users'):
+        for user in syncable_users:
+            start = time.perf_counter()
+            user.synchronize_data(refresh=True, silent=True)
+            refresh_latencies.append((time.perf_counter() - start, user.id))
+    run.users_synced = len(syncable_users)
 
     # Add identities to users that exist in the central repo but have no
     # corresponding identity (usually pending users that never logged in)
-    no_identity_users = (
-        User.query
-        .filter(
-            ~User.is_system,
-            ~User.is_deleted,
-            ~User.identities.any(Identity.provider == multipass.sync_provider.name)
+    with _timed(phases, 'load_no_identity_users'):
+        no_identity_users = (
+            User.query
+            .filter(
+                ~User.is_system,
+                ~User.is_deleted,
+                ~User.identities.any(Identity.provider == multipass.sync_provider.name)
+            )
+            .order_by(User.id)
+            .all()
         )
-        .order_by(User.id)
-        .all()
-    )
-    for user in no_identity_users:
-        identities = list(multipass.search_identities(providers={multipass.sync_provider.name}, exact=True,
-                                                      email=user.email))
-        if len(identities) != 1:
-            continue
-        info = identities[0]
-        identity = Identity(provider=info.provider.name, identifier=info.identifier, data=info.data,
-                            multipass_data=info.multipass_data)
-        user.identities.add(identity)
-        user.is_pending = False  # pending users w/ an identity can't log in
-        JACOWPlugin.logger.info('Adding identity %r to %r', identity, user)
-        db.session.flush()
+    with _timed(phases, 'add_identities'):
+        for user in no_identity_users:
+            start = time.perf_counter()
+            identities = list(multipass.search_identities(providers={multipass.sync_provider.name}, exact=True,
+                                                          email=user.email))
+            search_latencies.append((time.perf_counter() - start, user.id))
+            if len(identities) != 1:
+                continue
+            info = identities[0]
+            identity = Identity(provider=info.provider.name, identifier=info.identifier, data=info.data,
+                                multipass_data=info.multipass_data)
+            user.identities.add(identity)
+            user.is_pending = False  # pending users w/ an identity can't log in
+            JACOWPlugin.logger.info('Adding identity %r to %r', identity, user)
+            start = time.perf_counter()
+            db.session.flush()
+            flush_time += time.perf_counter() - start
+            run.identities_added += 1
 
+    with _timed(phases, 'commit'):
+        db.session.commit()
+
+    run.end_dt = now_utc()
+    slowest = heapq.nlargest(SLOWEST_USERS_COUNT, refresh_latencies + search_latencies)
+    run.metrics = {
+        'phases': {name: round(duration, 4) for name, duration in phases.items()},
+        'refresh_latency': _latency_stats([duration for duration, __ in refresh_latencies]),
+        'search_latency': _latency_stats([duration for duration, __ in search_latencies]),
+        'flush_time': round(flush_time, 4),
+        'slowest_users': [{'user_id': user_id, 'duration': round(duration, 4)} for duration, user_id in slowest],
+    }
+    db.session.add(run)
+    db.session.flush()
+    SyncRun.prune_history()
     db.session.commit()
-    JACOWPlugin.logger.info('Sync finished')
+    JACOWPlugin.logger.info('Sync finished: %d users synced and %d identities added in %s',
+                            run.users_synced, run.identities_added, run.duration)
+    return run
+
+
+@celery.periodic_task(run_every=crontab(minute=0))
+def sync_profiles():
+    from indico_jacow.plugin import JACOWPlugin
+    if not JACOWPlugin.settings.get('sync_enabled'):
+        JACOWPlugin.logger.info('Profile sync is disabled')
+        return
+    run_profile_sync()
+
+
+@celery.periodic_task(run_every=crontab(minute='*/10'))
+def refresh_affiliation_search():
+    from indico_jacow.plugin import JACOWPlugin
+    if not JACOWPlugin.settings.get('affiliation_search_view'):
+        return
+    refresh_affiliation_search_view()
+
+
+@celery.task(ignore_result=True)
+def bump_affiliation_search_version():
+    from indico.modules.users.util import search_affiliations
+
+    # clear the flag first so affiliations created from now on schedule another bump
+    affiliation_search_bump_cache.delete('pending')
+    search_affiliations.bump_version()
+
+
+def schedule_affiliation_search_bump():
+    """Invalidate the affiliation search cache after a short delay.
+
+    All calls within :data:`AFFILIATION_SEARCH_BUMP_DELAY` result in a
+    single invalidation.
+    """
+    # the flag expires by itself in case the task never runs
+    if affiliation_search_bump_cache.add('pending', True, timeout=AFFILIATION_SEARCH_BUMP_DELAY * 10):
+        bump_affiliation_search_version.apply_async(countdown=AFFILIATION_SEARCH_BUMP_DELAY)
+
+
+def get_prewarmed_events():
+    """Get the events whose statistics are computed periodically."""
+    from indico_jacow.plugin import JACOWPlugin
+    event_ids = {setting.event_id
+                 for setting in JACOWPlugin.event_settings.query.filter_by(name='prewarm_statistics')
+                 if setting.value}
+    if not event_ids:
+        return []
+    return Event.query.filter(Event.id.in_(event_ids), ~Event.is_deleted).order_by(Event.id).all()
+
+
+@celery.task(ignore_result=True)
+def prewarm_event_statistics(event_id):
+    from indico_jacow.util import prewarm_statistics
+    event = Event.get(event_id, is_deleted=False)
+    if event is None:
+        return
+    prewarm_statistics(event)
+    for source in REPORT_SOURCES:
+        refresh_affiliation_report(event, source)
+
+
+@celery.periodic_task(run_every=crontab(minute='*/15'))
+def prewarm_statistics_caches():
+    for event in get_prewarmed_events():
+        prewarm_event_statistics.delay(event.id)
@@ -0,0 +1,92 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+from types import SimpleNamespace
+
+from werkzeug.datastructures import MultiDict
+
+from indico.modules.users import User
+
+from indico_jacow.models.sync_runs import SyncRun
+from indico_jacow.task import (AFFILIATION_SEARCH_BUMP_DELAY, get_prewarmed_events, run_profile_sync,
+                               schedule_affiliation_search_bump)
+
+
+def test_run_profile_sync_records_metrics(db, mocker, create_user, create_identity):
+    users = [create_user(20000 + i, email=f'user{i}@example.com') for i in range(4)]
+    create_identity(users[0], 'fake-sync', users[0].email)
+
+    def _search_identities(providers, exact, email):
+        if email == users[1].email:
+            return []
+        return [SimpleNamespace(provider=SimpleNamespace(name='fake-sync'), identifier=email, data=MultiDict(),
+                                multipass_data={})]
+
+    multipass = mocker.patch('indico_jacow.task.multipass')
+    multipass.sync_provider.name = 'fake-sync'
+    multipass.search_identities.side_effect = _search_identities
+    mocker.patch.object(User, 'synchronize_data')
+
+    run = run_profile_sync()
+    assert run == SyncRun.query.one()
+    assert run.end_dt >= run.start_dt
+    assert run.users_synced == 1
+    assert run.identities_added == User.query.filter(~User.is_system).count() - 2
+    assert set(run.metrics['phases']) == {'load_syncable_users', 'refresh_users', 'load_no_identity_users',
+                                          'add_identities', 'commit'}
+    assert run.metrics['refresh_latency']['count'] == 1
+    assert run.metrics['search_latency']['count'] == User.query.filter(~User.is_system).count() - 1
+    assert {entry['user_id'] for entry in run.metrics['slowest_users']} >= {users[0].id, users[1].id}
+
+
+def test_run_profile_sync_adds_single_identity(db, mocker, create_user):
+    user = create_user(20000, email='pending@example.com')
+    user.is_pending = True
+
+    def _search_identities(providers, exact, email):
+        if email != user.email:
+            return []
+        return [SimpleNamespace(provider=SimpleNamespace(name='fake-sync'), identifier=email, data=MultiDict(),
+                                multipass_data={})]
+
+    multipass = mocker.patch('indico_jacow.task.multipass')
+    multipass.sync_provider.name = 'fake-sync'
+    multipass.search_identities.side_effect = _search_identities
+
+    run = run_profile_sync()
+    assert run.users_synced == 0
+    assert run.identities_added == 1
+    assert not user.is_pending
+    assert {identity.identifier for identity in user.identities} == {'pending@example.com'}
+
+
+def test_sync_run_history_is_pruned(db, mocker):
+    mocker.patch.object(SyncRun, 'history_size', 3)
+    db.session.add_all([SyncRun() for __ in range(5)])
+    db.session.flush()
+    SyncRun.prune_history()
+    assert SyncRun.query.count() == 3
+
+
+def test_affiliation_search_bumps_are_batched(mocker):
+    cache = mocker.patch('indico_jacow.task.affiliation_search_bump_cache')
+    cache.add.side_effect = [True, False, False]
+    apply_async = mocker.patch('indico_jacow.task.bump_affiliation_search_version.apply_async')
+    for __ in range(3):
+        schedule_affiliation_search_bump()
+    apply_async.assert_called_once_with(countdown=AFFILIATION_SEARCH_BUMP_DELAY)
+
+
+def test_get_prewarmed_events(db, create_event):
+    from indico_jacow.plugin import JACOWPlugin
+    events = [create_event() for __ in range(3)]
+    JACOWPlugin.event_settings.set(events[0], 'prewarm_statistics', True)
+    JACOWPlugin.event_settings.set(events[1], 'prewarm_statistics', False)
+    assert get_prewarmed_events() == [events[0]]
+    events[0].is_deleted = True
+    db.session.flush()
+    assert get_prewarmed_events() == []
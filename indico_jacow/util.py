@@ -0,0 +1,765 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import hashlib
+import itertools
+from collections import defaultdict
+from operator import attrgetter
+
+from flask import session
+from limits import parse_many
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from indico.core.cache import make_scoped_cache
+from indico.core.db import db
+from indico.core.db.sqlalchemy.principals import PrincipalType
+from indico.core.errors import UserValueError
+from indico.core.limiter import RateLimit, limiter
+from indico.modules.events.abstracts.models.abstracts import Abstract
+from indico.modules.events.abstracts.models.persons import AbstractPersonLink
+from indico.modules.events.abstracts.models.review_ratings import AbstractReviewRating
+from indico.modules.events.abstracts.models.reviews import AbstractReview
+from indico.modules.events.contributions.models.persons import ContributionPersonLink
+from indico.modules.events.models.persons import EventPerson
+from indico.modules.events.models.principals import EventPrincipal
+from indico.modules.events.tracks.models.tracks import Track
+from indico.modules.users import User
+from indico.modules.users.models.affiliations import Affiliation
+from indico.modules.users.models.emails import UserEmail
+from indico.util.caching import memoize_request
+from indico.util.date_time import now_utc
+from indico.util.i18n import _
+from indico.util.string import validate_email
+
+from indico_jacow.analytics import invalidate_affiliation_report
+from indico_jacow.models.affiliations import AbstractAffiliation, ContributionAffiliation
+
+
+#: The affiliation association models and the person links they belong to
+AFFILIATION_MODELS = ((AbstractAffiliation, AbstractPersonLink), (ContributionAffiliation, ContributionPersonLink))
+#: How many affiliations a user may create; co-authors often share the same
+#: NAT during submission deadlines, so this is counted per user and not per IP
+AFFILIATION_CREATION_RATE_LIMIT = '30 per 10 minutes'
+#: How long prewarmed statistics are kept; the prewarm task runs more often
+PREWARMED_STATISTICS_TTL = 3600
+#: The number of CSV rows whose users are looked up at once when importing
+#: a paper reviewing team
+PEER_REVIEW_CSV_CHUNK_SIZE = 500
+#: How long the progress of a paper reviewing team CSV import is kept
+PEER_REVIEW_CSV_PROGRESS_TTL = 600
+
+statistics_cache = make_scoped_cache('jacow-statistics')
+peer_review_csv_progress_cache = make_scoped_cache('jacow-peer-review-csv-progress')
+affiliation_creation_rate_limiter = RateLimit(limiter, lambda: str(session.user.id), 'jacow-create-affiliation',
+                                              list(parse_many(AFFILIATION_CREATION_RATE_LIMIT)))
+
+
+def get_boolean_questions(event):
+    return [question
+            for question in event.abstract_review_questions
+            if not question.is_deleted and question.field_type == 'bool']
+
+
+def get_reviewers(event):
+    """Get all users who reviewed abstracts in the event, sorted by name."""
+    query = User.query.filter(User.abstract_reviews.any(AbstractReview.abstract.has(event=event)))
+    return sorted(query, key=lambda x: x.display_full_name.lower())
+
+
+def get_review_counts(event):
+    """Get the number of reviews per reviewer and track.
+
+    Like :func:`get_track_reviewer_abstract_counts`, only reviews for
+    abstracts which are (still) in the track are taken into account.
+
+    :return: A dict mapping user ids to dicts mapping track ids to counts.
+    """
+    query = (db.session.query(AbstractReview.user_id, AbstractReview.track_id, db.func.count())
+             .join(AbstractReview.abstract)
+             .filter(Abstract.event == event,
+                     ~Abstract.is_deleted,
+                     Abstract.reviewed_for_tracks.any(Track.id == AbstractReview.track_id))
+             .group_by(AbstractReview.user_id, AbstractReview.track_id))
+    counts = defaultdict(dict)
+    for user_id, track_id, count in query:
+        counts[user_id][track_id] = count
+    return counts
+
+
+def get_positive_answer_counts(questions, user=None):
+    """Get the number of positive answers to boolean questions per reviewer and track.
+
+    :param questions: The boolean review questions
+    :param user: If set, only the answers of this reviewer are counted
+    :return: A dict mapping question ids to dicts mapping user ids to
+             dicts mapping track ids to counts.
+    """
+    if not questions:
+        return {}
+    query = (AbstractReviewRating.query
+             .filter(AbstractReviewRating.question_id.in_([q.id for q in questions]),
+                     AbstractReviewRating.value[()].astext == 'true')
+             .join(AbstractReview)
+             .with_entities(AbstractReviewRating.question_id, AbstractReview.user_id, AbstractReview.track_id,
+                            db.func.count())
+             .group_by(AbstractReviewRating.question_id, AbstractReview.user_id, AbstractReview.track_id))
+    if user is not None:
+        query = query.filter(AbstractReview.user == user)
+    counts = {q.id: defaultdict(dict) for q in questions}
+    for question_id, user_id, track_id, count in query:
+        counts[question_id][user_id][track_id] = count
+    return counts
+
+
+def get_abstracts_in_tracks_counts(event):
+    """Get the number of abstracts submitted for, moved to and finally proposed in each track.
+
+    :return: A dict mapping track ids to dicts containing the counts.
+    """
+    submitted = Abstract.submitted_for_tracks.prop.secondary
+    reviewed = Abstract.reviewed_for_tracks.prop.secondary
+    counts = {track.id: {'submitted_for': 0, 'moved_to': 0, 'final_proposals': 0} for track in event.tracks}
+    submitted_query = (db.session.query(submitted.c.track_id, db.func.count())
+                       .select_from(submitted)
+                       .join(Abstract, Abstract.id == submitted.c.abstract_id)
+                       .filter(Abstract.event == event, ~Abstract.is_deleted)
+                       .group_by(submitted.c.track_id))
+    for track_id, count in submitted_query:
+        counts[track_id]['submitted_for'] = count
+    is_moved = ~(db.exists()
+                 .where(submitted.c.abstract_id == reviewed.c.abstract_id)
+                 .where(submitted.c.track_id == reviewed.c.track_id))
+    reviewed_query = (db.session.query(reviewed.c.track_id, db.func.count(), db.func.count().filter(is_moved))
+                      .select_from(reviewed)
+                      .join(Abstract, Abstract.id == reviewed.c.abstract_id)
+                      .filter(Abstract.event == event, ~Abstract.is_deleted)
+                      .group_by(reviewed.c.track_id))
+    for track_id, final_proposals, moved_to in reviewed_query:
+        counts[track_id]['final_proposals'] = final_proposals
+        counts[track_id]['moved_to'] = moved_to
+    return counts
+
+
+def compute_abstracts_statistics(event, use_prewarmed=False):
+    """Compute all CfA statistics of an event in one go.
+
+    Everything is computed with a handful of aggregate queries, so the
+    result can be used to build any of the statistics exports.
+
+    :param event: The event to compute the statistics for
+    :param use_prewarmed: Whether to use the counts computed by
+                          :func:`prewarm_statistics` if available
+    """
+    questions = get_boolean_questions(event)
+    if use_prewarmed and (prewarmed := get_prewarmed_statistics(event)):
+        counts = prewarmed
+    else:
+        counts = {
+            'computed_dt': None,
+            'review_counts': get_review_counts(event),
+            'positive_answer_counts': get_positive_answer_counts(questions),
+            'abstracts_in_tracks': get_abstracts_in_tracks_counts(event),
+        }
+    return {
+        'tracks': get_track_hierarchy(event).tracks,
+        'questions': questions,
+        'reviewers': get_reviewers(event),
+        **counts,
+    }
+
+
+def prewarm_statistics(event):
+    """Compute the counts of the CfA statistics of an event and cache them.
+
+    Only the aggregated counts are cached; the tracks, questions and
+    reviewers are cheap to load.
+    """
+    questions = get_boolean_questions(event)
+    data = {
+        'computed_dt': now_utc(),
+        'review_counts': dict(get_review_counts(event)),
+        'positive_answer_counts': {question_id: dict(counts)
+                                   for question_id, counts in get_positive_answer_counts(questions).items()},
+        'abstracts_in_tracks': get_abstracts_in_tracks_counts(event),
+    }
+    statistics_cache.set(str(event.id), data, timeout=PREWARMED_STATISTICS_TTL)
+    return data
+
+
+def get_prewarmed_statistics(event):
+    """Get the counts cached by :func:`prewarm_statistics`.
+
+    :return: The cached counts and the time they were computed at, or
+             `None` if there are none or if the tracks or questions of
+             the event have changed since.
+    """
+    data = statistics_cache.get(str(event.id))
+    if data is None:
+        return None
+    if (data['abstracts_in_tracks'].keys() != get_track_hierarchy(event).tracks_by_id.keys() or
+            data['positive_answer_counts'].keys() != {q.id for q in get_boolean_questions(event)}):
+        return None
+    return data
+
+
+def generate_statistics_spreadsheet(stats):
+    """Generate spreadsheet data from the CfA statistics.
+
+    The spreadsheet uses a "long" format with one row per count.
+    Reviewer/track combinations without any reviews or positive
+    answers are omitted.
+
+    :param stats: The statistics from :func:`compute_abstracts_statistics`
+    """
+    headers = ['Metric', 'Question', 'Reviewer', 'Reviewer (email)', 'Track', 'Track group', 'Count']
+
+    def _track_data(track):
+        return {'Track': track.code or track.title,
+                'Track group': (track.track_group.code or track.track_group.title) if track.track_group else None}
+
+    def _reviewer_rows(metric, counts, question=None):
+        for user in stats['reviewers']:
+            user_counts = counts.get(user.id, {})
+            for track in stats['tracks']:
+                if count := user_counts.get(track.id):
+                    yield {'Metric': metric, 'Question': question.title if question else None,
+                           'Reviewer': user.full_name, 'Reviewer (email)': user.email, **_track_data(track),
+                           'Count': count}
+
+    rows = list(_reviewer_rows('Reviews', stats['review_counts']))
+    for question in stats['questions']:
+        rows += _reviewer_rows('Positive answers', stats['positive_answer_counts'][question.id], question)
+    for metric, key in (('Abstracts submitted for', 'submitted_for'), ('Abstracts moved to', 'moved_to'),
+                        ('Final proposals', 'final_proposals')):
+        rows += [{'Metric': metric, 'Question': None, 'Reviewer': None, 'Reviewer (email)': None, **_track_data(track),
+                  'Count': stats['abstracts_in_tracks'][track.id][key]}
+                 for track in stats['tracks']]
+    return headers, rows
+
+
+def serialize_statistics(stats):
+    """Serialize the CfA statistics to a JSON-friendly dict.
+
+    :param stats: The statistics from :func:`compute_abstracts_statistics`
+    """
+    def _stringify_keys(counts):
+        return {str(user_id): {str(track_id): n for track_id, n in user_counts.items()}
+                for user_id, user_counts in counts.items()}
+
+    return {
+        'computed_dt': stats['computed_dt'].isoformat() if stats['computed_dt'] else None,
+        'tracks': [{'id': t.id, 'code': t.code, 'title': t.title, 'track_group_id': t.track_group_id}
+                   for t in stats['tracks']],
+        'questions': [{'id': q.id, 'title': q.title} for q in stats['questions']],
+        'reviewers': [{'id': u.id, 'name': u.full_name, 'email': u.email} for u in stats['reviewers']],
+        'reviews': _stringify_keys(stats['review_counts']),
+        'positive_answers': {str(question_id): _stringify_keys(counts)
+                             for question_id, counts in stats['positive_answer_counts'].items()},
+        'abstracts_in_tracks': {str(track_id): counts for track_id, counts in stats['abstracts_in_tracks'].items()},
+    }
+
+
+class TrackHierarchy:
+    """The tracks of an event and the track groups containing them.
+
+    All tracks and their groups are loaded with a single query, and the
+    ``tracks`` of each group are populated from it, so neither the code
+    using the hierarchy nor the templates trigger any lazy loads.
+
+    Use :func:`get_track_hierarchy` to get an instance which is cached
+    for the current request.
+
+    :ivar tracks: The tracks, sorted by position
+    :ivar tracks_by_id: A dict mapping ids to the tracks
+    :ivar groups: A dict mapping ids to the non-empty track groups
+    :ivar list_items: The track groups and the tracks without a group,
+                      sorted like :meth:`Event.get_sorted_tracks`
+    """
+
+    def __init__(self, event):
+        self.tracks = (Track.query.with_parent(event)
+                       .options(joinedload(Track.track_group))
+                       .order_by(Track.position)
+                       .all())
+        self.tracks_by_id = {track.id: track for track in self.tracks}
+        self._track_groups = {track.id: track.track_group for track in self.tracks}
+        group_tracks = defaultdict(list)
+        for track in self.tracks:
+            if track.track_group is not None:
+                group_tracks[track.track_group].append(track)
+        for group, tracks in group_tracks.items():
+            set_committed_value(group, 'tracks', tracks)
+        self.groups = {group.id: group for group in group_tracks}
+        self.list_items = sorted([track for track in self.tracks if track.track_group is None] + list(group_tracks),
+                                 key=attrgetter('position'))
+
+    def get_group(self, track_id):
+        """Get the track group of a track, or `None` if it has none."""
+        return self._track_groups.get(track_id)
+
+    def rollup(self, counts):
+        """Sum up per-track counts for each track group.
+
+        :param counts: A dict mapping track ids to numbers, or to dicts
+                       mapping keys to numbers
+        :return: A dict mapping track group ids to the sums; groups
+                 without any counts are omitted
+        """
+        totals = {}
+        for track_id, value in counts.items():
+            if (group := self._track_groups.get(track_id)) is None:
+                continue
+            if isinstance(value, dict):
+                group_totals = totals.setdefault(group.id, dict.fromkeys(value, 0))
+                for key, count in value.items():
+                    group_totals[key] += count
+            else:
+                totals[group.id] = totals.get(group.id, 0) + value
+        return totals
+
+
+@memoize_request
+def get_track_hierarchy(event):
+    """Get the :class:`TrackHierarchy` of an event."""
+    return TrackHierarchy(event)
+
+
+def serialize_stats_table(hierarchy, reviewers, counts):
+    """Serialize a reviewer statistics table for the client.
+
+    :param hierarchy: The :class:`TrackHierarchy` of the event, whose
+                      list items are used as columns
+    :param reviewers: The users used as rows
+    :param counts: A dict mapping user ids to dicts mapping track ids
+                   to counts, as returned by :func:`get_review_counts`
+    """
+    def _track_key(track):
+        return f'track-{track.id}'
+
+    def _serialize_track(track):
+        return {'key': _track_key(track), 'title': track.code or track.title}
+
+    items = []
+    for item in hierarchy.list_items:
+        if item.is_track_group:
+            items.append({'key': f'group-{item.id}', 'title': item.code or item.title,
+                          'tracks': [_serialize_track(track) for track in item.tracks]})
+        else:
+            items.append(_serialize_track(item))
+    rows = []
+    for user in reviewers:
+        user_counts = counts.get(user.id, {})
+        row = {'id': user.id, 'name': user.full_name, 'total': sum(user_counts.values())}
+        row.update({_track_key(track): user_counts.get(track.id, 0) for track in hierarchy.tracks})
+        group_counts = hierarchy.rollup(user_counts)
+        row.update({f'group-{group_id}': group_counts.get(group_id, 0) for group_id in hierarchy.groups})
+        rows.append(row)
+    return {'items': items, 'rows': rows}
+
+
+class AffiliationFormatter:
+    """Format the affiliations of person links for spreadsheet exports.
+
+    The affiliations of all person links are loaded with a single query
+    and each affiliation and person link is formatted only once, no
+    matter how many roles a person has or how many persons share the
+    same affiliation.
+
+    :param person_links: The person links which will be formatted
+    :param association_cls: The model associating the person links with
+                            their affiliations, i.e. a subclass of
+                            :class:`.JACoWAffiliationBase`
+    """
+
+    def __init__(self, person_links, association_cls):
+        self._affiliation_ids = defaultdict(list)
+        self._affiliations = {}
+        self._formatted_affiliations = {}
+        self._formatted_person_links = {}
+        if person_link_ids := {pl.id for pl in person_links}:
+            query = (db.session.query(association_cls.person_link_id, Affiliation)
+                     .join(Affiliation, Affiliation.id == association_cls.affiliation_id)
+                     .filter(association_cls.person_link_id.in_(person_link_ids))
+                     .order_by(association_cls.person_link_id, association_cls.display_order))
+            for person_link_id, affiliation in query:
+                self._affiliation_ids[person_link_id].append(affiliation.id)
+                self._affiliations[affiliation.id] = affiliation
+
+    @staticmethod
+    def _make_address(affiliation):
+        address = ' '.join(filter(None, (affiliation.postcode, affiliation.city)))
+        return ', '.join(filter(None, (affiliation.street, address)))
+
+    def _format_affiliation(self, affiliation_id, field):
+        key = (affiliation_id, field)
+        if key not in self._formatted_affiliations:
+            affiliation = self._affiliations[affiliation_id]
+            self._formatted_affiliations[key] = (affiliation.country_code if field == 'country'
+                                                 else self._make_address(affiliation))
+        return self._formatted_affiliations[key]
+
+    def _format(self, person_link, field):
+        key = (person_link.id, field)
+        if key not in self._formatted_person_links:
+            data = '; '.join(self._format_affiliation(affiliation_id, field)
+                             for affiliation_id in self._affiliation_ids[person_link.id])
+            self._formatted_person_links[key] = (f'{person_link.full_name} ({data})' if data
+                                                 else person_link.full_name)
+        return self._formatted_person_links[key]
+
+    def full_name_and_country(self, person_link):
+        return self._format(person_link, 'country')
+
+    def full_name_and_address(self, person_link):
+        return self._format(person_link, 'address')
+
+
+def get_event_affiliations(event):
+    """Get the affiliations used in the abstracts and contributions of an event."""
+    affiliation_ids = db.union(*(db.select([target.affiliation_id])
+                                 .join(target.person_link)
+                                 .join(source.person)
+                                 .filter(EventPerson.event == event)
+                                 for target, source in AFFILIATION_MODELS))
+    return (Affiliation.query
+            .filter(Affiliation.id.in_(affiliation_ids), ~Affiliation.is_deleted)
+            .order_by(db.func.lower(Affiliation.name))
+            .all())
+
+
+def _get_affiliation_backfill_query(event, target, source):
+    affiliation_id = db.func.coalesce(source.affiliation_id, EventPerson.affiliation_id)
+    return (db.select([source.id, affiliation_id, 0])
+            .join(source.person)
+            .filter(
+                affiliation_id.isnot(None),
+                EventPerson.event == event,
+                ~source.id.in_(db.select([target.person_link_id]))
+            ))
+
+
+def count_affiliation_backfill(event):
+    """Count the rows :func:`backfill_affiliations` would insert.
+
+    :return: A dict mapping the association models to row counts
+    """
+    return {target: db.session.execute(db.select([db.func.count()])
+                                       .select_from(_get_affiliation_backfill_query(event, target, source).alias()))
+                                       .scalar()
+            for target, source in AFFILIATION_MODELS}
+
+
+def backfill_affiliations(event, batch_size=None):
+    """Populate the affiliation tables with the current affiliations of the person links.
+
+    This is used when enabling multiple affiliations in an event; person
+    links which already have affiliations in the plugin's tables are
+    skipped, so it is safe to run it again.
+
+    :param event: The event to backfill
+    :param batch_size: If set, the rows are inserted in batches of this
+                       size, committing after each batch
+    :return: A dict mapping the association models to the number of
+             inserted rows
+    """
+    counts = {}
+    for target, source in AFFILIATION_MODELS:
+        query = _get_affiliation_backfill_query(event, target, source)
+        if batch_size is None:
+            batches = [query]
+        else:
+            person_link_ids = [id_ for id_, in db.session.execute(query.with_only_columns([source.id])
+                                                                  .order_by(source.id))]
+            batches = (query.filter(source.id.in_(person_link_ids[i:i + batch_size]))
+                       for i in range(0, len(person_link_ids), batch_size))
+        counts[target] = 0
+        for batch_query in batches:
+            insert = target.__table__.insert().from_select(['person_link_id', 'affiliation_id', 'display_order'],
+                                                           batch_query)
+            counts[target] += db.session.execute(insert).rowcount
+            if batch_size is not None:
+                invalidate_affiliation_report(event.id)
+                db.session.commit()
+    invalidate_affiliation_report(event.id)
+    return counts
+
+
+def _normalize_affiliation_data(data):
+    return {**data, 'name': ' '.join(data['name'].split()), 'city': ' '.join(data['city'].split())}
+
+
+def _get_affiliation_lock_id(data):
+    key = '\x00'.join((data['name'].casefold(), data['city'].casefold(), data['country_code'].upper()))
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+def create_affiliation(data, user):
+    """Get or create an affiliation entered by a user.
+
+    Affiliations which only differ in whitespace or case are considered
+    to be the same. Concurrent requests for the same affiliation wait for
+    each other using a transaction-level advisory lock, so only the first
+    one inserts it and the others use it once that transaction has been
+    committed.
+
+    :return: A tuple containing the affiliation and whether it was created
+    """
+    data = _normalize_affiliation_data(data)
+    db.session.execute(db.select([db.func.pg_advisory_xact_lock(_get_affiliation_lock_id(data))]))
+    existing = (Affiliation.query
+                .filter(db.func.lower(Affiliation.name) == data['name'].lower(),
+                        db.func.lower(Affiliation.city) == data['city'].lower(),
+                        Affiliation.country_code == data['country_code'])
+                .order_by(Affiliation.id)
+                .first())
+    if existing:
+        return existing, False
+    affiliation = Affiliation(**data)
+    affiliation.meta = {
+        'created_by': user.id,
+        'created_dt': now_utc(False).isoformat(),
+        'verified': False,
+    }
+    db.session.add(affiliation)
+    db.session.flush()
+    return affiliation, True
+
+
+def resolve_affiliation_merges(merges):
+    """Group pairs of duplicate affiliations by the affiliation they are merged into.
+
+    Chains like ``(b, a), (c, b)`` are followed, so `a` and `b` are both
+    merged into `c`.
+
+    :param merges: An iterable of ``(source_id, target_id)`` tuples
+    :return: A dict mapping target ids to sets of source ids
+    :raise ValueError: If the merges contain a cycle or an affiliation
+                       is merged into several others
+    """
+    targets = {}
+    for source_id, target_id in merges:
+        if targets.setdefault(source_id, target_id) != target_id:
+            raise ValueError(f'Affiliation {source_id} is merged into {targets[source_id]} and {target_id}')
+    result = defaultdict(set)
+    for source_id in targets:
+        target_id = source_id
+        seen = set()
+        while target_id in targets:
+            if target_id in seen:
+                raise ValueError(f'Affiliation {source_id} is part of a merge cycle')
+            seen.add(target_id)
+            target_id = targets[target_id]
+        result[target_id].add(source_id)
+    return dict(result)
+
+
+def _merge_affiliations(target, source, target_id, source_ids):
+    table = target.__table__
+    merged_person_link_ids = db.select([table.c.person_link_id]).where(table.c.affiliation_id.in_(source_ids))
+    event_ids = {id_ for id_, in db.session.execute(db.select([EventPerson.event_id])
+                                                    .select_from(source)
+                                                    .join(EventPerson, EventPerson.id == source.person_id)
+                                                    .where(source.id.in_(merged_person_link_ids))
+                                                    .distinct())}
+    # the rows of the affected person links are replaced in a single statement; merging may
+    # leave a person link with the same affiliation twice, and it keeps the first position
+    deleted = (table.delete()
+               .where(table.c.person_link_id.in_(merged_person_link_ids))
+               .returning(table.c.person_link_id, table.c.affiliation_id, table.c.display_order)
+               .cte('deleted'))
+    affiliation_id = db.case((deleted.c.affiliation_id.in_(source_ids), target_id), else_=deleted.c.affiliation_id)
+    merged = (db.select([deleted.c.person_link_id, affiliation_id.label('affiliation_id'),
+                         db.func.min(deleted.c.display_order).label('display_order')])
+              .group_by(deleted.c.person_link_id, affiliation_id)
+              .subquery())
+    display_order = db.func.row_number().over(partition_by=merged.c.person_link_id,
+                                              order_by=merged.c.display_order) - 1
+    insert = (table.insert()
+              .from_select(['person_link_id', 'affiliation_id', 'display_order'],
+                           db.select([merged.c.person_link_id, merged.c.affiliation_id, display_order]))
+              .returning(table.c.person_link_id))
+    count = len({id_ for id_, in db.session.execute(insert)})
+    for event_id in event_ids:
+        invalidate_affiliation_report(event_id)
+    return count
+
+
+def merge_affiliations(target_id, source_ids):
+    """Merge duplicate affiliations in the affiliation tables of the plugin.
+
+    The references to the source affiliations are replaced with the target
+    affiliation using set-based statements, so none of the affected rows
+    are loaded.  Person links which already had the target affiliation
+    keep only one of them and the display order is renumbered.  The
+    affiliations themselves and references to them outside the plugin
+    are not modified.
+
+    Nothing is committed, so the merge can be done in the same
+    transaction as other changes.  Since the rows are changed behind the
+    back of the ORM, the session is expired afterwards.
+
+    :param target_id: The id of the affiliation to keep
+    :param source_ids: The ids of the duplicate affiliations
+    :return: A dict mapping the association models to the number of
+             updated person links
+    """
+    source_ids = set(source_ids) - {target_id}
+    if not source_ids:
+        return {target: 0 for target, __ in AFFILIATION_MODELS}
+    db.session.flush()
+    counts = {target: _merge_affiliations(target, source, target_id, source_ids)
+              for target, source in AFFILIATION_MODELS}
+    db.session.expire_all()
+    return counts
+
+
+def _get_affiliation_association_cls(person_link):
+    return next(target for target, source in AFFILIATION_MODELS if isinstance(person_link, source))
+
+
+def _reorder_affiliations(table, person_link_id, affiliation_ids, expected_ids):
+    # the unique constraint on the display order is deferrable, so it is only checked
+    # once the whole statement has been executed and the rows can swap their positions
+    new_order = db.case({id_: i for i, id_ in enumerate(affiliation_ids)}, value=table.c.affiliation_id)
+    expected = db.tuple_(table.c.affiliation_id, table.c.display_order).in_(
+        [(id_, i) for i, id_ in enumerate(expected_ids)]
+    )
+    stmt = table.update().where(table.c.person_link_id == person_link_id, expected).values(display_order=new_order)
+    return db.session.execute(stmt).rowcount == len(expected_ids)
+
+
+def _replace_affiliations(table, person_link_id, affiliation_ids, expected_ids):
+    stmt = table.delete().where(table.c.person_link_id == person_link_id).returning(table.c.affiliation_id,
+                                                                                     table.c.display_order)
+    if dict(db.session.execute(stmt).fetchall()) != {id_: i for i, id_ in enumerate(expected_ids)}:
+        return False
+    if affiliation_ids:
+        db.session.execute(table.insert().values([{'person_link_id': person_link_id, 'affiliation_id': id_,
+                                                   'display_order': i}
+                                                  for i, id_ in enumerate(affiliation_ids)]))
+    return True
+
+
+def set_person_link_affiliations(person_link, affiliation_ids, expected_ids=None):
+    """Set the affiliations of an abstract/contribution person link.
+
+    Existing person links are updated optimistically: the change is only
+    applied if their affiliations are still `expected_ids`, i.e. the ones
+    the editor has seen. Reordering the same affiliations is done with a
+    single ``UPDATE``, anything else replaces all rows of the person link.
+    If someone else changed the affiliations in the meantime, even in a
+    transaction which is still running, nothing is changed.
+
+    :param person_link: An :class:`AbstractPersonLink` or
+                        :class:`ContributionPersonLink`
+    :param affiliation_ids: The ordered ids of the new affiliations
+    :param expected_ids: The ordered ids of the affiliations the change is
+                         based on; if omitted, the currently loaded ones
+                         are used
+    :return: Whether the affiliations have been updated; `False` means
+             there was a conflicting change
+    """
+    association_cls = _get_affiliation_association_cls(person_link)
+    affiliation_ids = list(affiliation_ids)
+    if person_link.id is None:
+        person_link.jacow_affiliations = [association_cls(affiliation_id=id_, display_order=i)
+                                          for i, id_ in enumerate(affiliation_ids)]
+        return True
+    current = person_link.jacow_affiliations
+    current_ids = [ja.affiliation_id for ja in current]
+    expected_ids = current_ids if expected_ids is None else list(expected_ids)
+    if expected_ids != current_ids:
+        return False
+    if affiliation_ids == expected_ids:
+        return True
+    if sorted(affiliation_ids) == sorted(expected_ids):
+        update = _reorder_affiliations
+    else:
+        update = _replace_affiliations
+    savepoint = db.session.begin_nested()
+    try:
+        updated = update(association_cls.__table__, person_link.id, affiliation_ids, expected_ids)
+    except IntegrityError:
+        # a concurrent change inserted the same affiliation or position
+        updated = False
+    if not updated:
+        savepoint.rollback()
+        return False
+    savepoint.commit()
+    # the rows have been changed behind the back of the ORM
+    for association in current:
+        db.session.expire(association)
+    db.session.expire(person_link, ['jacow_affiliations'])
+    invalidate_affiliation_report(person_link.person.event_id)
+    return True
+
+
+def iter_csv_users(reader, chunk_size=PEER_REVIEW_CSV_CHUNK_SIZE):
+    """Look up the users listed in the "Email" column of a CSV file.
+
+    The rows are processed in chunks, with one query per chunk, so the
+    file does not need to be loaded at once.  Empty emails are skipped.
+
+    :param reader: A :class:`csv.DictReader`
+    :return: An iterator yielding a tuple containing the number of rows,
+             the ids of the users found and the unknown emails for each
+             chunk
+    :raise UserValueError: If an email address is invalid or not unique
+    """
+    seen = set()
+    rows = enumerate(reader, 1)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        emails = set()
+        for num_row, row in chunk:
+            email = (row['Email'] or '').strip().lower()
+            if not email:
+                continue
+            if not validate_email(email):
+                raise UserValueError(_('Row {row}: invalid email address: {email}').format(row=num_row, email=email))
+            if email in seen:
+                raise UserValueError(_('Row {}: email address is not unique').format(num_row))
+            seen.add(email)
+            emails.add(email)
+        found = {}
+        if emails:
+            found = dict(db.session.query(UserEmail.email, UserEmail.user_id)
+                         .filter(UserEmail.email.in_(emails), ~UserEmail.is_user_deleted))
+        yield len(chunk), set(found.values()), emails - found.keys()
+
+
+def assign_event_permission(event, user_ids, permission):
+    """Grant a permission in an event to many users at once.
+
+    Unlike calling `update_principal` for each user, the ACL is updated
+    with one statement for the users who already have an ACL entry and
+    one for the others.  Since this bypasses the ACL signals, nothing is
+    logged.
+
+    :return: The ids of the users who did not have the permission before
+    """
+    db.session.flush()
+    table = EventPrincipal.__table__
+    existing = dict(db.session.query(EventPrincipal.user_id, EventPrincipal.permissions)
+                    .filter(EventPrincipal.event_id == event.id,
+                            EventPrincipal.type == PrincipalType.user,
+                            EventPrincipal.user_id.in_(user_ids)))
+    update_ids = {id_ for id_, permissions in existing.items() if permission not in permissions}
+    insert_ids = set(user_ids) - existing.keys()
+    if update_ids:
+        db.session.execute(table.update()
+                           .where(table.c.event_id == event.id,
+                                  table.c.type == PrincipalType.user,
+                                  table.c.user_id.in_(update_ids))
+                           .values(permissions=db.func.array_append(table.c.permissions, permission)))
+    if insert_ids:
+        db.session.execute(table.insert(), [{'event_id': event.id, 'type': PrincipalType.user, 'user_id': id_,
+                                             'read_access': False, 'full_access': False, 'permissions': [permission]}
+                                            for id_ in sorted(insert_ids)])
+    db.session.expire(event, ['acl_entries'])
+    return update_ids | insert_ids
@@ -0,0 +1,407 @@
+# This file is part of the JACoW plugin.
+# Copyright (C) 2021 - 2026 CERN
+#
+# The CERN Indico plugins are free software; you can redistribute
+# them and/or modify them under the terms of the MIT License; see
+# the LICENSE file for more details.
+
+import csv
+import io
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from indico.core.db import db
+from indico.core.errors import UserValueError
+from indico.modules.categories import Category
+from indico.modules.events import Event
+from indico.modules.events.abstracts.models.abstracts import Abstract
+from indico.modules.events.abstracts.models.persons import AbstractPersonLink
+from indico.modules.events.abstracts.util import get_track_reviewer_abstract_counts
+from indico.modules.events.contributions.models.persons import AuthorType
+from indico.modules.events.models.events import EventType
+from indico.modules.events.models.persons import EventPerson
+from indico.modules.events.tracks.models.tracks import Track
+from indico.modules.users import User
+from indico.modules.users.models.affiliations import Affiliation
+from indico.util.date_time import now_utc
+
+from indico_jacow.models.affiliations import AbstractAffiliation, ContributionAffiliation
+from indico_jacow.util import (AffiliationFormatter, assign_event_permission, backfill_affiliations,
+                               compute_abstracts_statistics, count_affiliation_backfill, create_affiliation,
+                               generate_statistics_spreadsheet, get_abstracts_in_tracks_counts, get_event_affiliations,
+                               get_positive_answer_counts, get_prewarmed_statistics, get_review_counts, get_reviewers,
+                               get_track_hierarchy, iter_csv_users, merge_affiliations, prewarm_statistics,
+                               resolve_affiliation_merges, serialize_statistics, serialize_stats_table,
+                               set_person_link_affiliations)
+
+
+def test_get_review_counts_matches_core(db, create_synthetic_event):
+    data = create_synthetic_event(abstracts=12, reviewers=3, tracks=4, track_groups=1)
+    # moving an abstract to another track must not count the old reviews for the new track
+    data.abstracts[0].reviewed_for_tracks = {data.tracks[1]}
+    db.session.flush()
+    counts = get_review_counts(data.event)
+    for user in data.reviewers:
+        expected = {track.id: c['reviewed']
+                    for track, c in get_track_reviewer_abstract_counts(data.event, user).items()
+                    if c['reviewed']}
+        assert counts[user.id] == expected
+
+
+def test_get_positive_answer_counts(create_synthetic_event):
+    data = create_synthetic_event(abstracts=6, reviewers=2, tracks=2, track_groups=0, questions=2)
+    question = next(q for q in data.questions if q.field_type == 'bool')
+    counts = get_positive_answer_counts([question])[question.id]
+    expected = {}
+    for abstract in data.abstracts:
+        for review in abstract.reviews:
+            if any(r.question == question and r.value is True for r in review.ratings):
+                user_counts = expected.setdefault(review.user_id, {})
+                user_counts[review.track_id] = user_counts.get(review.track_id, 0) + 1
+    assert counts == expected
+
+
+def test_serialize_stats_table(create_synthetic_event):
+    data = create_synthetic_event(abstracts=8, reviewers=2, tracks=4, track_groups=1)
+    group = data.track_groups[0]
+    reviewers = get_reviewers(data.event)
+    assert reviewers == sorted(data.reviewers, key=lambda u: u.display_full_name.lower())
+    table = serialize_stats_table(get_track_hierarchy(data.event), reviewers, get_review_counts(data.event))
+    group_item = next(item for item in table['items'] if item['key'] == f'group-{group.id}')
+    assert [t['key'] for t in group_item['tracks']] == [f'track-{t.id}' for t in group.tracks]
+    for row in table['rows']:
+        assert row[f'group-{group.id}'] == sum(row[f'track-{t.id}'] for t in group.tracks)
+        assert row['total'] == sum(row[f'track-{t.id}'] for t in data.tracks)
+
+
+def test_track_hierarchy(db, count_queries, create_synthetic_event):
+    data = create_synthetic_event(abstracts=2, reviewers=1, tracks=6, track_groups=2)
+    db.session.expire_all()
+    # the event itself is always loaded in a request
+    db.session.refresh(data.event)
+    with count_queries() as cnt:
+        hierarchy = get_track_hierarchy(data.event)
+        group_tracks = {group_id: [t.id for t in group.tracks] for group_id, group in hierarchy.groups.items()}
+    assert cnt() == 1
+    assert hierarchy.list_items == [item for item in data.event.get_sorted_tracks()
+                                    if not item.is_track_group or item.tracks]
+    assert group_tracks == {group.id: [t.id for t in Track.query.filter_by(track_group=group).order_by(Track.position)]
+                            for group in data.track_groups if group.tracks}
+    counts = {track.id: {'a': i, 'b': 1} for i, track in enumerate(data.tracks)}
+    assert hierarchy.rollup(counts) == {
+        group.id: {'a': sum(counts[t.id]['a'] for t in group.tracks), 'b': len(group.tracks)}
+        for group in data.track_groups if group.tracks
+    }
+    assert hierarchy.rollup({track.id: 1 for track in data.tracks}) == {group.id: len(group.tracks)
+                                                                        for group in data.track_groups if group.tracks}
+
+
+def test_get_abstracts_in_tracks_counts(db, create_synthetic_event):
+    data = create_synthetic_event(abstracts=8, reviewers=1, tracks=3, track_groups=0)
+    data.abstracts[0].reviewed_for_tracks = {data.tracks[2]}
+    data.abstracts[1].is_deleted = True
+    db.session.flush()
+    counts = get_abstracts_in_tracks_counts(data.event)
+    for track in data.tracks:
+        assert counts[track.id] == {
+            'submitted_for': len(track.abstracts_submitted),
+            'moved_to': len(track.abstracts_reviewed - track.abstracts_submitted),
+            'final_proposals': len(track.abstracts_reviewed),
+        }
+    assert counts[data.tracks[2].id]['moved_to'] >= 1
+
+
+def test_statistics_exports(create_synthetic_event):
+    data = create_synthetic_event(abstracts=6, reviewers=2, tracks=2, track_groups=0, questions=2)
+    stats = compute_abstracts_statistics(data.event)
+    headers, rows = generate_statistics_spreadsheet(stats)
+    assert all(set(row) == set(headers) for row in rows)
+    num_reviews = sum(len(a.reviews) for a in data.abstracts)
+    assert sum(row['Count'] for row in rows if row['Metric'] == 'Reviews') == num_reviews
+    serialized = serialize_statistics(stats)
+    assert {q['id'] for q in serialized['questions']} == {q.id for q in data.questions if q.field_type == 'bool'}
+    assert sum(n for user_counts in serialized['reviews'].values() for n in user_counts.values()) == num_reviews
+
+
+def test_affiliation_formatter(db, count_queries, create_synthetic_event):
+    data = create_synthetic_event(abstracts=4, authors=3, affiliations=3, affiliations_per_author=2)
+    db.session.expire_all()
+    person_links = [pl for abstract in data.abstracts for pl in abstract.person_links]
+    with count_queries() as cnt:
+        formatter = AffiliationFormatter(person_links, AbstractAffiliation)
+        countries = [formatter.full_name_and_country(pl) for pl in person_links]
+        addresses = [formatter.full_name_and_address(pl) for pl in person_links * 2]
+    assert cnt() == 1
+    for person_link, country, address in zip(person_links, countries, addresses[:len(person_links)], strict=True):
+        affiliations = [ja.affiliation for ja in person_link.jacow_affiliations]
+        assert country == f'{person_link.full_name} ({"; ".join(a.country_code for a in affiliations)})'
+        assert address.startswith(f'{person_link.full_name} ({affiliations[0].street}, {affiliations[0].postcode}')
+
+
+def test_backfill_affiliations(db, create_synthetic_event):
+    data = create_synthetic_event(abstracts=5, authors=3, affiliations=2, affiliations_per_author=0, contributions=True)
+    for i, person in enumerate(data.persons):
+        person.affiliation_link = data.affiliations[i % 2] if i else None
+    db.session.flush()
+    num_links = {
+        AbstractAffiliation: sum(1 for a in data.abstracts for pl in a.person_links if pl.person.affiliation_link),
+        ContributionAffiliation: sum(1 for c in data.contributions for pl in c.person_links
+                                     if pl.person.affiliation_link),
+    }
+    assert count_affiliation_backfill(data.event) == num_links
+    assert backfill_affiliations(data.event, batch_size=2) == num_links
+    assert count_affiliation_backfill(data.event) == {AbstractAffiliation: 0, ContributionAffiliation: 0}
+    assert backfill_affiliations(data.event) == {AbstractAffiliation: 0, ContributionAffiliation: 0}
+    db.session.expire_all()
+    assert all([ja.affiliation for ja in pl.jacow_affiliations] == [pl.person.affiliation_link]
+               for abstract in data.abstracts for pl in abstract.person_links if pl.person.affiliation_link)
+
+
+def test_create_affiliation(db, dummy_user):
+    data = {'name': 'European  Organization for Nuclear Research', 'city': 'Geneva', 'country_code': 'CH'}
+    affiliation, created = create_affiliation(data, dummy_user)
+    assert created
+    assert affiliation.name == 'European Organization for Nuclear Research'
+    assert affiliation.meta['created_by'] == dummy_user.id
+    assert not affiliation.meta['verified']
+    same_affiliation, created = create_affiliation({**data, 'name': ' european organization for nuclear research',
+                                                    'city': 'GENEVA'}, dummy_user)
+    assert not created
+    assert same_affiliation == affiliation
+    other_affiliation, created = create_affiliation({**data, 'country_code': 'FR'}, dummy_user)
+    assert created
+    assert other_affiliation != affiliation
+
+
+def test_prewarm_statistics(db, create_synthetic_event):
+    data = create_synthetic_event(abstracts=6, reviewers=2, tracks=3, track_groups=1)
+    assert get_prewarmed_statistics(data.event) is None
+    prewarm_statistics(data.event)
+    prewarmed = get_prewarmed_statistics(data.event)
+    assert prewarmed['computed_dt'] is not None
+    stats = compute_abstracts_statistics(data.event)
+    assert stats['computed_dt'] is None
+    for key in ('review_counts', 'positive_answer_counts', 'abstracts_in_tracks'):
+        assert prewarmed[key] == stats[key]
+    assert compute_abstracts_statistics(data.event, use_prewarmed=True)['computed_dt'] == prewarmed['computed_dt']
+    # the cached counts cannot be used anymore once the tracks change
+    Track(event=data.event, title='New track')
+    db.session.flush()
+    assert get_prewarmed_statistics(data.event) is None
+
+
+def test_get_event_affiliations(db, create_synthetic_event):
+    data = create_synthetic_event(abstracts=4, authors=2, affiliations=5, contributions=True)
+    used = {ja.affiliation
+            for item in data.abstracts + data.contributions
+            for person_link in item.person_links
+            for ja in person_link.jacow_affiliations}
+    affiliations = get_event_affiliations(data.event)
+    assert set(affiliations) == used
+    assert affiliations == sorted(affiliations, key=lambda a: a.name.lower())
+    other = create_synthetic_event(abstracts=1, authors=1, affiliations=1)
+    assert not set(get_event_affiliations(other.event)) & used
+
+
+def _get_stored_affiliations(association_cls, person_link):
+    table = association_cls.__table__
+    rows = db.session.execute(db.select([table.c.affiliation_id, table.c.display_order])
+                              .where(table.c.person_link_id == person_link.id)
+                              .order_by(table.c.display_order)).fetchall()
+    assert [order for __, order in rows] == list(range(len(rows)))
+    return [id_ for id_, __ in rows]
+
+
+@pytest.mark.parametrize('contributions', (False, True))
+def test_set_person_link_affiliations(db, create_synthetic_event, contributions):
+    data = create_synthetic_event(abstracts=1, authors=1, affiliations=4, affiliations_per_author=3,
+                                  contributions=contributions)
+    association_cls = ContributionAffiliation if contributions else AbstractAffiliation
+    person_link = (data.contributions if contributions else data.abstracts)[0].person_links[0]
+    a, b, c, d = (aff.id for aff in data.affiliations)
+    assert _get_stored_affiliations(association_cls, person_link) == [a, b, c]
+    # reordering only swaps the positions
+    assert set_person_link_affiliations(person_link, [c, a, b], [a, b, c])
+    assert [ja.affiliation_id for ja in person_link.jacow_affiliations] == [c, a, b]
+    assert _get_stored_affiliations(association_cls, person_link) == [c, a, b]
+    # changes based on an outdated state are rejected
+    assert not set_person_link_affiliations(person_link, [b, a, c], [a, b, c])
+    assert not set_person_link_affiliations(person_link, [d], [a, b, c])
+    assert _get_stored_affiliations(association_cls, person_link) == [c, a, b]
+    assert set_person_link_affiliations(person_link, [d, a], [c, a, b])
+    assert [ja.affiliation_id for ja in person_link.jacow_affiliations] == [d, a]
+    assert _get_stored_affiliations(association_cls, person_link) == [d, a]
+
+
+def test_set_person_link_affiliations_interleaved_editors(db, create_synthetic_event):
+    """Simulate editors working on outdated forms in a single session.
+
+    Changes from other transactions are simulated by updating the rows
+    in between; see `test_set_person_link_affiliations_concurrent_editors`
+    for actually concurrent transactions.
+    """
+    data = create_synthetic_event(abstracts=1, authors=1, affiliations=6, affiliations_per_author=3)
+    person_link = data.abstracts[0].person_links[0]
+    table = AbstractAffiliation.__table__
+    affiliation_ids = [aff.id for aff in data.affiliations]
+    rng = random.Random(42)
+    stored = _get_stored_affiliations(AbstractAffiliation, person_link)
+    # each editor remembers the affiliations they loaded in their form
+    editors = [list(stored) for __ in range(8)]
+    applied = conflicts = 0
+    for __ in range(300):
+        editor = rng.randrange(len(editors))
+        if rng.random() < 0.2:
+            editors[editor] = [ja.affiliation_id for ja in person_link.jacow_affiliations]
+            continue
+        if rng.random() < 0.5:
+            new_ids = rng.sample(editors[editor], len(editors[editor]))
+        else:
+            new_ids = rng.sample(affiliation_ids, rng.randint(1, 4))
+        if new_ids == editors[editor]:
+            continue
+        concurrent = rng.random() < 0.2 and len(stored) > 1
+        if concurrent:
+            # another transaction reorders the rows after they were loaded by this request
+            assert person_link.jacow_affiliations
+            stored = stored[1:] + stored[:1]
+            db.session.execute(table.update()
+                               .where(table.c.person_link_id == person_link.id)
+                               .values(display_order=db.case({id_: i for i, id_ in enumerate(stored)},
+                                                             value=table.c.affiliation_id)))
+        if set_person_link_affiliations(person_link, new_ids, editors[editor]):
+            assert not concurrent and editors[editor] == stored
+            stored = editors[editor] = new_ids
+            applied += 1
+        else:
+            assert concurrent or editors[editor] != stored
+            conflicts += 1
+        assert _get_stored_affiliations(AbstractAffiliation, person_link) == stored
+        db.session.expire(person_link, ['jacow_affiliations'])
+    assert applied and conflicts
+
+
+@pytest.fixture
+def committed_person_link(database):
+    """Create an abstract person link with 4 affiliations and commit it.
+
+    Unlike data created using the `db` fixture, it is visible to other
+    database connections, so it is deleted again afterwards.
+    """
+    user = User(first_name='Concurrent', last_name='Editor', email='concurrent-editor@example.test')
+    affiliations = [Affiliation(name=f'Concurrent Affiliation {i}') for i in range(4)]
+    now = now_utc(exact=False)
+    event = Event(type_=EventType.conference, title='Concurrent editing', start_dt=now, end_dt=now,
+                  timezone='UTC', category=Category.get_root(), creator=user, acl_entries=set())
+    database.session.add_all([user, *affiliations, event])
+    # the friendly ids of abstracts are assigned in a separate transaction
+    database.session.commit()
+    abstract = Abstract(event=event, title='Abstract', submitter=user)
+    person = EventPerson(event=event, first_name='Author', last_name='Person', email='author@example.test')
+    person_link = AbstractPersonLink(abstract=abstract, person=person, author_type=AuthorType.primary)
+    person_link.jacow_affiliations = [AbstractAffiliation(affiliation=affiliation, display_order=i)
+                                      for i, affiliation in enumerate(affiliations[:3])]
+    database.session.commit()
+    try:
+        yield person_link.id, [a.id for a in affiliations]
+    finally:
+        database.session.rollback()
+        for obj in (abstract, person, event, user, *affiliations):
+            database.session.delete(obj)
+        database.session.commit()
+
+
+def test_set_person_link_affiliations_concurrent_editors(app, database, committed_person_link):
+    person_link_id, (a, b, c, d) = committed_person_link
+    barrier = threading.Barrier(2)
+
+    def _edit(new_ids):
+        # each thread has its own session and thus its own transaction
+        with app.app_context():
+            try:
+                person_link = AbstractPersonLink.get(person_link_id)
+                expected_ids = [ja.affiliation_id for ja in person_link.jacow_affiliations]
+                barrier.wait()
+                updated = set_person_link_affiliations(person_link, new_ids, expected_ids)
+                database.session.commit()
+                return updated
+            finally:
+                database.session.remove()
+
+    for changes in ([[b, c, a], [c, a, b]], [[d], [c, a, b]], [[d, a], [b]]) * 5:
+        with ThreadPoolExecutor(len(changes)) as executor:
+            results = list(executor.map(_edit, changes))
+        # exactly one of the editors wins, the other one gets a conflict
+        assert sorted(results) == [False, True]
+        stored = changes[results.index(True)]
+        database.session.expire_all()
+        assert _get_stored_affiliations(AbstractAffiliation, AbstractPersonLink.get(person_link_id)) == stored
+        # the next round starts from the initial state again
+        assert set_person_link_affiliations(AbstractPersonLink.get(person_link_id), [a, b, c])
+        database.session.commit()
+
+
+def test_resolve_affiliation_merges():
+    assert resolve_affiliation_merges([(2, 1), (3, 1), (4, 5)]) == {1: {2, 3}, 5: {4}}
+    assert resolve_affiliation_merges([(2, 1), (1, 3), (2, 1)]) == {3: {1, 2}}
+    with pytest.raises(ValueError):
+        resolve_affiliation_merges([(2, 1), (2, 3)])
+    with pytest.raises(ValueError):
+        resolve_affiliation_merges([(1, 2), (2, 3), (3, 1)])
+
+
+def test_merge_affiliations(db, create_synthetic_event):
+    data = create_synthetic_event(abstracts=4, authors=2, affiliations=5, affiliations_per_author=3,
+                                  contributions=True)
+    target, duplicate, other_duplicate = (data.affiliations[i].id for i in (0, 1, 3))
+    person_links = [(AbstractAffiliation, pl) for abstract in data.abstracts for pl in abstract.person_links]
+    person_links += [(ContributionAffiliation, pl) for contrib in data.contributions for pl in contrib.person_links]
+    expected = {}
+    expected_counts = {AbstractAffiliation: 0, ContributionAffiliation: 0}
+    for association_cls, person_link in person_links:
+        ids = [ja.affiliation_id for ja in person_link.jacow_affiliations]
+        # a person link with both the target and a duplicate keeps only the first one
+        merged_ids = list(dict.fromkeys(target if id_ in (duplicate, other_duplicate) else id_ for id_ in ids))
+        expected[(association_cls, person_link)] = merged_ids
+        expected_counts[association_cls] += merged_ids != ids
+    assert merge_affiliations(target, [duplicate, other_duplicate, target]) == expected_counts
+    for (association_cls, person_link), ids in expected.items():
+        assert _get_stored_affiliations(association_cls, person_link) == ids
+        assert [ja.affiliation_id for ja in person_link.jacow_affiliations] == ids
+    assert merge_affiliations(target, [duplicate]) == {AbstractAffiliation: 0, ContributionAffiliation: 0}
+
+
+def test_iter_csv_users(db, create_user):
+    create_user(1, email='alice@example.test')
+    create_user(2, email='bob@example.test')
+    create_user(3, email='deleted@example.test').is_deleted = True
+    db.session.flush()
+    rows = ['Alice@example.test', '', 'unknown@example.test', ' bob@example.test ', 'deleted@example.test']
+    reader = csv.DictReader(io.StringIO('Name,Email\n' + ''.join(f'x,{email}\n' for email in rows)))
+    chunks = list(iter_csv_users(reader, chunk_size=2))
+    assert chunks == [(2, {1}, set()), (2, {2}, {'unknown@example.test'}), (1, set(), {'deleted@example.test'})]
+
+
+@pytest.mark.parametrize(('emails', 'message'), (
+    (['alice@example.test', 'nope'], 'Row 2: invalid email address: nope'),
+    (['alice@example.test', 'ALICE@example.test'], 'Row 2: email address is not unique'),
+))
+def test_iter_csv_users_invalid(emails, message):
+    reader = csv.DictReader(io.StringIO('Email\n' + ''.join(f'{email}\n' for email in emails)))
+    with pytest.raises(UserValueError, match=message):
+        list(iter_csv_users(reader, chunk_size=1))
+
+
+def test_assign_event_permission(db, dummy_event, create_user):
+    judge, reviewer, newcomer = (create_user(id_) for id_ in (1, 2, 3))
+    dummy_event.update_principal(judge, permissions={'paper_judge'})
+    dummy_event.update_principal(reviewer, permissions={'paper_content_reviewer'})
+    db.session.flush()
+    assert assign_event_permission(dummy_event, {1, 2, 3}, 'paper_judge') == {2, 3}
+    assert assign_event_permission(dummy_event, {1, 2, 3}, 'paper_judge') == set()
+    permissions = {entry.principal: entry.permissions for entry in dummy_event.acl_entries}
+    assert permissions == {judge: ['paper_judge'], reviewer: ['paper_content_reviewer', 'paper_judge'],
+                           newcomer: ['paper_judge']}
@@ -17,3 +17,7 @@ class WPDisplayAbstractsStatistics(WPJinjaMixinPlugin, WPDisplayAbstracts):
 
 class WPAbstractsStats(WPJinjaMixinPlugin, WPEventManagement):
     sidemenu_option = 'abstracts_stats'
+
+
+class WPAffiliationReport(WPJinjaMixinPlugin, WPEventManagement):
+    sidemenu_option = 'affiliation_report'